@@ -3,17 +3,33 @@
 import importlib
 import os
 import sys
-import traceback
+from typing import Any
 
 from nixinstall.lib.args import nixos_config_handler
-from nixinstall.lib.disk.utils import disk_layouts
 
-from .lib.hardware import SysInfo
-from .lib.output import FormattedOutput, debug, error, info, log, warn
-from .tui.curses_menu import Tui
+from .lib.output import FormattedOutput, debug, error, info, log, logger, warn
+
+# imported on first use, --help and --version shouldn't pay for disk probing,
+# the TUI or pydantic
+_lazy_imports = {
+	'SysInfo': 'nixinstall.lib.hardware',
+	'Tui': 'nixinstall.tui.curses_menu',
+	'disk_layouts': 'nixinstall.lib.disk.utils',
+}
+
+
+def __getattr__(name: str) -> Any:
+	if module := _lazy_imports.get(name):
+		return getattr(importlib.import_module(module), name)
+
+	raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def _log_sys_info() -> None:
+	from nixinstall.lib.disk.utils import disk_layouts
+
+	from .lib.hardware import SysInfo
+
 	# Log various information about hardware before starting the installation. This might assist in troubleshooting
 	debug(f'Hardware model detected: {SysInfo.sys_vendor()} {SysInfo.product_name()}; UEFI mode: {SysInfo.has_uefi()}')
 	debug(f'Processor model detected: {SysInfo.cpu_model()}')
@@ -35,6 +51,8 @@ def main() -> int:
 		nixos_config_handler.print_help()
 		return 0
 
+	nixos_config_handler.load()
+
 	if os.getuid() != 0 and '--debug' not in sys.argv:
 		print('nixinstall requires root privileges to run. See --help for more.')
 		return 1
@@ -59,10 +77,13 @@ def run_as_a_module() -> None:
 	except Exception as e:
 		exc = e
 	finally:
-		# restore the terminal to the original state
-		Tui.shutdown()
+		# restore the terminal to the original state, if it was ever touched
+		if tui := sys.modules.get('nixinstall.tui.curses_menu'):
+			tui.Tui.shutdown()
 
 		if exc:
+			import traceback
+
 			err = ''.join(traceback.format_exception(exc))
 			error(err)
 
@@ -75,6 +96,7 @@ def run_as_a_module() -> None:
 			warn(text)
 			rc = 1
 
+		logger.flush()
 		exit(rc)
 
 
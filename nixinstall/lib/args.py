@@ -1,28 +1,28 @@
+from __future__ import annotations
+
 import argparse
 import os
-import urllib.error
-import urllib.parse
 from argparse import ArgumentParser, Namespace
+from collections.abc import Sequence
 from dataclasses import dataclass, field
-from importlib.metadata import version
 from pathlib import Path
-from typing import Any
-from urllib.request import Request, urlopen
-
-from pydantic.dataclasses import dataclass as p_dataclass
-
-from nixinstall.lib.models.application import ApplicationConfiguration
-from nixinstall.lib.models.authentication import AuthenticationConfiguration
-from nixinstall.lib.models.bootloader import Bootloader
-from nixinstall.lib.models.device_model import DiskLayoutConfiguration
-from nixinstall.lib.models.locale import LocaleConfiguration
-from nixinstall.lib.models.network_configuration import NetworkConfiguration
-from nixinstall.lib.models.profile_model import ProfileConfiguration
-from nixinstall.lib.models.users import Password, User
+from typing import TYPE_CHECKING, Any, override
+
 from nixinstall.lib.output import error, logger, warn
 
+# the models pull in pydantic and parted, which --help and --version never need
+if TYPE_CHECKING:
+	from nixinstall.lib.models.application import ApplicationConfiguration
+	from nixinstall.lib.models.authentication import AuthenticationConfiguration
+	from nixinstall.lib.models.bootloader import Bootloader
+	from nixinstall.lib.models.device_model import DiskLayoutConfiguration
+	from nixinstall.lib.models.locale import LocaleConfiguration
+	from nixinstall.lib.models.network_configuration import NetworkConfiguration
+	from nixinstall.lib.models.profile_model import ProfileConfiguration
+	from nixinstall.lib.models.users import Password, User
+
 
-@p_dataclass
+@dataclass
 class Arguments:
 	config: Path | None = None
 	config_url: str | None = None
@@ -41,6 +41,12 @@ class Arguments:
 	verbose: bool = False
 
 
+def _default_bootloader() -> Bootloader:
+	from nixinstall.lib.models.bootloader import Bootloader
+
+	return Bootloader.get_default()
+
+
 @dataclass
 class NixOSConfig:
 	version: str | None = None
@@ -49,7 +55,7 @@ class NixOSConfig:
 	disk_config: DiskLayoutConfiguration | None = None
 	profile_config: ProfileConfiguration | None = None
 	network_config: NetworkConfiguration | None = None
-	bootloader: Bootloader = field(default=Bootloader.get_default())
+	bootloader: Bootloader = field(default_factory=_default_bootloader)
 	uki: bool = False
 	app_config: ApplicationConfiguration | None = None
 	auth_config: AuthenticationConfiguration | None = None
@@ -68,18 +74,58 @@ class NixOSConfig:
 	root_enc_password: Password | None = None
 
 
+def _get_version() -> str:
+	from importlib.metadata import version
+
+	try:
+		return version('nixinstall')
+	except Exception:
+		return 'nixinstall version not found'
+
+
+class _VersionAction(argparse.Action):
+	"""
+	Like argparse's version action, but only looks the version up when it's asked for
+	"""
+
+	def __init__(self, option_strings: Sequence[str], dest: str = argparse.SUPPRESS, default: Any = argparse.SUPPRESS, help: str | None = None) -> None:
+		super().__init__(option_strings=option_strings, dest=dest, default=default, nargs=0, help=help)
+
+	@override
+	def __call__(self, parser: ArgumentParser, namespace: Namespace, values: Any, option_string: str | None = None) -> None:
+		parser.exit(message=f'{parser.prog} {_get_version()}\n')
+
+
 class NixOSConfigHandler:
+	"""
+	The command line is parsed and the configuration created on first use,
+	so importing this module stays cheap
+	"""
+
 	def __init__(self) -> None:
 		self._parser: ArgumentParser = self._define_arguments()
-		self._args: Arguments = self._parse_args()
-		self._config = NixOSConfig()
+		self._args: Arguments | None = None
+		self._config: NixOSConfig | None = None
 
 	@property
 	def config(self) -> NixOSConfig:
+		if self._config is None:
+			self._config = NixOSConfig()
+
 		return self._config
 
 	@property
 	def args(self) -> Arguments:
+		return self.load()
+
+	def load(self) -> Arguments:
+		"""
+		Parses the command line unless that happened already,
+		exits right away on --version or invalid arguments
+		"""
+		if self._args is None:
+			self._args = self._parse_args()
+
 		return self._args
 
 	def get_script(self) -> str:
@@ -89,20 +135,13 @@ class NixOSConfigHandler:
 	def print_help(self) -> None:
 		self._parser.print_help()
 
-	def _get_version(self) -> str:
-		try:
-			return version('nixinstall')
-		except Exception:
-			return 'nixinstall version not found'
-
 	def _define_arguments(self) -> ArgumentParser:
 		parser = ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 		parser.add_argument(
 			'-v',
 			'--version',
-			action='version',
-			default=False,
-			version='%(prog)s ' + self._get_version(),
+			action=_VersionAction,
+			help="show program's version number and exit",
 		)
 		parser.add_argument(
 			'--config',
@@ -217,6 +256,10 @@ class NixOSConfigHandler:
 		return args
 
 	def _fetch_from_url(self, url: str) -> str:
+		import urllib.error
+		import urllib.parse
+		from urllib.request import Request, urlopen
+
 		if urllib.parse.urlparse(url).scheme:
 			try:
 				req = Request(url, headers={'User-Agent': 'nixinstall'})
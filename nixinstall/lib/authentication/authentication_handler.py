@@ -105,7 +105,7 @@ class AuthenticationHandler:
 
 			while worker.is_alive():
 				if pin_inputted is False:
-					if bytes('enter pin for', 'UTF-8') in worker._trace_log.lower():
+					if worker._trace_log.find(b'enter pin for', ignore_case=True) >= 0:
 						worker.write(bytes(getpass.getpass(''), 'UTF-8'))
 						pin_inputted = True
 
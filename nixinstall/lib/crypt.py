@@ -1,22 +1,32 @@
+from __future__ import annotations
+
 import base64
 import ctypes
 import os
+from functools import cache
 from pathlib import Path
-
-from cryptography.fernet import Fernet, InvalidToken
-from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+from typing import TYPE_CHECKING
 
 from .output import debug
 
-libcrypt = ctypes.CDLL('libcrypt.so')
+if TYPE_CHECKING:
+	from cryptography.fernet import Fernet
 
-libcrypt.crypt.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
-libcrypt.crypt.restype = ctypes.c_char_p
+LOGIN_DEFS = Path('/etc/login.defs')
 
-libcrypt.crypt_gensalt.argtypes = [ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p, ctypes.c_int]
-libcrypt.crypt_gensalt.restype = ctypes.c_char_p
 
-LOGIN_DEFS = Path('/etc/login.defs')
+@cache
+def _libcrypt() -> ctypes.CDLL:
+	# loaded on first use rather than whenever the user models get imported
+	libcrypt = ctypes.CDLL('libcrypt.so')
+
+	libcrypt.crypt.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+	libcrypt.crypt.restype = ctypes.c_char_p
+
+	libcrypt.crypt_gensalt.argtypes = [ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p, ctypes.c_int]
+	libcrypt.crypt_gensalt.restype = ctypes.c_char_p
+
+	return libcrypt
 
 
 def _search_login_defs(key: str) -> str | None:
@@ -38,7 +48,7 @@ def crypt_gen_salt(prefix: str | bytes, rounds: int) -> bytes:
 	if isinstance(prefix, str):
 		prefix = prefix.encode('utf-8')
 
-	setting = libcrypt.crypt_gensalt(prefix, rounds, None, 0)
+	setting = _libcrypt().crypt_gensalt(prefix, rounds, None, 0)
 
 	if setting is None:
 		raise ValueError(f'crypt_gensalt() returned NULL for prefix {prefix!r} and rounds {rounds}')
@@ -68,7 +78,7 @@ def crypt_yescrypt(plaintext: str) -> str:
 	enc_plaintext = plaintext.encode('utf-8')
 	salt = crypt_gen_salt('$y$', rounds)
 
-	crypt_hash = libcrypt.crypt(enc_plaintext, salt)
+	crypt_hash = _libcrypt().crypt(enc_plaintext, salt)
 
 	if crypt_hash is None:
 		raise ValueError('crypt() returned NULL')
@@ -77,6 +87,9 @@ def crypt_yescrypt(plaintext: str) -> str:
 
 
 def _get_fernet(salt: bytes, password: str) -> Fernet:
+	from cryptography.fernet import Fernet
+	from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+
 	# https://cryptography.io/en/latest/hazmat/primitives/key-derivation-functions/#argon2id
 	kdf = Argon2id(
 		salt=salt,
@@ -109,6 +122,8 @@ def encrypt(password: str, data: str) -> str:
 
 
 def decrypt(data: str, password: str) -> str:
+	from cryptography.fernet import InvalidToken
+
 	_, algo, encoded_salt, encoded_token = data.split('$')
 	salt = base64.urlsafe_b64decode(encoded_salt)
 	token = base64.urlsafe_b64decode(encoded_token)
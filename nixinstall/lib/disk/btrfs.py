@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import struct
+from pathlib import Path
+
+# see linux/btrfs.h and linux/btrfs_tree.h
+BTRFS_IOCTL_MAGIC = 0x94
+BTRFS_ROOT_TREE_OBJECTID = 1
+BTRFS_FS_TREE_OBJECTID = 5
+BTRFS_FIRST_FREE_OBJECTID = 256
+BTRFS_LAST_FREE_OBJECTID = 2**64 - 256
+BTRFS_ROOT_BACKREF_KEY = 144
+
+_U64_MAX = 2**64 - 1
+
+# struct btrfs_ioctl_search_key, followed by the u64 buf_size of btrfs_ioctl_search_args_v2
+_SEARCH_KEY = struct.Struct('=7Q4I4Q')
+_SEARCH_ARGS_V2 = struct.Struct(f'={_SEARCH_KEY.format[1:]}Q')
+# struct btrfs_ioctl_search_header
+_SEARCH_HEADER = struct.Struct('=3Q2I')
+# struct btrfs_root_ref, followed by the name
+_ROOT_REF = struct.Struct('<2QH')
+# struct btrfs_ioctl_ino_lookup_args
+_INO_LOOKUP_ARGS = struct.Struct('=2Q4080s')
+
+_SEARCH_BUFFER_SIZE = 64 * 1024
+
+
+def _iowr(nr: int, size: int) -> int:
+	return (3 << 30) | (size << 16) | (BTRFS_IOCTL_MAGIC << 8) | nr
+
+
+BTRFS_IOC_TREE_SEARCH_V2 = _iowr(17, _SEARCH_ARGS_V2.size)
+BTRFS_IOC_INO_LOOKUP = _iowr(18, _INO_LOOKUP_ARGS.size)
+
+
+def _ino_lookup(fd: int, tree_id: int, objectid: int) -> str:
+	"""
+	Path of the directory ``objectid`` inside the subvolume ``tree_id``
+	"""
+	args = bytearray(_INO_LOOKUP_ARGS.pack(tree_id, objectid, b''))
+	fcntl.ioctl(fd, BTRFS_IOC_INO_LOOKUP, args)
+	_, _, name = _INO_LOOKUP_ARGS.unpack(args)
+	return name.split(b'\0', 1)[0].decode()
+
+
+def _root_backrefs(fd: int) -> list[tuple[int, int, int, str]]:
+	"""
+	(subvolume id, parent subvolume id, directory id in the parent, name)
+	of every subvolume, read from the root tree
+	"""
+	refs: list[tuple[int, int, int, str]] = []
+	min_objectid = BTRFS_FIRST_FREE_OBJECTID
+	min_offset = 0
+
+	while True:
+		args = bytearray(_SEARCH_ARGS_V2.size + _SEARCH_BUFFER_SIZE)
+		_SEARCH_ARGS_V2.pack_into(
+			args,
+			0,
+			BTRFS_ROOT_TREE_OBJECTID,
+			min_objectid,
+			BTRFS_LAST_FREE_OBJECTID,
+			min_offset,
+			_U64_MAX,
+			0,
+			_U64_MAX,
+			BTRFS_ROOT_BACKREF_KEY,
+			BTRFS_ROOT_BACKREF_KEY,
+			# nr_items, as many as fit into the buffer
+			0xFFFFFFFF,
+			0,
+			0,
+			0,
+			0,
+			0,
+			_SEARCH_BUFFER_SIZE,
+		)
+
+		fcntl.ioctl(fd, BTRFS_IOC_TREE_SEARCH_V2, args)
+
+		nr_items = _SEARCH_KEY.unpack_from(args)[9]
+
+		if nr_items == 0:
+			return refs
+
+		pos = _SEARCH_ARGS_V2.size
+		objectid = offset = 0
+
+		for _ in range(nr_items):
+			_, objectid, offset, item_type, length = _SEARCH_HEADER.unpack_from(args, pos)
+			pos += _SEARCH_HEADER.size
+
+			if item_type == BTRFS_ROOT_BACKREF_KEY:
+				dirid, _, name_len = _ROOT_REF.unpack_from(args, pos)
+				name = bytes(args[pos + _ROOT_REF.size : pos + _ROOT_REF.size + name_len]).decode()
+				refs.append((objectid, offset, dirid, name))
+
+			pos += length
+
+		# continue right after the last key that was returned
+		if offset < _U64_MAX:
+			min_objectid, min_offset = objectid, offset + 1
+		elif objectid < BTRFS_LAST_FREE_OBJECTID:
+			min_objectid, min_offset = objectid + 1, 0
+		else:
+			return refs
+
+
+def list_subvolumes(mountpoint: Path) -> list[Path]:
+	"""
+	Paths of all subvolumes relative to the top level of the btrfs filesystem
+	mounted at ``mountpoint``, like ``btrfs subvolume list`` reports them.
+	Uses BTRFS_IOC_TREE_SEARCH_V2, which requires CAP_SYS_ADMIN.
+	"""
+	fd = os.open(mountpoint, os.O_RDONLY | os.O_DIRECTORY)
+
+	try:
+		refs = _root_backrefs(fd)
+		parents = {subvol_id: (parent_id, dirid, name) for subvol_id, parent_id, dirid, name in refs}
+		paths: dict[int, Path] = {BTRFS_FS_TREE_OBJECTID: Path()}
+
+		def resolve(subvol_id: int) -> Path:
+			if (path := paths.get(subvol_id)) is not None:
+				return path
+
+			# parent is not reachable from the top level, e.g. while it's being deleted
+			if subvol_id not in parents:
+				return Path()
+
+			parent_id, dirid, name = parents[subvol_id]
+
+			# subvolumes created in a sub directory of their parent
+			directory = _ino_lookup(fd, parent_id, dirid) if dirid != BTRFS_FIRST_FREE_OBJECTID else ''
+
+			path = resolve(parent_id) / directory / name
+			paths[subvol_id] = path
+			return path
+
+		return [resolve(subvol_id) for subvol_id, *_ in refs]
+	finally:
+		os.close(fd)
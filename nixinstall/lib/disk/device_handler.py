@@ -2,17 +2,19 @@ from __future__ import annotations
 
 import json
 import logging
-import os
+import threading
 import time
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from typing import Literal, overload
 
 from parted import Device, Disk, DiskException, FileSystem, Geometry, IOException, Partition, PartitionException, freshDisk, getAllDevices, getDevice, newDisk
 
 from ..exceptions import DiskError, SysCallError, UnknownFilesystemFormat
-from ..general import SysCommand, SysCommandWorker
-from ..luks import Luks2
+from ..general import SysCommand, SysCommandWorker, probe_cache
+from ..luks import Luks2, max_parallel_unlocks
 from ..models.device_model import (
 	DEFAULT_ITER_TIME,
 	BDevice,
@@ -21,6 +23,8 @@ from ..models.device_model import (
 	DiskEncryption,
 	FilesystemType,
 	LsblkInfo,
+	LuksParameters,
+	LuksPerformance,
 	LvmGroupInfo,
 	LvmPVInfo,
 	LvmVolume,
@@ -42,24 +46,40 @@ from ..models.device_model import (
 from ..models.users import Password
 from ..output import debug, error, info, log
 from ..utils.util import is_subpath
+from .btrfs import list_subvolumes
+from .udev import udev_timestamp, wait_for_devices
 from .utils import (
 	find_lsblk_info,
 	get_all_lsblk_info,
 	get_lsblk_info,
 	umount,
+	umount_all,
 )
 
 
 class DeviceHandler:
 	_TMP_BTRFS_MOUNT = Path('/mnt/arch_btrfs')
+	_ARCHISO_MOUNTPOINT = Path('/run/archiso/airootfs')
+
+	_BY_ID = Path('/dev/disk/by-id')
+
+	# how long LVM may take to report a freshly created group or volume
+	_LVM_TIMEOUT = 10.0
 
 	def __init__(self) -> None:
 		self._devices: dict[Path, BDevice] = {}
+		self._partitions_by_path: dict[Path, _PartitionInfo] = {}
+		self._partitions_by_partuuid: dict[str, _PartitionInfo] = {}
+		self._by_id_links: dict[Path, Path] = {}
 		self._partition_table = PartitionTable.default()
-		self.load_devices()
+		self._tmp_btrfs_mount_lock = threading.Lock()
+		self._parted_lock = threading.Lock()
+		self._load_lock = threading.RLock()
+		self._loaded = False
 
 	@property
 	def devices(self) -> list[BDevice]:
+		self._ensure_loaded()
 		return list(self._devices.values())
 
 	@property
@@ -67,71 +87,128 @@ class DeviceHandler:
 		return self._partition_table
 
 	def load_devices(self) -> None:
-		block_devices = {}
-
 		self.udev_sync()
 		all_lsblk_info = get_all_lsblk_info()
-		devices = getAllDevices()
-		devices.extend(self.get_loop_devices())
 
-		archiso_mountpoint = Path('/run/archiso/airootfs')
+		# loop devices are opened inside the pool as well
+		devices: list[Device | Path] = [*getAllDevices(), *self._get_loop_device_paths()]
+		durations: list[float] = []
 
-		for device in devices:
-			dev_lsblk_info = find_lsblk_info(device.path, all_lsblk_info)
+		def load(device: Device | Path) -> BDevice | None:
+			start = time.monotonic()
 
-			if not dev_lsblk_info:
-				debug(f'Device lsblk info not found: {device.path}')
-				continue
+			try:
+				if isinstance(device, Path):
+					try:
+						device = getDevice(str(device))
+					except IOException as err:
+						debug(f'Failed to get loop device: {err}')
+						return None
 
-			if dev_lsblk_info.type == 'rom':
-				continue
+				return self._load_device(device, all_lsblk_info)
+			finally:
+				durations.append(time.monotonic() - start)
 
-			# exclude archiso loop device
-			if dev_lsblk_info.mountpoint == archiso_mountpoint:
-				continue
+		start = time.monotonic()
 
-			try:
-				if dev_lsblk_info.pttype:
-					disk = newDisk(device)
-				else:
-					disk = freshDisk(device, self.partition_table.value)
-			except DiskException as err:
-				debug(f'Unable to get disk from {device.path}: {err}')
-				continue
+		with ThreadPoolExecutor(thread_name_prefix='load_devices') as executor:
+			# map() hands back the results in the order of the devices
+			loaded = list(executor.map(load, devices))
 
-			device_info = _DeviceInfo.from_disk(disk)
-			partition_infos = []
+		elapsed = time.monotonic() - start
 
-			for partition in disk.partitions:
-				lsblk_info = find_lsblk_info(partition.path, dev_lsblk_info.children)
+		if elapsed > 0:
+			debug(f'Probed {len(devices)} devices in {elapsed:.2f}s, {sum(durations):.2f}s sequentially ({sum(durations) / elapsed:.1f}x speedup)')
 
-				if not lsblk_info:
-					debug(f'Partition lsblk info not found: {partition.path}')
-					continue
+		self._devices = {block_device.device_info.path: block_device for block_device in loaded if block_device is not None}
+		self._build_indexes()
+		self._loaded = True
+
+	def _ensure_loaded(self) -> None:
+		# devices are probed on first use rather than when this module is imported
+		with self._load_lock:
+			if not self._loaded:
+				self.load_devices()
+
+	def _build_indexes(self) -> None:
+		partitions = [partition for device in self._devices.values() for partition in device.partition_infos]
+
+		self._partitions_by_path = {partition.path: partition for partition in partitions}
+		self._partitions_by_partuuid = {partition.partuuid: partition for partition in partitions if partition.partuuid}
+		self._by_id_links = self._read_by_id_links()
 
-				fs_type = self._determine_fs_type(partition, lsblk_info)
-				subvol_infos = []
+	@classmethod
+	def _read_by_id_links(cls) -> dict[Path, Path]:
+		"""
+		Maps each device to one of its /dev/disk/by-id links,
+		preferring the WWN and EUI based ones
+		"""
+		links: dict[Path, Path] = {}
+		preferred: dict[Path, Path] = {}
 
-				if fs_type == FilesystemType.Btrfs:
-					subvol_infos = self.get_btrfs_info(partition.path, lsblk_info)
+		for link in sorted(cls._BY_ID.glob('*')):
+			target = link.resolve()
+			links[target] = link
 
-				partition_infos.append(
-					_PartitionInfo.from_partition(
-						partition,
-						lsblk_info,
-						fs_type,
-						subvol_infos,
-					),
-				)
+			if link.name.startswith(('wwn-', 'nvme-eui.')):
+				preferred[target] = link
 
-			block_device = BDevice(disk, device_info, partition_infos)
-			block_devices[block_device.device_info.path] = block_device
+		return links | preferred
 
-		self._devices = block_devices
+	def _load_device(self, device: Device, all_lsblk_info: list[LsblkInfo]) -> BDevice | None:
+		dev_lsblk_info = find_lsblk_info(device.path, all_lsblk_info)
+
+		if not dev_lsblk_info:
+			debug(f'Device lsblk info not found: {device.path}')
+			return None
+
+		if dev_lsblk_info.type == 'rom':
+			return None
+
+		# exclude archiso loop device
+		if dev_lsblk_info.mountpoint == self._ARCHISO_MOUNTPOINT:
+			return None
+
+		try:
+			if dev_lsblk_info.pttype:
+				disk = newDisk(device)
+			else:
+				disk = freshDisk(device, self.partition_table.value)
+		except DiskException as err:
+			debug(f'Unable to get disk from {device.path}: {err}')
+			return None
+
+		device_info = _DeviceInfo.from_disk(disk)
+		partition_infos = []
+
+		for partition in disk.partitions:
+			lsblk_info = find_lsblk_info(partition.path, dev_lsblk_info.children)
+
+			if not lsblk_info:
+				debug(f'Partition lsblk info not found: {partition.path}')
+				continue
+
+			fs_type = self._determine_fs_type(partition, lsblk_info)
+			subvol_loader = None
+
+			if fs_type == FilesystemType.Btrfs:
+				# only read once someone looks at the subvolumes
+				subvol_loader = partial(self.get_btrfs_info, Path(partition.path))
+
+			partition_infos.append(
+				_PartitionInfo.from_partition(
+					partition,
+					lsblk_info,
+					fs_type,
+					subvol_loader,
+				),
+			)
+
+		return BDevice(disk, device_info, partition_infos)
 
 	@staticmethod
-	def get_loop_devices() -> list[Device]:
-		devices = []
+	def _get_loop_device_paths() -> list[Path]:
+		paths = []
 
 		try:
 			loop_devices = SysCommand(['losetup', '-a'])
@@ -144,12 +221,21 @@ class DeviceHandler:
 				except ValueError:
 					continue
 
-				try:
-					loop_device = getDevice(loop_device_path)
-				except IOException as err:
-					debug(f'Failed to get loop device: {err}')
-				else:
-					devices.append(loop_device)
+				paths.append(Path(loop_device_path))
+
+		return paths
+
+	@staticmethod
+	def get_loop_devices() -> list[Device]:
+		devices = []
+
+		for loop_device_path in DeviceHandler._get_loop_device_paths():
+			try:
+				loop_device = getDevice(str(loop_device_path))
+			except IOException as err:
+				debug(f'Failed to get loop device: {err}')
+			else:
+				devices.append(loop_device)
 
 		return devices
 
@@ -172,6 +258,7 @@ class DeviceHandler:
 		return None
 
 	def get_device(self, path: Path) -> BDevice | None:
+		self._ensure_loaded()
 		return self._devices.get(path, None)
 
 	def get_device_by_partition_path(self, partition_path: Path) -> BDevice | None:
@@ -182,28 +269,26 @@ class DeviceHandler:
 		return None
 
 	def find_partition(self, path: Path) -> _PartitionInfo | None:
-		for device in self._devices.values():
-			part = next(filter(lambda x: str(x.path) == str(path), device.partition_infos), None)
-			if part is not None:
-				return part
-		return None
+		self._ensure_loaded()
+		return self._partitions_by_path.get(Path(path), None)
+
+	def find_partition_by_partuuid(self, partuuid: str) -> _PartitionInfo | None:
+		self._ensure_loaded()
+		return self._partitions_by_partuuid.get(partuuid, None)
 
 	def get_parent_device_path(self, dev_path: Path) -> Path:
 		lsblk = get_lsblk_info(dev_path)
 		return Path(f'/dev/{lsblk.pkname}')
 
 	def get_unique_path_for_device(self, dev_path: Path) -> Path | None:
-		paths = Path('/dev/disk/by-id').glob('*')
-		linked_targets = {p.resolve(): p for p in paths}
-		linked_wwn_targets = {p: linked_targets[p] for p in linked_targets if p.name.startswith('wwn-') or p.name.startswith('nvme-eui.')}
+		self._ensure_loaded()
 
-		if dev_path in linked_wwn_targets:
-			return linked_wwn_targets[dev_path]
+		if (link := self._by_id_links.get(dev_path)) is None:
+			# the device may have shown up after the devices were loaded
+			self._by_id_links = self._read_by_id_links()
+			link = self._by_id_links.get(dev_path)
 
-		if dev_path in linked_targets:
-			return linked_targets[dev_path]
-
-		return None
+		return link
 
 	def get_uuid_for_path(self, path: Path) -> str | None:
 		partition = self.find_partition(path)
@@ -217,28 +302,36 @@ class DeviceHandler:
 		if not lsblk_info:
 			lsblk_info = get_lsblk_info(dev_path)
 
-		subvol_infos: list[_BtrfsSubvolumeInfo] = []
+		if lsblk_info.mountpoints:
+			# the root tree can be searched from any mounted subvolume,
+			# no need to work out where the top level is mounted
+			return self._list_btrfs_subvolumes(lsblk_info.mountpoints[0], lsblk_info)
 
-		if not lsblk_info.mountpoint:
+		# not mounted anywhere, the subvolumes can only be read through a temporary
+		# mount; devices are probed in parallel but share the temporary mountpoint
+		with self._tmp_btrfs_mount_lock:
 			self.mount(dev_path, self._TMP_BTRFS_MOUNT, create_target_mountpoint=True)
-			mountpoint = self._TMP_BTRFS_MOUNT
-		else:
-			# when multiple subvolumes are mounted then the lsblk output may look like
-			# "mountpoint": "/mnt/nixinstall/var/log"
-			# "mountpoints": ["/mnt/nixinstall/var/log", "/mnt/nixinstall/home", ..]
-			# so we'll determine the minimum common path and assume that's the root
-			try:
-				common_path = os.path.commonpath(lsblk_info.mountpoints)
-			except ValueError:
-				return subvol_infos
 
-			mountpoint = Path(common_path)
+			try:
+				return self._list_btrfs_subvolumes(self._TMP_BTRFS_MOUNT, lsblk_info)
+			finally:
+				umount(dev_path)
 
+	def _list_btrfs_subvolumes(self, mountpoint: Path, lsblk_info: LsblkInfo) -> list[_BtrfsSubvolumeInfo]:
 		try:
-			result = SysCommand(f'btrfs subvolume list {mountpoint}').decode()
-		except SysCallError as err:
-			debug(f'Failed to read btrfs subvolume information: {err}')
-			return subvol_infos
+			names = list_subvolumes(mountpoint)
+		except OSError as err:
+			debug(f'Unable to search the btrfs root tree at {mountpoint}, falling back to btrfs subvolume list: {err}')
+
+			try:
+				result = SysCommand(f'btrfs subvolume list {mountpoint}', use_pty=False).decode()
+			except SysCallError as err:
+				debug(f'Failed to read btrfs subvolume information: {err}')
+				return []
+
+			# expected output format:
+			# ID 257 gen 8 top level 5 path @home
+			names = [Path(line.split(' ')[-1]) for line in result.splitlines()]
 
 		# It is assumed that lsblk will contain the fields as
 		# "mountpoints": ["/mnt/nixinstall/log", "/mnt/nixinstall/home", "/mnt/nixinstall", ...]
@@ -247,18 +340,7 @@ class DeviceHandler:
 		# to the corresponding mountpoints
 		btrfs_subvol_info = dict(zip(lsblk_info.fsroots, lsblk_info.mountpoints))
 
-		# ID 256 gen 16 top level 5 path @
-		for line in result.splitlines():
-			# expected output format:
-			# ID 257 gen 8 top level 5 path @home
-			name = Path(line.split(' ')[-1])
-			sub_vol_mountpoint = btrfs_subvol_info.get('/' / name, None)
-			subvol_infos.append(_BtrfsSubvolumeInfo(name, sub_vol_mountpoint))
-
-		if not lsblk_info.mountpoint:
-			umount(dev_path)
-
-		return subvol_infos
+		return [_BtrfsSubvolumeInfo(name, btrfs_subvol_info.get('/' / name, None)) for name in names]
 
 	def format(
 		self,
@@ -310,16 +392,20 @@ class DeviceHandler:
 		enc_password: Password | None,
 		lock_after_create: bool = True,
 		iter_time: int = DEFAULT_ITER_TIME,
+		luks_parameters: LuksParameters | None = None,
+		luks_performance: LuksPerformance = LuksPerformance.Off,
 	) -> Luks2:
 		luks_handler = Luks2(
 			dev_path,
 			mapper_name=mapper_name,
 			password=enc_password,
+			performance=luks_performance,
 		)
 
-		key_file = luks_handler.encrypt(iter_time=iter_time)
+		since = udev_timestamp()
+		key_file = luks_handler.encrypt(iter_time=iter_time, parameters=luks_parameters)
 
-		self.udev_sync()
+		self.udev_wait([dev_path], ['ID_FS_UUID'], since)
 
 		luks_handler.unlock(key_file=key_file)
 
@@ -346,11 +432,13 @@ class DeviceHandler:
 			dev_path,
 			mapper_name=mapper_name,
 			password=enc_conf.encryption_password,
+			performance=enc_conf.luks_performance,
 		)
 
-		key_file = luks_handler.encrypt(iter_time=enc_conf.iter_time)
+		since = udev_timestamp()
+		key_file = luks_handler.encrypt(iter_time=enc_conf.iter_time, parameters=enc_conf.luks_parameters)
 
-		self.udev_sync()
+		self.udev_wait([dev_path], ['ID_FS_UUID'], since)
 
 		luks_handler.unlock(key_file=key_file)
 
@@ -363,12 +451,9 @@ class DeviceHandler:
 		info(f'luks2 locking device: {dev_path}')
 		luks_handler.lock()
 
-	def _lvm_info(
-		self,
-		cmd: str,
-		info_type: Literal['lv', 'vg', 'pvseg'],
-	) -> LvmVolumeInfo | LvmGroupInfo | LvmPVInfo | None:
-		raw_info = SysCommand(cmd).decode().split('\n')
+	@staticmethod
+	def _lvm_report(cmd: str) -> list[dict[str, list[dict[str, str]]]]:
+		raw_info = SysCommand(cmd, use_pty=False).decode().split('\n')
 
 		# for whatever reason the output sometimes contains
 		# "File descriptor X leaked leaked on vgs invocation
@@ -376,9 +461,22 @@ class DeviceHandler:
 
 		debug(f'LVM info: {data}')
 
-		reports = json.loads(data)
+		return json.loads(data)['report']
+
+	@staticmethod
+	def _lv_info(entry: dict[str, str]) -> LvmVolumeInfo:
+		return LvmVolumeInfo(
+			lv_name=entry['lv_name'],
+			vg_name=entry['vg_name'],
+			lv_size=Size(int(entry['lv_size'][:-1]), Unit.B, SectorSize.default()),
+		)
 
-		for report in reports['report']:
+	def _lvm_info(
+		self,
+		cmd: str,
+		info_type: Literal['lv', 'vg', 'pvseg'],
+	) -> LvmVolumeInfo | LvmGroupInfo | LvmPVInfo | None:
+		for report in self._lvm_report(cmd):
 			if len(report[info_type]) != 1:
 				raise ValueError('Report does not contain any entry')
 
@@ -392,11 +490,7 @@ class DeviceHandler:
 						vg_name=entry['vg_name'],
 					)
 				case 'lv':
-					return LvmVolumeInfo(
-						lv_name=entry['lv_name'],
-						vg_name=entry['vg_name'],
-						lv_size=Size(int(entry['lv_size'][:-1]), Unit.B, SectorSize.default()),
-					)
+					return self._lv_info(entry)
 				case 'vg':
 					return LvmGroupInfo(
 						vg_uuid=entry['vg_uuid'],
@@ -419,17 +513,50 @@ class DeviceHandler:
 		cmd: str,
 		info_type: Literal['lv', 'vg', 'pvseg'],
 	) -> LvmVolumeInfo | LvmGroupInfo | LvmPVInfo | None:
+		# the LVM commands are synchronous, so a missing entry is rare and short lived
+		deadline = time.monotonic() + self._LVM_TIMEOUT
+		delay = 0.1
+
 		while True:
 			try:
 				return self._lvm_info(cmd, info_type)
-			except ValueError:
-				time.sleep(3)
+			except ValueError as err:
+				if time.monotonic() + delay > deadline:
+					raise DiskError(f'LVM did not report the {info_type} within {self._LVM_TIMEOUT}s: {cmd}') from err
+
+				time.sleep(delay)
+				delay = min(delay * 2, 1.0)
 
 	def lvm_vol_info(self, lv_name: str) -> LvmVolumeInfo | None:
 		cmd = f'lvs --reportformat json --unit B -S lv_name={lv_name}'
 
 		return self._lvm_info_with_retry(cmd, 'lv')
 
+	def lvm_vol_infos(self, vg_name: str) -> dict[str, LvmVolumeInfo]:
+		"""
+		All volumes of a group from a single lvs report, by name
+		"""
+		cmd = f'lvs --reportformat json --unit B -S vg_name={vg_name}'
+
+		return {entry['lv_name']: self._lv_info(entry) for report in self._lvm_report(cmd) for entry in report['lv']}
+
+	def lvm_wait_for_vols(self, vg_name: str, volumes: list[LvmVolume]) -> None:
+		"""
+		Blocks until udev created the device nodes of the volumes and
+		LVM reports all of them, raises a DiskError otherwise
+		"""
+		dev_paths = [Path(f'/dev/{vg_name}/{vol.name}') for vol in volumes]
+
+		self.udev_wait(dev_paths)
+
+		if missing := [str(path) for path in dev_paths if not path.exists()]:
+			raise DiskError(f'LVM volumes did not show up: {", ".join(missing)}')
+
+		reported = self.lvm_vol_infos(vg_name)
+
+		if missing := [vol.name for vol in volumes if vol.name not in reported]:
+			raise DiskError(f'LVM does not report the volumes {", ".join(missing)} in {vg_name}')
+
 	def lvm_group_info(self, vg_name: str) -> LvmGroupInfo | None:
 		cmd = f'vgs --reportformat json --unit B -o vg_name,vg_uuid,vg_size -S vg_name={vg_name}'
 
@@ -479,10 +606,7 @@ class DeviceHandler:
 		cmd = f'vgcreate --yes {vg_name} {pvs_str}'
 
 		debug(f'Creating LVM group: {cmd}')
-
-		worker = SysCommandWorker(cmd)
-		worker.poll()
-		worker.write(b'y\n', line_ending=False)
+		SysCommand(cmd)
 
 	def lvm_vol_create(self, vg_name: str, volume: LvmVolume, offset: Size | None = None) -> None:
 		if offset is not None:
@@ -494,10 +618,7 @@ class DeviceHandler:
 		cmd = f'lvcreate --yes -L {length_str}B {vg_name} -n {volume.name}'
 
 		debug(f'Creating volume: {cmd}')
-
-		worker = SysCommandWorker(cmd)
-		worker.poll()
-		worker.write(b'y\n', line_ending=False)
+		SysCommand(cmd)
 
 		volume.vg_name = vg_name
 		volume.dev_path = Path(f'/dev/{vg_name}/{volume.name}')
@@ -646,21 +767,23 @@ class DeviceHandler:
 			luks_handler = None
 			dev_path = part_mod.safe_dev_path
 
-		self.mount(
-			dev_path,
-			self._TMP_BTRFS_MOUNT,
-			create_target_mountpoint=True,
-			options=part_mod.mount_options,
-		)
+		# devices are set up in parallel but share the temporary mountpoint
+		with self._tmp_btrfs_mount_lock:
+			self.mount(
+				dev_path,
+				self._TMP_BTRFS_MOUNT,
+				create_target_mountpoint=True,
+				options=part_mod.mount_options,
+			)
 
-		for sub_vol in sorted(part_mod.btrfs_subvols, key=lambda x: x.name):
-			debug(f'Creating subvolume: {sub_vol.name}')
+			for sub_vol in sorted(part_mod.btrfs_subvols, key=lambda x: x.name):
+				debug(f'Creating subvolume: {sub_vol.name}')
 
-			subvol_path = self._TMP_BTRFS_MOUNT / sub_vol.name
+				subvol_path = self._TMP_BTRFS_MOUNT / sub_vol.name
 
-			SysCommand(f'btrfs subvolume create -p {subvol_path}')
+				SysCommand(f'btrfs subvolume create -p {subvol_path}')
 
-		umount(dev_path)
+			umount(dev_path)
 
 		if luks_handler is not None and luks_handler.mapper_dev is not None:
 			luks_handler.lock()
@@ -678,10 +801,29 @@ class DeviceHandler:
 
 		return luks_handler
 
+	def unlock_luks2_devs(self, luks_handlers: list[Luks2]) -> None:
+		"""
+		Unlocks several devices at once, as many in parallel as the
+		memory needed for their key derivation allows
+		"""
+		locked = [handler for handler in luks_handlers if not handler.is_unlocked()]
+
+		if not locked:
+			return
+
+		workers = max_parallel_unlocks(locked)
+		debug(f'Unlocking {len(locked)} luks2 devices, {workers} at a time')
+
+		with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='luks_unlock') as executor:
+			# consuming the results raises the first error
+			list(executor.map(lambda handler: handler.unlock(), locked))
+
 	def umount_all_existing(self, device_path: Path) -> None:
 		debug(f'Unmounting all existing partitions: {device_path}')
 
+		self._ensure_loaded()
 		existing_partitions = self._devices[device_path].partition_infos
+		plain_partitions = []
 
 		for partition in existing_partitions:
 			debug(f'Unmounting: {partition.path}')
@@ -690,7 +832,9 @@ class DeviceHandler:
 			if partition.fs_type == FilesystemType.Crypto_luks:
 				Luks2(partition.path).lock()
 			else:
-				umount(partition.path, recursive=True)
+				plain_partitions.append(partition.path)
+
+		umount_all(plain_partitions, recursive=True)
 
 	def partition(
 		self,
@@ -702,29 +846,35 @@ class DeviceHandler:
 		"""
 		partition_table = partition_table or self.partition_table
 
-		# WARNING: the entire device will be wiped and all data lost
-		if modification.wipe:
-			if partition_table.is_mbr() and len(modification.partitions) > 3:
-				raise DiskError('Too many partitions on disk, MBR disks can only have 3 primary partitions')
+		# partition tables are written one device at a time, even when
+		# the devices are otherwise set up in parallel
+		with self._parted_lock:
+			# WARNING: the entire device will be wiped and all data lost
+			if modification.wipe:
+				if partition_table.is_mbr() and len(modification.partitions) > 3:
+					raise DiskError('Too many partitions on disk, MBR disks can only have 3 primary partitions')
 
-			self.wipe_dev(modification.device)
-			disk = freshDisk(modification.device.disk.device, partition_table.value)
-		else:
-			info(f'Use existing device: {modification.device_path}')
-			disk = modification.device.disk
+				self.wipe_dev(modification.device)
+				disk = freshDisk(modification.device.disk.device, partition_table.value)
+			else:
+				info(f'Use existing device: {modification.device_path}')
+				disk = modification.device.disk
 
-		info(f'Creating partitions: {modification.device_path}')
+			info(f'Creating partitions: {modification.device_path}')
 
-		# don't touch existing partitions
-		filtered_part = [p for p in modification.partitions if not p.exists()]
+			# don't touch existing partitions
+			filtered_part = [p for p in modification.partitions if not p.exists()]
 
-		for part_mod in filtered_part:
-			# if the entire disk got nuked then we don't have to delete
-			# any existing partitions anymore because they're all gone already
-			requires_delete = modification.wipe is False
-			self._setup_partition(part_mod, modification.device, disk, requires_delete=requires_delete)
+			for part_mod in filtered_part:
+				# if the entire disk got nuked then we don't have to delete
+				# any existing partitions anymore because they're all gone already
+				requires_delete = modification.wipe is False
+				self._setup_partition(part_mod, modification.device, disk, requires_delete=requires_delete)
 
-		disk.commit()
+			disk.commit()
+
+			# parted writes the table in-process, so cached probes don't know about it
+			probe_cache.invalidate()
 
 	@staticmethod
 	def swapon(path: Path) -> None:
@@ -820,6 +970,8 @@ class DeviceHandler:
 		with open(dev_path, 'wb') as p:
 			p.write(bytearray(1024))
 
+		probe_cache.invalidate()
+
 	def wipe_dev(self, block_device: BDevice) -> None:
 		"""
 		Wipe the block device of meta-data, be it file system, LVM, etc.
@@ -844,5 +996,21 @@ class DeviceHandler:
 		except SysCallError as err:
 			debug(f'Failed to synchronize with udev: {err}')
 
+	@staticmethod
+	def udev_wait(
+		dev_paths: list[Path],
+		properties: Iterable[str] = (),
+		since: int | None = None,
+	) -> None:
+		"""
+		Waits for udev to process only the given devices rather than every pending event,
+		see ``wait_for_devices``. Falls back to a global settle.
+		"""
+		if not wait_for_devices(dev_paths, properties, since):
+			DeviceHandler.udev_sync()
+
+		# udev changed the device state without us running a command
+		probe_cache.invalidate()
+
 
 device_handler = DeviceHandler()
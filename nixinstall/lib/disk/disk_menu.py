@@ -264,6 +264,9 @@ class DiskLayoutConfigurationMenu(AbstractSubMenu[DiskLayoutConfiguration]):
 			if enc_type != EncryptionType.NoEncryption:
 				output += 'Iteration time' + f': {enc_config.iter_time or DEFAULT_ITER_TIME}ms\n'
 
+				if enc_config.luks_parameters:
+					output += 'Cipher' + f': {enc_config.luks_parameters.preview()}\n'
+
 			if enc_config.partitions:
 				output += f'Partitions: {len(enc_config.partitions)} selected\n'
 			elif enc_config.lvm_volumes:
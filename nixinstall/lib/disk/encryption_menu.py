@@ -13,10 +13,11 @@ from nixinstall.lib.models.device_model import (
 from nixinstall.tui.curses_menu import EditMenu, SelectMenu
 from nixinstall.tui.menu_item import MenuItem, MenuItemGroup
 from nixinstall.tui.result import ResultType
-from nixinstall.tui.types import Alignment, FrameProperties
+from nixinstall.tui.types import Alignment, FrameProperties, Orientation
 
+from ..luks import calibrate_luks_parameters
 from ..menu.abstract_menu import AbstractSubMenu
-from ..models.device_model import DEFAULT_ITER_TIME, Fido2Device
+from ..models.device_model import DEFAULT_ITER_TIME, Fido2Device, LuksParameters, LuksPerformance
 from ..models.users import Password
 from ..output import FormattedOutput
 from ..utils.util import get_password
@@ -72,6 +73,22 @@ class DiskEncryptionMenu(AbstractSubMenu[DiskEncryption]):
 				preview_action=self._preview,
 				key='iter_time',
 			),
+			MenuItem(
+				text='Hardware calibration',
+				action=select_luks_parameters,
+				value=self._enc_config.luks_parameters,
+				dependencies=[self._check_dep_enc_type],
+				preview_action=self._preview,
+				key='luks_parameters',
+			),
+			MenuItem(
+				text='Performance flags',
+				action=select_luks_performance,
+				value=self._enc_config.luks_performance,
+				dependencies=[self._check_dep_enc_type],
+				preview_action=self._preview,
+				key='luks_performance',
+			),
 			MenuItem(
 				text='Partitions',
 				action=lambda x: select_partitions_to_encrypt(self._device_modifications, x),
@@ -149,6 +166,8 @@ class DiskEncryptionMenu(AbstractSubMenu[DiskEncryption]):
 				lvm_volumes=enc_lvm_vols,
 				hsm_device=self._enc_config.hsm_device,
 				iter_time=iter_time or DEFAULT_ITER_TIME,
+				luks_parameters=self._item_group.find_by_key('luks_parameters').value,
+				luks_performance=self._item_group.find_by_key('luks_performance').value or LuksPerformance.Off,
 			)
 
 		return None
@@ -230,8 +249,18 @@ class DiskEncryptionMenu(AbstractSubMenu[DiskEncryption]):
 		iter_time = self._item_group.find_by_key('iter_time').value
 		enc_type = self._item_group.find_by_key('encryption_type').value
 
+		luks_parameters: LuksParameters | None = self._item_group.find_by_key('luks_parameters').value
+
 		if iter_time and enc_type != EncryptionType.NoEncryption:
-			return f'{"Iteration time"}: {iter_time}ms'
+			output = f'{"Iteration time"}: {iter_time}ms'
+
+			if luks_parameters:
+				output += f'\n{"Calibrated parameters"}: {luks_parameters.preview()}'
+
+			if luks_performance := self._item_group.find_by_key('luks_performance').value:
+				output += f'\n{"Performance flags"}: {luks_performance.value}'
+
+			return output
 
 		return None
 
@@ -285,6 +314,30 @@ def select_encrypted_password() -> Password | None:
 	return password
 
 
+def select_luks_performance(preset: LuksPerformance | None = None) -> LuksPerformance | None:
+	header = 'Pass discards through and skip the dm-crypt work queues?' + '\n'
+	header += 'Auto enables them on solid state storage, the work queues are only skipped on NVMe' + '\n'
+	header += 'Off by default, discards reveal which blocks of the encrypted device are unused' + '\n'
+
+	group = MenuItemGroup.from_enum(LuksPerformance, preset=preset)
+
+	result = SelectMenu[LuksPerformance](
+		group,
+		header=header,
+		alignment=Alignment.CENTER,
+		allow_skip=True,
+		allow_reset=True,
+	).run()
+
+	match result.type_:
+		case ResultType.Reset:
+			return None
+		case ResultType.Skip:
+			return preset
+		case ResultType.Selection:
+			return result.get_value()
+
+
 def select_hsm(preset: Fido2Device | None = None) -> Fido2Device | None:
 	header = 'Select a FIDO2 device to use for HSM' + '\n'
 
@@ -414,3 +467,31 @@ def select_iteration_time(preset: int | None = None) -> int | None:
 			return int(result.text())
 		case ResultType.Reset:
 			return None
+
+
+def select_luks_parameters(preset: LuksParameters | None = None) -> LuksParameters | None:
+	header = 'Benchmark this machine to choose the cipher and key derivation cost?' + '\n'
+	header += 'Otherwise the cryptsetup defaults are used' + '\n'
+
+	group = MenuItemGroup.yes_no()
+	group.focus_item = MenuItem.yes() if preset else MenuItem.no()
+
+	result = SelectMenu[bool](
+		group,
+		header=header,
+		alignment=Alignment.CENTER,
+		columns=2,
+		orientation=Orientation.HORIZONTAL,
+		allow_skip=True,
+		allow_reset=True,
+	).run()
+
+	match result.type_:
+		case ResultType.Skip:
+			return preset
+		case ResultType.Reset:
+			return None
+		case ResultType.Selection:
+			if result.item() == MenuItem.yes():
+				return calibrate_luks_parameters()
+			return None
@@ -7,7 +7,7 @@ from typing import ClassVar
 from nixinstall.lib.models.device_model import Fido2Device
 
 from ..exceptions import SysCallError
-from ..general import SysCommand, SysCommandWorker, clear_vt100_escape_codes_from_str
+from ..general import SysCommand, SysCommandWorker
 from ..models.users import Password
 from ..output import error, info
 
@@ -29,14 +29,12 @@ class Fido2:
 		if not cls._loaded_u2f:
 			cls._loaded_u2f = True
 			try:
-				ret = SysCommand('fido2-token -L').decode()
+				ret = SysCommand('fido2-token -L', use_pty=False).decode()
 			except SysCallError as e:
 				error(f'failed to read fido2 devices: {e}')
 				return []
 
-			fido_devices = clear_vt100_escape_codes_from_str(ret)
-
-			for line in fido_devices.split('\r\n'):
+			for line in ret.splitlines():
 				res = line.replace(',', '').split(':', maxsplit=1)
 				if len(res) < 2:
 					continue
@@ -71,18 +69,16 @@ class Fido2:
 		# down moving the cursor in the menu
 		if not cls._loaded_cryptsetup or reload:
 			try:
-				ret = SysCommand('systemd-cryptenroll --fido2-device=list').decode()
+				ret = SysCommand('systemd-cryptenroll --fido2-device=list', use_pty=False).decode()
 			except SysCallError:
 				error('fido2 support is most likely not installed')
 				raise ValueError('HSM devices can not be detected, is libfido2 installed?')
 
-			fido_devices = clear_vt100_escape_codes_from_str(ret)
-
 			manufacturer_pos = 0
 			product_pos = 0
 			devices = []
 
-			for line in fido_devices.split('\r\n'):
+			for line in ret.splitlines():
 				if '/dev' not in line:
 					manufacturer_pos = line.find('MANUFACTURER')
 					product_pos = line.find('PRODUCT')
@@ -114,11 +110,11 @@ class Fido2:
 
 		while worker.is_alive():
 			if pw_inputted is False:
-				if bytes(f'please enter current passphrase for disk {dev_path}', 'UTF-8') in worker._trace_log.lower():
+				if worker._trace_log.find(bytes(f'please enter current passphrase for disk {dev_path}', 'UTF-8'), ignore_case=True) >= 0:
 					worker.write(bytes(password.plaintext, 'UTF-8'))
 					pw_inputted = True
 			elif pin_inputted is False:
-				if bytes('please enter security token pin', 'UTF-8') in worker._trace_log.lower():
+				if worker._trace_log.find(b'please enter security token pin', ignore_case=True) >= 0:
 					worker.write(bytes(getpass.getpass(' '), 'UTF-8'))
 					pin_inputted = True
 
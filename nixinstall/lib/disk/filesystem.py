@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import math
 import time
+from functools import partial
 from pathlib import Path
 
 from nixinstall.tui.curses_menu import Tui
@@ -9,6 +10,7 @@ from nixinstall.tui.curses_menu import Tui
 from ..interactions.general_conf import ask_abort
 from ..luks import Luks2
 from ..models.device_model import (
+	DeviceModification,
 	DiskEncryption,
 	DiskLayoutConfiguration,
 	DiskLayoutType,
@@ -17,13 +19,16 @@ from ..models.device_model import (
 	LvmConfiguration,
 	LvmVolume,
 	LvmVolumeGroup,
+	ModificationStatus,
 	PartitionModification,
 	SectorSize,
 	Size,
 	Unit,
 )
-from ..output import debug, info
+from ..output import debug, info, logger, phase
 from .device_handler import device_handler
+from .scheduler import DiskTaskScheduler
+from .udev import udev_timestamp
 
 
 class FilesystemHandler:
@@ -50,45 +55,66 @@ class FilesystemHandler:
 		# Setup the blockdevice, filesystem (and optionally encryption).
 		# Once that's done, we'll hand over to perform_installation()
 
-		# make sure all devices are unmounted
-		for mod in device_mods:
-			device_handler.umount_all_existing(mod.device_path)
+		with phase('filesystem_operations', devices=device_paths):
+			# make sure all devices are unmounted
+			for mod in device_mods:
+				device_handler.umount_all_existing(mod.device_path)
+
+			self._schedule(device_mods).run()
+
+		logger.flush()
+
+	def _schedule(self, device_mods: list[DeviceModification]) -> DiskTaskScheduler:
+		"""
+		Every device gets its own chain of partitioning, formatting and creating
+		subvolumes, the chains of different devices run in parallel. LVM needs
+		the PVs of all devices, so it only starts once they're all partitioned.
+		"""
+		scheduler = DiskTaskScheduler()
+		lvm_deps: list[str] = []
 
 		for mod in device_mods:
-			device_handler.partition(mod)
+			if self._disk_config.lvm_config:
+				boot_part = mod.get_boot_partition()
+				format_parts = [boot_part] if boot_part and boot_part.is_create_or_modify() else []
+			else:
+				format_parts = [p for p in mod.partitions if p.is_create_or_modify()]
+
+			# fail before anything got written to the disk
+			self._validate_partitions(format_parts)
+
+			last = scheduler.add(f'partition {mod.device_path}', partial(self._partition, mod))
+
+			for part_mod in format_parts:
+				name = f'{mod.device_path} partition {mod.partitions.index(part_mod) + 1}'
+				last = scheduler.add(f'format {name}', partial(self._format_partition, part_mod), [last])
+
+			if not self._disk_config.lvm_config:
+				for part_mod in format_parts:
+					if part_mod.fs_type == FilesystemType.Btrfs:
+						name = f'{mod.device_path} partition {mod.partitions.index(part_mod) + 1}'
+						last = scheduler.add(f'subvolumes {name}', partial(device_handler.create_btrfs_volumes, part_mod, enc_conf=self._enc_config), [last])
 
-		device_handler.udev_sync()
+			lvm_deps.append(last)
 
 		if self._disk_config.lvm_config:
-			for mod in device_mods:
-				if boot_part := mod.get_boot_partition():
-					debug(f'Formatting boot partition: {boot_part.dev_path}')
-					self._format_partitions([boot_part])
+			scheduler.add('lvm', self.perform_lvm_operations, lvm_deps)
 
-			self.perform_lvm_operations()
-		else:
-			for mod in device_mods:
-				self._format_partitions(mod.partitions)
+		return scheduler
 
-				for part_mod in mod.partitions:
-					if part_mod.fs_type == FilesystemType.Btrfs and part_mod.is_create_or_modify():
-						device_handler.create_btrfs_volumes(part_mod, enc_conf=self._enc_config)
+	def _partition(self, mod: DeviceModification) -> None:
+		since = udev_timestamp()
 
-	def _format_partitions(
-		self,
-		partitions: list[PartitionModification],
-	) -> None:
-		"""
-		Format can be given an overriding path, for instance /dev/null to test
-		the formatting functionality and in essence the support for the given filesystem.
-		"""
+		with phase('partition', device=mod.device_path, partitions=len(mod.partitions)):
+			device_handler.partition(mod)
 
-		# don't touch existing partitions
-		create_or_modify_parts = [p for p in partitions if p.is_create_or_modify()]
+		new_partitions = [p.safe_dev_path for p in mod.partitions if p.status == ModificationStatus.Create]
+		device_handler.udev_wait(new_partitions, ['ID_PART_ENTRY_UUID'], since)
 
-		self._validate_partitions(create_or_modify_parts)
+	def _format_partition(self, part_mod: PartitionModification) -> None:
+		with phase('format_partition', device=part_mod.dev_path, fs_type=part_mod.safe_fs_type.value, size=part_mod.length.format_highest()):
+			since = udev_timestamp()
 
-		for part_mod in create_or_modify_parts:
 			# partition will be encrypted
 			if self._enc_config is not None and part_mod in self._enc_config.partitions:
 				device_handler.format_encrypted(
@@ -100,8 +126,8 @@ class FilesystemHandler:
 			else:
 				device_handler.format(part_mod.safe_fs_type, part_mod.safe_dev_path)
 
-			# synchronize with udev before using lsblk
-			device_handler.udev_sync()
+			# wait for udev to pick up the new filesystem before reading its identifiers
+			device_handler.udev_wait([part_mod.safe_dev_path], ['ID_FS_UUID', 'ID_PART_ENTRY_UUID'], since)
 
 			lsblk_info = device_handler.fetch_part_info(part_mod.safe_dev_path)
 
@@ -130,14 +156,15 @@ class FilesystemHandler:
 		if not self._disk_config.lvm_config:
 			return
 
-		if self._enc_config:
-			self._setup_lvm_encrypted(
-				self._disk_config.lvm_config,
-				self._enc_config,
-			)
-		else:
-			self._setup_lvm(self._disk_config.lvm_config)
-			self._format_lvm_vols(self._disk_config.lvm_config)
+		with phase('lvm_operations', vol_groups=len(self._disk_config.lvm_config.vol_groups)):
+			if self._enc_config:
+				self._setup_lvm_encrypted(
+					self._disk_config.lvm_config,
+					self._enc_config,
+				)
+			else:
+				self._setup_lvm(self._disk_config.lvm_config)
+				self._format_lvm_vols(self._disk_config.lvm_config)
 
 	def _setup_lvm_encrypted(self, lvm_config: LvmConfiguration, enc_config: DiskEncryption) -> None:
 		if enc_config.encryption_type == EncryptionType.LvmOnLuks:
@@ -213,14 +240,7 @@ class FilesystemHandler:
 				debug(f'vg: {vg.name}, vol: {lv.name}, offset: {offset}')
 				device_handler.lvm_vol_create(vg.name, lv, offset)
 
-				while True:
-					debug('Fetching LVM volume info')
-					lv_info = device_handler.lvm_vol_info(lv.name)
-					if lv_info is not None:
-						break
-
-					time.sleep(1)
-
+			device_handler.lvm_wait_for_vols(vg.name, vg.volumes)
 			self._lvm_vol_handle_e2scrub(vg)
 
 	def _format_lvm_vols(
@@ -287,6 +307,8 @@ class FilesystemHandler:
 					enc_config.encryption_password,
 					lock_after_create,
 					iter_time=enc_config.iter_time,
+					luks_parameters=enc_config.luks_parameters,
+					luks_performance=enc_config.luks_performance,
 				)
 
 				enc_vols[vol] = luks_handler
@@ -318,6 +340,8 @@ class FilesystemHandler:
 						enc_config.encryption_password,
 						lock_after_create=lock_after_create,
 						iter_time=enc_config.iter_time,
+						luks_parameters=enc_config.luks_parameters,
+						luks_performance=enc_config.luks_performance,
 					)
 
 					enc_mods[part_mod] = luks_handler
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import ctypes
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from ..exceptions import DiskError
+from ..output import debug
+
+MOUNTINFO = Path('/proc/self/mountinfo')
+
+# flags of umount2(2)
+MNT_FORCE = 1
+MNT_DETACH = 2
+UMOUNT_NOFOLLOW = 8
+
+libc = ctypes.CDLL(None, use_errno=True)
+
+libc.umount2.argtypes = [ctypes.c_char_p, ctypes.c_int]
+libc.umount2.restype = ctypes.c_int
+
+_OCTAL_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+
+def unescape(field: str) -> str:
+	# mountinfo escapes space, tab, newline and backslash as octal
+	return _OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+
+def umount2(target: Path, flags: int = 0) -> None:
+	if libc.umount2(os.fsencode(target), flags) != 0:
+		errno = ctypes.get_errno()
+		raise OSError(errno, os.strerror(errno), str(target))
+
+
+@dataclass(frozen=True)
+class MountEntry:
+	mount_id: int
+	parent_id: int
+	devnum: str
+	root: Path
+	mountpoint: Path
+	fstype: str
+	source: str
+
+	@property
+	def depth(self) -> int:
+		return len(self.mountpoint.parts)
+
+
+class MountTable:
+	"""
+	One read of /proc/self/mountinfo, used to work out
+	everything that has to be unmounted and in which order
+	"""
+
+	def __init__(self, entries: list[MountEntry]) -> None:
+		self.entries = entries
+
+	@classmethod
+	def read(cls, path: Path = MOUNTINFO) -> MountTable:
+		entries = []
+
+		for line in path.read_text().splitlines():
+			fields, _, fs_fields = line.partition(' - ')
+			mount_id, parent_id, devnum, root, mountpoint = fields.split(' ')[:5]
+			fstype, source = fs_fields.split(' ')[:2]
+
+			entries.append(
+				MountEntry(
+					mount_id=int(mount_id),
+					parent_id=int(parent_id),
+					devnum=devnum,
+					root=Path(unescape(root)),
+					mountpoint=Path(unescape(mountpoint)),
+					fstype=fstype,
+					source=unescape(source),
+				)
+			)
+
+		return cls(entries)
+
+	def for_device(self, dev_path: Path) -> list[MountEntry]:
+		"""
+		Mounts of a block device. The mount source is compared as well as the
+		device number, since btrfs reports an anonymous device number.
+		"""
+		try:
+			rdev = os.stat(dev_path).st_rdev
+		except OSError:
+			return []
+
+		devnum = f'{os.major(rdev)}:{os.minor(rdev)}'
+		resolved = dev_path.resolve()
+
+		return [e for e in self.entries if e.devnum == devnum or (e.source.startswith('/') and Path(e.source).resolve() == resolved)]
+
+	def at(self, mountpoint: Path) -> list[MountEntry]:
+		return [e for e in self.entries if e.mountpoint == mountpoint]
+
+	def lookup(self, path: Path) -> list[MountEntry]:
+		"""
+		Mounts of ``path``, which is either a block device or a mountpoint
+		"""
+		if path.is_block_device():
+			return self.for_device(path)
+
+		return self.at(path)
+
+	def with_submounts(self, mounts: list[MountEntry]) -> list[MountEntry]:
+		found = {e.mount_id: e for e in mounts}
+		children: dict[int, list[MountEntry]] = {}
+
+		for entry in self.entries:
+			children.setdefault(entry.parent_id, []).append(entry)
+
+		pending = list(found)
+
+		while pending:
+			for child in children.get(pending.pop(), []):
+				if child.mount_id not in found:
+					found[child.mount_id] = child
+					pending.append(child.mount_id)
+
+		return list(found.values())
+
+	@staticmethod
+	def unmount_order(mounts: list[MountEntry]) -> list[MountEntry]:
+		"""
+		Deepest mountpoints first, and of mounts stacked on the same
+		mountpoint the most recent one first
+		"""
+		return sorted(set(mounts), key=lambda e: (e.depth, e.mount_id), reverse=True)
+
+	def unmount(self, mounts: list[MountEntry], lazy: bool = False) -> None:
+		"""
+		Unmounts everything in ``mounts`` with umount2(2). Whatever fails is
+		retried once after the rest is gone, as a lazy detach if ``lazy`` is set.
+		"""
+		failed: list[MountEntry] = []
+
+		for entry in self.unmount_order(mounts):
+			debug(f'Unmounting mountpoint: {entry.mountpoint}')
+
+			try:
+				umount2(entry.mountpoint, UMOUNT_NOFOLLOW)
+			except OSError as err:
+				debug(f'Unable to unmount {entry.mountpoint}, retrying: {err}')
+				failed.append(entry)
+
+		for entry in failed:
+			try:
+				umount2(entry.mountpoint, UMOUNT_NOFOLLOW | (MNT_DETACH if lazy else 0))
+			except OSError as err:
+				raise DiskError(f'Could not unmount {entry.mountpoint}: {err}')
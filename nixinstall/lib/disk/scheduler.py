@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from .. import output
+from ..output import EventLog, FormattedOutput, debug
+
+
+@dataclass
+class DiskTask:
+	name: str
+	run: Callable[[], None]
+	after: list[str] = field(default_factory=list)
+	thread: str | None = None
+	start: float | None = None
+	end: float | None = None
+
+
+@dataclass
+class _TimelineEntry:
+	task: str
+	thread: str
+	start: str
+	end: str
+
+
+class DiskTaskScheduler:
+	"""
+	Runs disk operations as a dependency graph. A task starts as soon as every task
+	it was added ``after`` is done, so independent chains such as the partitions of
+	different devices get formatted in parallel.
+
+	Dependencies have to be added before the tasks that depend on them, which
+	keeps the graph free of cycles. Once a task fails no new tasks are started,
+	the ones already running are waited for and the first error is raised.
+
+	Tasks run in worker threads, so their commands start through posix_spawn()
+	on pipes instead of forking the whole process for a pty.
+	"""
+
+	def __init__(self, max_workers: int | None = None) -> None:
+		self._tasks: dict[str, DiskTask] = {}
+		self._max_workers = max_workers
+
+	def add(self, name: str, run: Callable[[], None], after: Iterable[str] = ()) -> str:
+		if name in self._tasks:
+			raise ValueError(f'Disk task already scheduled: {name}')
+
+		after = list(after)
+
+		if unknown := [dep for dep in after if dep not in self._tasks]:
+			raise ValueError(f'Disk task "{name}" depends on unscheduled tasks: {unknown}')
+
+		self._tasks[name] = DiskTask(name, run, after)
+		return name
+
+	@staticmethod
+	def _run_task(task: DiskTask, events: EventLog, spans: tuple[int, ...]) -> None:
+		task.thread = threading.current_thread().name
+		task.start = time.monotonic()
+
+		try:
+			# phases of the task belong to the span the scheduler was run in
+			with events.inherit(spans):
+				task.run()
+		finally:
+			task.end = time.monotonic()
+
+	def run(self) -> None:
+		pending = dict(self._tasks)
+		done: set[str] = set()
+		running: dict[Future[None], DiskTask] = {}
+		error: BaseException | None = None
+		start = time.monotonic()
+		events = output.event_log
+		spans = events.current()
+
+		with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='disk') as executor:
+			while pending or running:
+				if error is None:
+					for task in [t for t in pending.values() if all(dep in done for dep in t.after)]:
+						del pending[task.name]
+						running[executor.submit(self._run_task, task, events, spans)] = task
+
+				if not running:
+					break
+
+				finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+				for future in finished:
+					task = running.pop(future)
+
+					if (exc := future.exception()) is not None:
+						debug(f'Disk task "{task.name}" failed: {exc}')
+						error = error or exc
+					else:
+						done.add(task.name)
+
+		debug(f'Disk operations timeline:\n{self.timeline(start)}')
+
+		if pending:
+			debug(f'Disk tasks not started: {list(pending)}')
+
+		if error is not None:
+			raise error
+
+	def timeline(self, start: float) -> str:
+		entries = [
+			_TimelineEntry(
+				task=task.name,
+				thread=task.thread or '',
+				start=f'{task.start - start:.2f}s',
+				end=f'{task.end - start:.2f}s',
+			)
+			for task in sorted(self._tasks.values(), key=lambda t: t.start or 0)
+			if task.start is not None and task.end is not None
+		]
+
+		return FormattedOutput.as_table(entries, capitalize=True)
@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+
+from ..models.device_model import LsblkInfo, SectorSize, Size, Unit
+from .mountinfo import MountTable, unescape
+from .udev import UDEV_DATA
+
+SYS_CLASS_BLOCK = Path('/sys/class/block')
+PROC_SWAPS = Path('/proc/swaps')
+
+# lsblk leaves out RAM disks and unused loop devices unless asked for them
+_RAM_DISK_MAJOR = 1
+_SCSI_CDROM_MAJOR = 11
+
+
+class DeviceClass(Enum):
+	Nvme = 'nvme'
+	Ssd = 'ssd'
+	Hdd = 'hdd'
+
+
+@dataclass(frozen=True)
+class StorageInfo:
+	device_class: DeviceClass
+	discard: bool
+
+
+def sysfs_available() -> bool:
+	return SYS_CLASS_BLOCK.is_dir() and UDEV_DATA.is_dir()
+
+
+def _read(path: Path) -> str | None:
+	try:
+		return path.read_text().strip()
+	except OSError:
+		return None
+
+
+class SysfsProber:
+	"""
+	Builds the same ``LsblkInfo`` trees lsblk reports, read straight from
+	/sys/class/block, the udev database and /proc/self/mountinfo.
+	"""
+
+	def __init__(self) -> None:
+		self._knames = sorted(os.listdir(SYS_CLASS_BLOCK))
+		self._sysdirs = {kname: (SYS_CLASS_BLOCK / kname).resolve() for kname in self._knames}
+		self._devnums = {devnum: kname for kname in self._knames if (devnum := _read(self._sysdirs[kname] / 'dev'))}
+		# lsblk lists devices by MAJ:MIN, not by name
+		self._sort_keys = {kname: tuple(int(n) for n in devnum.split(':')) for devnum, kname in self._devnums.items()}
+		self._partitions_of: dict[str, list[str]] = {}
+
+		for kname in self._knames:
+			if (self._sysdirs[kname] / 'partition').exists():
+				self._partitions_of.setdefault(self._sysdirs[kname].parent.name, []).append(kname)
+
+		self._mounts = self._read_mounts()
+		self._udev: dict[str, dict[str, str]] = {}
+
+	def _kname_of(self, source: str) -> str | None:
+		if source.startswith('/dev/'):
+			kname = Path(source).resolve().name
+			if kname in self._sysdirs:
+				return kname
+
+		return None
+
+	def _read_mounts(self) -> dict[str, list[tuple[Path, Path | None]]]:
+		mounts: dict[str, list[tuple[Path, Path | None]]] = {}
+
+		for entry in MountTable.read().entries:
+			# btrfs reports an anonymous device number, the mount source names the real one
+			if kname := self._kname_of(entry.source) or self._devnums.get(entry.devnum):
+				mounts.setdefault(kname, []).append((entry.mountpoint, entry.root))
+
+		if (swaps := _read(PROC_SWAPS)) is not None:
+			for line in swaps.splitlines()[1:]:
+				if kname := self._kname_of(unescape(line.split()[0])):
+					mounts.setdefault(kname, []).append((Path('[SWAP]'), None))
+
+		return mounts
+
+	def _udev_properties(self, kname: str) -> dict[str, str]:
+		if (properties := self._udev.get(kname)) is not None:
+			return properties
+
+		properties = {}
+
+		if (devnum := _read(self._sysdirs[kname] / 'dev')) and (data := _read(UDEV_DATA / f'b{devnum}')):
+			for line in data.splitlines():
+				if line.startswith('E:'):
+					key, _, value = line[2:].partition('=')
+					properties[key] = value
+
+		self._udev[kname] = properties
+		return properties
+
+	def _is_partition(self, kname: str) -> bool:
+		return (self._sysdirs[kname] / 'partition').exists()
+
+	def _queue(self, kname: str) -> Path:
+		# partitions share the request queue of their disk
+		sysdir = self._sysdirs[kname]
+		return sysdir.parent / 'queue' if self._is_partition(kname) else sysdir / 'queue'
+
+	def _sorted(self, knames: list[str]) -> list[str]:
+		return sorted(knames, key=lambda kname: self._sort_keys.get(kname, ()))
+
+	def _links(self, kname: str, name: str) -> list[str]:
+		try:
+			links = os.listdir(self._sysdirs[kname] / name)
+		except OSError:
+			return []
+
+		# devices that showed up after the snapshot was taken are left out
+		return self._sorted([link for link in links if link in self._sysdirs])
+
+	def _partitions(self, kname: str) -> list[str]:
+		return self._sorted(self._partitions_of.get(kname, []))
+
+	def _parents(self, kname: str) -> list[str]:
+		if self._is_partition(kname):
+			return [self._sysdirs[kname].parent.name]
+
+		return self._links(kname, 'slaves')
+
+	def _children(self, kname: str) -> list[str]:
+		return self._partitions(kname) + self._links(kname, 'holders')
+
+	def _type(self, kname: str) -> str:
+		sysdir = self._sysdirs[kname]
+
+		if self._is_partition(kname):
+			return 'part'
+		if kname.startswith('loop'):
+			return 'loop'
+		if kname.startswith('dm-'):
+			dm_uuid = _read(sysdir / 'dm' / 'uuid') or ''
+			for prefix, dm_type in (('CRYPT-', 'crypt'), ('LVM-', 'lvm'), ('mpath-', 'mpath'), ('part', 'part')):
+				if dm_uuid.startswith(prefix):
+					return dm_type
+			return 'dm'
+		if kname.startswith('md'):
+			return _read(sysdir / 'md' / 'level') or 'md'
+		if (_read(sysdir / 'dev') or '').startswith(f'{_SCSI_CDROM_MAJOR}:'):
+			return 'rom'
+
+		return 'disk'
+
+	def _scsi_host(self, device: Path) -> str | None:
+		return next((part for part in device.parts if part.startswith('host') and part[4:].isdigit()), None)
+
+	def _transport(self, kname: str) -> str | None:
+		"""
+		Same detection as lsblk: the SCSI host of the device first, then the kernel name
+		"""
+		if self._is_partition(kname):
+			return None
+
+		sys_class = SYS_CLASS_BLOCK.parent
+		device = (self._sysdirs[kname] / 'device').resolve()
+
+		if host := self._scsi_host(device):
+			for host_class, tran in (('spi_host', 'spi'), ('fc_host', 'fc'), ('sas_host', 'sas'), ('iscsi_host', 'iscsi')):
+				if (sys_class / host_class / host).exists():
+					return tran
+
+			if '/usb' in str(device):
+				return 'usb'
+
+			proc_name = _read(sys_class / 'scsi_host' / host / 'proc_name') or ''
+
+			if proc_name.startswith(('ahci', 'sata')):
+				return 'sata'
+			if 'ata' in proc_name:
+				return 'ata'
+
+			return None
+
+		for prefix, tran in (('nvme', 'nvme'), ('vd', 'virtio'), ('mmcblk', 'mmc')):
+			if kname.startswith(prefix):
+				return tran
+
+		return None
+
+	def _info(self, kname: str, parent: str | None, reverse: bool, full_dev_path: bool) -> LsblkInfo:
+		sysdir = self._sysdirs[kname]
+		udev = self._udev_properties(kname)
+
+		if dm_name := _read(sysdir / 'dm' / 'name'):
+			name, path = dm_name, Path('/dev/mapper') / dm_name
+		else:
+			name, path = kname, Path('/dev') / kname
+
+		if parent is None or reverse:
+			parents = self._parents(kname)
+			parent = parents[0] if parents else None
+
+		log_sec = int(_read(self._queue(kname) / 'logical_block_size') or 512)
+		sectors = int(_read(sysdir / 'size') or 0)
+		partn = _read(sysdir / 'partition')
+		mounts = self._mounts.get(kname, [])
+		mountpoints = [mountpoint for mountpoint, _ in mounts]
+
+		fsavail = None
+		fsuse = None
+
+		if fs_mounts := [m for m in mountpoints if m.is_absolute()]:
+			try:
+				st = os.statvfs(fs_mounts[0])
+				fsavail = st.f_bavail * st.f_frsize
+				fsuse = f'{round((st.f_blocks - st.f_bfree) * 100 / st.f_blocks)}%' if st.f_blocks else '0%'
+			except OSError:
+				pass
+
+		related = self._parents(kname) if reverse else self._children(kname)
+
+		return LsblkInfo.model_construct(
+			name=str(path) if full_dev_path else name,
+			kname=f'/dev/{kname}' if full_dev_path else kname,
+			path=path,
+			pkname=(f'/dev/{parent}' if full_dev_path else parent) if parent else None,
+			log_sec=log_sec,
+			# sysfs always counts in 512 byte sectors, regardless of the logical sector size
+			size=Size(sectors * 512, Unit.B, SectorSize(log_sec, Unit.B)),
+			pttype=udev.get('ID_PART_TABLE_TYPE') or udev.get('ID_PART_ENTRY_SCHEME'),
+			ptuuid=udev.get('ID_PART_TABLE_UUID'),
+			rota=_read(self._queue(kname) / 'rotational') == '1',
+			tran=self._transport(kname),
+			partn=int(partn) if partn else None,
+			partuuid=udev.get('ID_PART_ENTRY_UUID'),
+			parttype=udev.get('ID_PART_ENTRY_TYPE'),
+			uuid=udev.get('ID_FS_UUID'),
+			fstype=udev.get('ID_FS_TYPE'),
+			fsver=udev.get('ID_FS_VERSION'),
+			fsavail=fsavail,
+			fsuse_percentage=fsuse,
+			type=self._type(kname),
+			mountpoint=mountpoints[0] if mountpoints else None,
+			mountpoints=mountpoints,
+			fsroots=[root for _, root in mounts if root is not None],
+			children=[self._info(related_kname, kname, reverse, full_dev_path) for related_kname in related],
+		)
+
+	def _is_listed(self, kname: str) -> bool:
+		if (_read(self._sysdirs[kname] / 'dev') or '').startswith(f'{_RAM_DISK_MAJOR}:'):
+			return False
+
+		# loop devices without a backing file
+		return not kname.startswith('loop') or int(_read(self._sysdirs[kname] / 'size') or 0) > 0
+
+	def probe(
+		self,
+		dev_path: Path | str | None = None,
+		reverse: bool = False,
+		full_dev_path: bool = False,
+	) -> list[LsblkInfo] | None:
+		"""
+		Same result as ``lsblk [--inverse] [--paths] [dev_path]``,
+		or None when ``dev_path`` isn't a known block device
+		"""
+		if dev_path:
+			kname = Path(dev_path).resolve().name
+			if kname not in self._sysdirs:
+				return None
+			return [self._info(kname, None, reverse, full_dev_path)]
+
+		if reverse:
+			roots = [k for k in self._sorted(self._knames) if not self._children(k)]
+		else:
+			roots = [k for k in self._sorted(self._knames) if not self._parents(k)]
+
+		return [self._info(kname, None, reverse, full_dev_path) for kname in roots if self._is_listed(kname)]
+
+
+def _backing_disks(sysdir: Path) -> list[Path]:
+	"""
+	The whole disks a block device is stored on, through partitions
+	and the slaves of device mapper and md devices
+	"""
+	if (sysdir / 'partition').exists():
+		return [sysdir.parent]
+
+	try:
+		slaves = sorted(os.listdir(sysdir / 'slaves'))
+	except OSError:
+		slaves = []
+
+	if not slaves:
+		return [sysdir]
+
+	return [disk for slave in slaves for disk in _backing_disks((SYS_CLASS_BLOCK / slave).resolve())]
+
+
+def storage_info(dev_path: Path) -> StorageInfo | None:
+	"""
+	What kind of storage ends up holding the data of ``dev_path``,
+	a device spanning mixed disks is as slow as the slowest of them
+	"""
+	sysdir = SYS_CLASS_BLOCK / dev_path.resolve().name
+
+	if not sysdir.exists():
+		return None
+
+	disks = _backing_disks(sysdir.resolve())
+
+	if any(_read(disk / 'queue' / 'rotational') == '1' for disk in disks):
+		device_class = DeviceClass.Hdd
+	elif all(disk.name.startswith('nvme') for disk in disks):
+		device_class = DeviceClass.Nvme
+	else:
+		device_class = DeviceClass.Ssd
+
+	discard = all(int(_read(disk / 'queue' / 'discard_max_bytes') or 0) > 0 for disk in disks)
+
+	return StorageInfo(device_class, discard)
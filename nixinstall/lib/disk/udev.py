@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import ctypes
+import os
+import select
+import stat
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from types import TracebackType
+
+from ..output import debug
+
+UDEV_DATA = Path('/run/udev/data')
+UDEV_TIMEOUT = 10.0
+
+# file timestamps are taken from the coarse clock, reading the same clock
+# makes "written after" comparisons exact
+CLOCK_REALTIME_COARSE = getattr(time, 'CLOCK_REALTIME_COARSE', 5)
+
+# flags of inotify(7)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+libc = ctypes.CDLL(None, use_errno=True)
+
+libc.inotify_init1.argtypes = [ctypes.c_int]
+libc.inotify_init1.restype = ctypes.c_int
+libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+libc.inotify_add_watch.restype = ctypes.c_int
+
+
+def udev_timestamp() -> int:
+	"""
+	Marks a point in time, take it before changing a device and
+	pass it to ``wait_for_devices`` to ignore older udev records
+	"""
+	return time.clock_gettime_ns(CLOCK_REALTIME_COARSE)
+
+
+class _Inotify:
+	def __init__(self, directories: Iterable[Path]) -> None:
+		if (fd := libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)) < 0:
+			errno = ctypes.get_errno()
+			raise OSError(errno, os.strerror(errno))
+
+		self._fd = fd
+
+		for directory in directories:
+			if directory.is_dir():
+				libc.inotify_add_watch(self._fd, os.fsencode(directory), IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE | IN_ATTRIB)
+
+	def __enter__(self) -> _Inotify:
+		return self
+
+	def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> None:
+		os.close(self._fd)
+
+	def wait(self, timeout: float) -> None:
+		poller = select.poll()
+		poller.register(self._fd, select.POLLIN)
+
+		if poller.poll(timeout * 1000):
+			# only the wake-up matters, the caller checks the state itself
+			try:
+				while os.read(self._fd, 4096):
+					pass
+			except BlockingIOError:
+				pass
+
+
+def _device_ready(path: Path, properties: Iterable[str], since: int | None) -> bool:
+	try:
+		st = os.stat(path)
+	except OSError:
+		return False
+
+	if not stat.S_ISBLK(st.st_mode):
+		return False
+
+	db = UDEV_DATA / f'b{os.major(st.st_rdev)}:{os.minor(st.st_rdev)}'
+
+	try:
+		db_mtime = db.stat().st_mtime_ns
+		data = db.read_text()
+	except OSError:
+		return False
+
+	if since is not None and db_mtime < since:
+		return False
+
+	keys = {line[2:].partition('=')[0] for line in data.splitlines() if line.startswith('E:')}
+	return all(prop in keys for prop in properties)
+
+
+def wait_for_devices(
+	paths: list[Path],
+	properties: Iterable[str] = (),
+	since: int | None = None,
+	timeout: float = UDEV_TIMEOUT,
+) -> bool:
+	"""
+	Blocks until udev has processed each of ``paths``: the device node or link exists
+	and its udev record carries ``properties``, written after ``since`` if given.
+	Returns False if that didn't happen within ``timeout`` or can't be observed.
+	"""
+	if not UDEV_DATA.is_dir():
+		return False
+
+	properties = list(properties)
+	deadline = time.monotonic() + timeout
+
+	try:
+		# watches are in place before the first check, so no event can slip through
+		with _Inotify({UDEV_DATA, Path('/dev'), *(p.parent for p in paths)}) as inotify:
+			while pending := [p for p in paths if not _device_ready(p, properties, since)]:
+				if (remaining := deadline - time.monotonic()) <= 0:
+					debug(f'Timed out waiting for udev to process: {[str(p) for p in pending]}')
+					return False
+
+				inotify.wait(remaining)
+	except OSError as err:
+		debug(f'Unable to watch for udev events: {err}')
+		return False
+
+	return True
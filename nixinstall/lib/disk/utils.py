@@ -1,9 +1,12 @@
+import threading
 from pathlib import Path
 
 from pydantic import BaseModel
 
+from nixinstall.lib.disk.mountinfo import MountTable
+from nixinstall.lib.disk.sysfs import SysfsProber, sysfs_available
 from nixinstall.lib.exceptions import DiskError, SysCallError
-from nixinstall.lib.general import SysCommand
+from nixinstall.lib.general import SysCommand, probe_cache
 from nixinstall.lib.models.device_model import LsblkInfo
 from nixinstall.lib.output import debug, warn
 
@@ -16,6 +19,21 @@ def _fetch_lsblk_info(
 	dev_path: Path | str | None = None,
 	reverse: bool = False,
 	full_dev_path: bool = False,
+) -> LsblkOutput:
+	if sysfs_available():
+		try:
+			if (infos := SysfsProber().probe(dev_path, reverse=reverse, full_dev_path=full_dev_path)) is not None:
+				return LsblkOutput.model_construct(blockdevices=infos)
+		except (OSError, ValueError) as err:
+			debug(f'Unable to read block devices from sysfs, falling back to lsblk: {err}')
+
+	return _run_lsblk(dev_path, reverse=reverse, full_dev_path=full_dev_path)
+
+
+def _run_lsblk(
+	dev_path: Path | str | None = None,
+	reverse: bool = False,
+	full_dev_path: bool = False,
 ) -> LsblkOutput:
 	cmd = ['lsblk', '--json', '--bytes', '--output', ','.join(LsblkInfo.fields())]
 
@@ -29,7 +47,7 @@ def _fetch_lsblk_info(
 		cmd.append(str(dev_path))
 
 	try:
-		worker = SysCommand(cmd)
+		worker = SysCommand(cmd, use_pty=False)
 	except SysCallError as err:
 		# Get the output minus the message/info from lsblk if it returns a non-zero exit code.
 		if err.worker_log:
@@ -44,25 +62,161 @@ def _fetch_lsblk_info(
 	return LsblkOutput.model_validate_json(output)
 
 
+class BlockTopology:
+	"""
+	Snapshot of all block devices taken from a single lsblk call,
+	indexed by path, kernel name, UUID, PARTUUID and mountpoint.
+
+	Snapshots are tied to the probe cache generation, so the next
+	``block_topology()`` call after a device got mutated takes a new one.
+	"""
+
+	def __init__(self, output: LsblkOutput, generation: int) -> None:
+		self.output = output
+		self.generation = generation
+
+		self._by_path: dict[Path, LsblkInfo] = {}
+		self._by_kname: dict[str, LsblkInfo] = {}
+		self._by_uuid: dict[str, LsblkInfo] = {}
+		self._by_partuuid: dict[str, LsblkInfo] = {}
+		self._by_mountpoint: dict[Path, list[LsblkInfo]] = {}
+		# a device shows up below every device it is stacked on, e.g. an LV spanning two PVs
+		self._parents: dict[Path, list[LsblkInfo]] = {}
+
+		self._index(output.blockdevices, None)
+
+	def _index(self, infos: list[LsblkInfo], parent: LsblkInfo | None) -> None:
+		for info in infos:
+			if parent is not None:
+				self._parents.setdefault(info.path, []).append(parent)
+
+			if info.path not in self._by_path:
+				self._by_path[info.path] = info
+				self._by_kname[info.kname] = info
+
+				if info.uuid:
+					self._by_uuid.setdefault(info.uuid, info)
+				if info.partuuid:
+					self._by_partuuid.setdefault(info.partuuid, info)
+
+				for mountpoint in info.mountpoints:
+					self._by_mountpoint.setdefault(mountpoint, []).append(info)
+
+			self._index(info.children, info)
+
+	@property
+	def blockdevices(self) -> list[LsblkInfo]:
+		return self.output.blockdevices
+
+	def by_path(self, path: Path | str) -> LsblkInfo | None:
+		return self._by_path.get(Path(path))
+
+	def by_kname(self, kname: str) -> LsblkInfo | None:
+		return self._by_kname.get(kname)
+
+	def by_uuid(self, uuid: str) -> LsblkInfo | None:
+		return self._by_uuid.get(uuid)
+
+	def by_partuuid(self, partuuid: str) -> LsblkInfo | None:
+		return self._by_partuuid.get(partuuid)
+
+	def by_mountpoint(self, mountpoint: Path, as_prefix: bool = False) -> list[LsblkInfo]:
+		if not as_prefix:
+			return list(self._by_mountpoint.get(mountpoint, []))
+
+		prefix = str(mountpoint)
+		devices: list[LsblkInfo] = []
+
+		for path, infos in self._by_mountpoint.items():
+			if str(path).startswith(prefix):
+				devices += [i for i in infos if i not in devices]
+
+		return devices
+
+	def find(self, dev_path: Path | str) -> LsblkInfo | None:
+		"""
+		Looks up a device the way lsblk resolves its arguments, symlinks
+		such as /dev/disk/by-uuid/* and /dev/mapper/* included
+		"""
+		dev_path = Path(dev_path)
+
+		if info := self._by_path.get(dev_path):
+			return info
+
+		if infos := self._by_mountpoint.get(dev_path):
+			return infos[0]
+
+		return self._by_kname.get(dev_path.resolve().name)
+
+	def inverse(self, info: LsblkInfo) -> LsblkInfo:
+		"""
+		The device with the devices it is stacked on as children, like ``lsblk --inverse``
+		"""
+		parents = self._parents.get(info.path, [])
+		return info.model_copy(update={'children': [self.inverse(p) for p in parents]})
+
+
+def _with_full_paths(info: LsblkInfo) -> LsblkInfo:
+	return info.model_copy(
+		update={
+			'name': str(info.path),
+			'kname': f'/dev/{info.kname}',
+			'pkname': f'/dev/{info.pkname}' if info.pkname else None,
+			'children': [_with_full_paths(child) for child in info.children],
+		}
+	)
+
+
+_topology: BlockTopology | None = None
+_topology_lock = threading.Lock()
+
+
+def block_topology() -> BlockTopology:
+	"""
+	Returns the block device snapshot, taking a new one if devices changed since the last
+	"""
+	global _topology
+
+	with _topology_lock:
+		generation = probe_cache.generation
+
+		if _topology is None or _topology.generation != generation:
+			_topology = BlockTopology(_fetch_lsblk_info(), generation)
+
+		return _topology
+
+
 def get_lsblk_info(
 	dev_path: Path | str,
 	reverse: bool = False,
 	full_dev_path: bool = False,
 ) -> LsblkInfo:
-	infos = _fetch_lsblk_info(dev_path, reverse=reverse, full_dev_path=full_dev_path)
+	topology = block_topology()
 
-	if infos.blockdevices:
-		return infos.blockdevices[0]
+	if (lsblk_info := topology.find(dev_path)) is None:
+		# not part of the default lsblk listing, ask for it explicitly
+		infos = _fetch_lsblk_info(dev_path, reverse=reverse, full_dev_path=full_dev_path)
 
-	raise DiskError(f'lsblk failed to retrieve information for "{dev_path}"')
+		if infos.blockdevices:
+			return infos.blockdevices[0]
+
+		raise DiskError(f'lsblk failed to retrieve information for "{dev_path}"')
+
+	if reverse:
+		lsblk_info = topology.inverse(lsblk_info)
+
+	if full_dev_path:
+		lsblk_info = _with_full_paths(lsblk_info)
+
+	return lsblk_info
 
 
 def get_all_lsblk_info() -> list[LsblkInfo]:
-	return _fetch_lsblk_info().blockdevices
+	return block_topology().blockdevices
 
 
 def get_lsblk_output() -> LsblkOutput:
-	return _fetch_lsblk_info()
+	return block_topology().output
 
 
 def find_lsblk_info(
@@ -72,6 +226,10 @@ def find_lsblk_info(
 	if isinstance(dev_path, str):
 		dev_path = Path(dev_path)
 
+	# the full device list of the current snapshot can use its index
+	if _topology is not None and info is _topology.blockdevices:
+		return _topology.by_path(dev_path)
+
 	for lsblk_info in info:
 		if lsblk_info.path == dev_path:
 			return lsblk_info
@@ -80,24 +238,7 @@ def find_lsblk_info(
 
 
 def get_lsblk_by_mountpoint(mountpoint: Path, as_prefix: bool = False) -> list[LsblkInfo]:
-	def _check(infos: list[LsblkInfo]) -> list[LsblkInfo]:
-		devices = []
-		for entry in infos:
-			if as_prefix:
-				matches = [m for m in entry.mountpoints if str(m).startswith(str(mountpoint))]
-				if matches:
-					devices += [entry]
-			elif mountpoint in entry.mountpoints:
-				devices += [entry]
-
-			if len(entry.children) > 0:
-				if len(match := _check(entry.children)) > 0:
-					devices += match
-
-		return devices
-
-	all_info = get_all_lsblk_info()
-	return _check(all_info)
+	return block_topology().by_mountpoint(mountpoint, as_prefix=as_prefix)
 
 
 def disk_layouts() -> str:
@@ -110,19 +251,28 @@ def disk_layouts() -> str:
 	return lsblk_output.model_dump_json(indent=4)
 
 
-def umount(mountpoint: Path, recursive: bool = False) -> None:
-	lsblk_info = get_lsblk_info(mountpoint)
+def umount(mountpoint: Path, recursive: bool = False, lazy: bool = False) -> None:
+	umount_all([mountpoint], recursive=recursive, lazy=lazy)
 
-	if not lsblk_info.mountpoints:
-		return
 
-	debug(f'Partition {mountpoint} is currently mounted at: {[str(m) for m in lsblk_info.mountpoints]}')
+def umount_all(paths: list[Path], recursive: bool = False, lazy: bool = False) -> None:
+	"""
+	Unmounts every mount of the given block devices or mountpoints in one go,
+	deepest first, and with ``recursive`` everything mounted below them as well
+	"""
+	table = MountTable.read()
+	mounts = [entry for path in paths for entry in table.lookup(path)]
 
-	cmd = ['umount']
+	if not mounts:
+		return
+
+	debug(f'Currently mounted at: {[str(m.mountpoint) for m in mounts]}')
 
 	if recursive:
-		cmd.append('-R')
+		mounts = table.with_submounts(mounts)
 
-	for path in lsblk_info.mountpoints:
-		debug(f'Unmounting mountpoint: {path}')
-		SysCommand(cmd + [str(path)])
+	try:
+		table.unmount(mounts, lazy=lazy)
+	finally:
+		# mountpoints changed without running a command
+		probe_cache.invalidate()
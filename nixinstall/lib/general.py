@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import mmap
 import os
 import re
 import secrets
@@ -9,15 +11,19 @@ import stat
 import string
 import subprocess
 import sys
+import tempfile
+import threading
 import time
-from collections.abc import Iterator
+from collections.abc import Generator, Iterable, Iterator
+from copy import copy
 from datetime import date, datetime
 from enum import Enum
 from pathlib import Path
+from resource import RUSAGE_CHILDREN, getrusage, struct_rusage
 from select import EPOLLHUP, EPOLLIN, epoll
 from shutil import which
 from types import TracebackType
-from typing import Any, override
+from typing import IO, Any, overload, override
 
 from .exceptions import RequirementError, SysCallError
 from .output import debug, error, logger
@@ -25,6 +31,11 @@ from .output import debug, error, logger
 # https://stackoverflow.com/a/43627833/929999
 _VT100_ESCAPE_REGEX = r'\x1B\[[?0-9;]*[a-zA-Z]'
 _VT100_ESCAPE_REGEX_BYTES = _VT100_ESCAPE_REGEX.encode()
+_VT100_ESCAPE_PATTERN = re.compile(_VT100_ESCAPE_REGEX)
+_VT100_ESCAPE_PATTERN_BYTES = re.compile(_VT100_ESCAPE_REGEX_BYTES)
+
+# Command output beyond this size is moved out of memory into a temporary file
+TRACE_LOG_SPILL_THRESHOLD = 8 * 1024 * 1024
 
 
 def generate_password(length: int = 64) -> str:
@@ -39,11 +50,11 @@ def locate_binary(name: str) -> str:
 
 
 def clear_vt100_escape_codes(data: bytes) -> bytes:
-	return re.sub(_VT100_ESCAPE_REGEX_BYTES, b'', data)
+	return _VT100_ESCAPE_PATTERN_BYTES.sub(b'', data)
 
 
 def clear_vt100_escape_codes_from_str(data: str) -> str:
-	return re.sub(_VT100_ESCAPE_REGEX, '', data)
+	return _VT100_ESCAPE_PATTERN.sub('', data)
 
 
 def jsonify(obj: object, safe: bool = True) -> object:
@@ -98,6 +109,242 @@ class UNSAFE_JSON(json.JSONEncoder, json.JSONDecoder):
 		return super().encode(jsonify(o, safe=False))
 
 
+class TraceLog:
+	"""
+	Growable output buffer of a :ref:`SysCommandWorker`.
+	Output is kept in memory until it grows past ``spill_threshold`` bytes,
+	after that it lives in an anonymous temporary file that is read back through mmap.
+	Reads behave like they would on ``bytes``.
+	"""
+
+	def __init__(self, spill_threshold: int = TRACE_LOG_SPILL_THRESHOLD) -> None:
+		self.spill_threshold = spill_threshold
+
+		self._buffer = bytearray()
+		self._file: IO[bytes] | None = None
+		self._mmap: mmap.mmap | None = None
+		self._size = 0
+		self._mapped_size = 0
+
+	def __len__(self) -> int:
+		return self._size
+
+	def __bytes__(self) -> bytes:
+		return bytes(self._view()[:])
+
+	def __contains__(self, key: bytes) -> bool:
+		return self.find(key) >= 0
+
+	@overload
+	def __getitem__(self, key: int) -> int: ...
+
+	@overload
+	def __getitem__(self, key: slice) -> bytes: ...
+
+	def __getitem__(self, key: int | slice) -> int | bytes:
+		if isinstance(key, slice):
+			return bytes(self._view()[key])
+
+		return self._view()[key]
+
+	@override
+	def __repr__(self) -> str:
+		return str(bytes(self))
+
+	@property
+	def spilled(self) -> bool:
+		return self._file is not None
+
+	def append(self, data: bytes) -> None:
+		if self._file is not None:
+			self._file.write(data)
+		else:
+			self._buffer += data
+
+			if len(self._buffer) > self.spill_threshold:
+				self._spill()
+
+		self._size += len(data)
+
+	def _spill(self) -> None:
+		self._file = tempfile.TemporaryFile(prefix='nixinstall-trace-')
+		self._file.write(self._buffer)
+		self._buffer = bytearray()
+
+	def _view(self) -> bytearray | mmap.mmap:
+		if self._file is None:
+			return self._buffer
+
+		if self._mmap is None or self._mapped_size != self._size:
+			self._file.flush()
+
+			if self._mmap is not None:
+				self._mmap.close()
+
+			self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+			self._mapped_size = self._size
+
+		return self._mmap
+
+	def find(self, sub: bytes, start: int = 0, ignore_case: bool = False) -> int:
+		if ignore_case:
+			# searches the buffer or mapping in place, lower() would copy all of it
+			match = re.compile(re.escape(sub), re.IGNORECASE).search(self._view(), start)
+			return match.start() if match else -1
+
+		return self._view().find(sub, start)
+
+	def rfind(self, sub: bytes, start: int = 0) -> int:
+		return self._view().rfind(sub, start)
+
+	def decode(self, encoding: str = 'utf-8', errors: str = 'strict') -> str:
+		return bytes(self).decode(encoding, errors=errors)
+
+	def close(self) -> None:
+		"""
+		Releases the mapping and temporary file of a spilled log, the log is empty afterwards
+		"""
+		if self._mmap is not None:
+			self._mmap.close()
+			self._mmap = None
+
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+		self._buffer = bytearray()
+		self._size = 0
+		self._mapped_size = 0
+
+
+class ProbeCache:
+	"""
+	Caches the results of read-only commands (probes) so that asking the system
+	the same question twice doesn't start the same process twice.
+
+	Only commands matching a registered probe prefix are cached. Probes that
+	depend on the state of the block devices are invalidated whenever the
+	generation is bumped, which happens automatically for every command that
+	is not a probe itself (mount, mkfs, cryptsetup open, lvcreate, ...) and
+	has to be done by hand with ``invalidate()`` for in-process changes like
+	a parted commit.
+	"""
+
+	def __init__(self) -> None:
+		# probe prefix (binary name + leading arguments) -> depends on block device state
+		self._probes: dict[tuple[str, ...], bool] = {}
+		self._entries: dict[tuple[Any, ...], tuple[int | None, SysCommandWorker]] = {}
+		self._generation = 0
+		self._lock = threading.Lock()
+
+		self.enabled = True
+		self.hits = 0
+		self.misses = 0
+
+	@property
+	def generation(self) -> int:
+		return self._generation
+
+	def register(self, *prefix: str, device_state: bool = True) -> None:
+		"""
+		Marks commands starting with ``prefix`` as pure probes.
+		With ``device_state=False`` the result is kept for the whole session.
+		"""
+		self._probes[prefix] = device_state
+
+	def _match(self, cmd: list[str]) -> bool | None:
+		if not cmd:
+			return None
+
+		argv = [Path(cmd[0]).name, *cmd[1:]]
+
+		for prefix, device_state in self._probes.items():
+			if tuple(argv[: len(prefix)]) == prefix:
+				return device_state
+
+		return None
+
+	def is_probe(self, cmd: list[str]) -> bool:
+		return self._match(cmd) is not None
+
+	def invalidate(self) -> None:
+		with self._lock:
+			self._generation += 1
+			# entries of older generations are never served again, let go of their output
+			self._entries = {key: entry for key, entry in self._entries.items() if entry[0] is None}
+
+	def notify(self, cmd: list[str]) -> None:
+		"""
+		Called around every command that is run, anything that isn't
+		a registered probe is assumed to change the system.
+		"""
+		if not self.is_probe(cmd):
+			self.invalidate()
+
+	def get(self, key: tuple[Any, ...], cmd: list[str]) -> SysCommandWorker | None:
+		if not self.enabled or not self.is_probe(cmd):
+			return None
+
+		with self._lock:
+			entry = self._entries.get(key)
+
+			if entry is None or entry[0] not in (None, self._generation):
+				self.misses += 1
+				return None
+
+			self.hits += 1
+			hits, misses = self.hits, self.misses
+
+		debug(f'Probe cache hit: {cmd} (hits: {hits}, misses: {misses}, generation: {self._generation})')
+
+		# every caller gets its own read position into the shared output
+		session = copy(entry[1])
+		session.seek(0)
+		return session
+
+	def put(self, key: tuple[Any, ...], cmd: list[str], session: SysCommandWorker, generation: int) -> None:
+		if not self.enabled or (device_state := self._match(cmd)) is None:
+			return
+
+		with self._lock:
+			# the device state changed while the probe ran, the result may already be stale
+			if device_state and generation != self._generation:
+				return
+
+			self._entries[key] = (generation if device_state else None, session)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+			self.hits = 0
+			self.misses = 0
+
+
+probe_cache = ProbeCache()
+probe_cache.register('lsblk')
+probe_cache.register('losetup', '-a')
+probe_cache.register('blkid')
+probe_cache.register('lvs')
+probe_cache.register('vgs')
+probe_cache.register('pvs')
+probe_cache.register('btrfs', 'subvolume', 'list')
+probe_cache.register('cryptsetup', 'isLuks')
+probe_cache.register('cryptsetup', 'luksUUID')
+probe_cache.register('lspci', device_state=False)
+probe_cache.register('systemd-detect-virt', device_state=False)
+
+
+def _resolve_use_pty(use_pty: bool | None) -> bool:
+	"""
+	Commands run on a pty by default, except from threads other than the main one:
+	pty.fork() forks the whole multithreaded process, posix_spawn() does not
+	"""
+	if use_pty is None:
+		return threading.current_thread() is threading.main_thread()
+
+	return use_pty
+
+
 class SysCommandWorker:
 	def __init__(
 		self,
@@ -106,6 +353,8 @@ class SysCommandWorker:
 		environment_vars: dict[str, str] | None = None,
 		working_directory: str = './',
 		remove_vt100_escape_codes_from_lines: bool = True,
+		spill_threshold: int = TRACE_LOG_SPILL_THRESHOLD,
+		use_pty: bool | None = None,
 	):
 		if isinstance(cmd, str):
 			cmd = shlex.split(cmd)
@@ -123,13 +372,25 @@ class SysCommandWorker:
 		self.working_directory = working_directory
 
 		self.exit_code: int | None = None
-		self._trace_log = b''
+		self.rusage: struct_rusage | None = None
+		self._trace_log = TraceLog(spill_threshold)
 		self._trace_log_pos = 0
+		# output after the last newline that __iter__ has already read but not yielded yet
+		self._partial_line = b''
+		self._stderr_log = TraceLog(spill_threshold)
 		self.poll_object = epoll()
+		# with a pty all three point to the same terminal, without one
+		# child_fd is stdout and stderr is kept apart in the stderr log
 		self.child_fd: int | None = None
+		self.stdin_fd: int | None = None
+		self.stderr_fd: int | None = None
+		self._output_fds: set[int] = set()
+		self.pid_fd: int | None = None
 		self.started: float | None = None
 		self.ended: float | None = None
-		self.remove_vt100_escape_codes_from_lines: bool = remove_vt100_escape_codes_from_lines
+		self.use_pty = _resolve_use_pty(use_pty)
+		# pipe output never contains terminal escape codes
+		self.remove_vt100_escape_codes_from_lines: bool = remove_vt100_escape_codes_from_lines and self.use_pty
 
 	def __contains__(self, key: bytes) -> bool:
 		"""
@@ -146,40 +407,72 @@ class SysCommandWorker:
 		return False
 
 	def __iter__(self, *args: str, **kwargs: dict[str, Any]) -> Iterator[bytes]:
-		last_line = self._trace_log.rfind(b'\n')
-		lines = filter(None, self._trace_log[self._trace_log_pos : last_line].splitlines())
-		for line in lines:
-			if self.remove_vt100_escape_codes_from_lines:
-				line = clear_vt100_escape_codes(line)
+		"""
+		Yields the complete lines that arrived since the last call.
+		An unfinished line is held back until its newline arrives or the command has ended.
+		"""
+		end = len(self._trace_log)
+		data = self._partial_line + self._trace_log[self._trace_log_pos : end]
+		self._trace_log_pos = end
+
+		if self.ended is None:
+			# escape codes never span a newline, so everything up to the
+			# last one can be cleaned and split without waiting for more data
+			split = data.rfind(b'\n') + 1
+			data, self._partial_line = data[:split], data[split:]
+		else:
+			self._partial_line = b''
 
-			yield line + b'\n'
+		if self.remove_vt100_escape_codes_from_lines:
+			data = clear_vt100_escape_codes(data)
 
-		self._trace_log_pos = last_line
+		for line in data.splitlines():
+			if line:
+				yield line + b'\n'
 
 	@override
 	def __repr__(self) -> str:
 		self.make_sure_we_are_executing()
-		return str(self._trace_log)
+		return repr(self._trace_log)
 
 	@override
 	def __str__(self) -> str:
 		try:
 			return self._trace_log.decode('utf-8')
 		except UnicodeDecodeError:
-			return str(self._trace_log)
+			return repr(self._trace_log)
 
 	def __enter__(self) -> 'SysCommandWorker':
 		return self
 
 	def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> None:
+		try:
+			self._finish(exc_value)
+		finally:
+			self.close()
+
+	def close(self) -> None:
+		"""
+		Releases the output, a spilled log keeps a temporary file and mapping open until then
+		"""
+		self._trace_log.close()
+		self._stderr_log.close()
+
+	def _finish(self, exc_value: BaseException | None = None) -> None:
+		"""
+		Closes the descriptors of the finished command, raises if it failed
+		"""
 		# b''.join(sys_command('sync')) # No need to, since the underlying fs() object will call sync.
 		# TODO: https://stackoverflow.com/questions/28157929/how-to-safely-handle-an-exception-inside-a-context-manager
 
-		if self.child_fd:
-			try:
-				os.close(self.child_fd)
-			except Exception:
-				pass
+		for fd in {self.child_fd, self.stdin_fd, self.stderr_fd}:
+			if fd:
+				try:
+					os.close(fd)
+				except Exception:
+					pass
+
+		self._close_pid_fd()
 
 		if self.peek_output:
 			# To make sure any peaked output didn't leave us hanging
@@ -187,16 +480,32 @@ class SysCommandWorker:
 			sys.stdout.write('\n')
 			sys.stdout.flush()
 
-		if exc_type is not None:
+		if exc_value is not None:
 			debug(str(exc_value))
 
-		if self.exit_code != 0:
+		# a SysCallError raised while starting the command already says what went wrong
+		if self.exit_code != 0 and not isinstance(exc_value, SysCallError):
+			worker_log = bytes(self._trace_log) + bytes(self._stderr_log)
+			message = worker_log.decode('utf-8', errors='backslashreplace')
+
 			raise SysCallError(
-				f'{self.cmd} exited with abnormal exit code [{self.exit_code}]: {str(self)[-500:]}',
+				f'{self.cmd} exited with abnormal exit code [{self.exit_code}]: {message[-500:]}',
 				self.exit_code,
-				worker_log=self._trace_log,
+				worker_log=worker_log,
 			)
 
+	def lines(self) -> Iterator[bytes]:
+		"""
+		Yields output lines as they arrive until the command has ended.
+		"""
+		self.make_sure_we_are_executing()
+
+		while not self.ended:
+			self.poll(timeout=None)
+			yield from self
+
+		yield from self
+
 	def is_alive(self) -> bool:
 		self.poll()
 
@@ -210,8 +519,8 @@ class SysCommandWorker:
 
 		self.make_sure_we_are_executing()
 
-		if self.child_fd:
-			return os.write(self.child_fd, data + (b'\n' if line_ending else b''))
+		if self.stdin_fd:
+			return os.write(self.stdin_fd, data + (b'\n' if line_ending else b''))
 
 		return 0
 
@@ -228,6 +537,7 @@ class SysCommandWorker:
 		self.make_sure_we_are_executing()
 		# Safety check to ensure 0 < pos < len(tracelog)
 		self._trace_log_pos = min(max(0, pos), len(self._trace_log))
+		self._partial_line = b''
 
 	def peak(self, output: str | bytes) -> bool:
 		if self.peek_output:
@@ -244,68 +554,224 @@ class SysCommandWorker:
 
 		return True
 
-	def poll(self) -> None:
-		self.make_sure_we_are_executing()
+	def _read_output(self, fd: int) -> bool:
+		"""
+		Reads the next chunk of output from one of the child's output fds.
+		Returns False and stops watching the fd once the child side has been closed.
+		"""
+		try:
+			output = os.read(fd, 8192)
+		except OSError:
+			output = b''
 
-		if self.child_fd:
-			got_output = False
-			for _fileno, _event in self.poll_object.poll(0.1):
-				try:
-					output = os.read(self.child_fd, 8192)
-					got_output = True
-					self.peak(output)
-					self._trace_log += output
-				except OSError:
-					self.ended = time.time()
+		if not output:
+			self._output_fds.discard(fd)
+
+			try:
+				self.poll_object.unregister(fd)
+			except (OSError, ValueError):
+				pass
+
+			return False
+
+		if fd == self.stderr_fd:
+			self._stderr_log.append(output)
+		else:
+			self.peak(output)
+			self._trace_log.append(output)
+
+		return True
+
+	def _drain_output(self) -> None:
+		"""
+		Reads whatever the child left behind in its output after it exited,
+		without blocking on descendants that might still hold it open.
+		"""
+		if not self._output_fds:
+			return
+
+		drain = epoll()
+		for fd in self._output_fds:
+			drain.register(fd, EPOLLIN | EPOLLHUP)
+
+		try:
+			while events := drain.poll(0):
+				if not any([self._read_output(fd) for fd, _event in events]):
 					break
+		finally:
+			drain.close()
 
-			if self.ended or (not got_output and not _pid_exists(self.pid)):
-				self.ended = time.time()
-				try:
-					wait_status = os.waitpid(self.pid, 0)[1]
-					self.exit_code = os.waitstatus_to_exitcode(wait_status)
-				except ChildProcessError:
-					try:
-						wait_status = os.waitpid(self.child_fd, 0)[1]
-						self.exit_code = os.waitstatus_to_exitcode(wait_status)
-					except ChildProcessError:
-						self.exit_code = 1
+	def _close_pid_fd(self) -> None:
+		if self.pid_fd is not None:
+			try:
+				self.poll_object.unregister(self.pid_fd)
+			except (OSError, ValueError):
+				pass
+
+			os.close(self.pid_fd)
+			self.pid_fd = None
+
+	def _reap(self, block: bool = True) -> bool:
+		"""
+		Collects the exit status of the child.
+		With ``block=False`` nothing is waited for and False is returned if the child is still running.
+		"""
+		try:
+			pid, wait_status, rusage = os.wait4(self.pid, 0 if block else os.WNOHANG)
+		except ChildProcessError:
+			self.exit_code = 1
+		else:
+			if pid == 0:
+				return False
+
+			self.exit_code = os.waitstatus_to_exitcode(wait_status)
+			self.rusage = rusage
+
+		self.ended = time.time()
+		self._close_pid_fd()
+		probe_cache.notify(self.cmd)
+		_cmd_trace(self.cmd, self.started or self.ended, self.ended, self.exit_code, len(self._trace_log) + len(self._stderr_log), self.rusage)
+
+		return True
+
+	def poll(self, timeout: float | None = 0.1) -> None:
+		"""
+		Waits up to ``timeout`` seconds for output or for the child to exit.
+		A ``timeout`` of None waits until either happens, which requires a pidfd
+		to be able to notice the exit; without one it falls back to 0.1 seconds.
+		"""
+		self.make_sure_we_are_executing()
+
+		if self.ended or not self.child_fd:
+			return
+
+		if timeout is None:
+			timeout = -1 if self.pid_fd is not None else 0.1
+
+		got_output = False
+		child_exited = False
+
+		for fileno, _event in self.poll_object.poll(timeout):
+			if fileno == self.pid_fd:
+				child_exited = True
+			elif self._read_output(fileno):
+				got_output = True
+
+		if child_exited:
+			self._drain_output()
+
+		if child_exited or not self._output_fds:
+			self._reap()
+		elif not got_output and self.pid_fd is None:
+			# no pidfd to tell us about the exit, so check without blocking
+			if self._reap(block=False):
+				self._drain_output()
 
 	def execute(self) -> bool:
-		import pty
+		# the working directory is only ever changed in the child, workers run
+		# from several threads and os.chdir() would move all of them
+		if not os.path.isdir(self.working_directory):
+			raise SysCallError(f'{self.cmd}: working directory {self.working_directory} does not exist')
+
+		if self.use_pty:
+			self._fork_pty()
+		else:
+			self._spawn_piped()
+
+		self.started = time.time()
+		probe_cache.notify(self.cmd)
 
-		if (old_dir := os.getcwd()) != self.working_directory:
-			os.chdir(str(self.working_directory))
+		for fd in self._output_fds:
+			self.poll_object.register(fd, EPOLLIN | EPOLLHUP)
+
+		# A pidfd becomes readable once the child exits, which lets us wait
+		# for output and for the exit in the same epoll call
+		try:
+			self.pid_fd = os.pidfd_open(self.pid)
+		except (AttributeError, OSError) as err:
+			debug(f'pidfd not available, falling back to polling the child: {err}')
+		else:
+			self.poll_object.register(self.pid_fd, EPOLLIN)
+
+		return True
+
+	def _fork_pty(self) -> None:
+		import pty
 
 		# Note: If for any reason, we get a Python exception between here
 		#   and until os.close(), the traceback will get locked inside
 		#   stdout of the child_fd object. `os.read(self.child_fd, 8192)` is the
 		#   only way to get the traceback without losing it.
 
+		# logged before forking, the child must not touch our buffered log files
+		_cmd_history(self.cmd)
+
 		self.pid, self.child_fd = pty.fork()
 
 		# https://stackoverflow.com/questions/4022600/python-pty-fork-how-does-it-work
 		if not self.pid:
-			_cmd_history(self.cmd)
-
+			# the child must never get back into our code, it is a copy of a possibly
+			# multithreaded process, so it doesn't touch the logger or any lock either
 			try:
-				os.execve(self.cmd[0], list(self.cmd), {**os.environ, **self.environment_vars})
-			except FileNotFoundError:
-				error(f'{self.cmd[0]} does not exist.')
-				self.exit_code = 1
-				return False
-		else:
-			# Only parent process moves back to the original working directory
-			os.chdir(old_dir)
+				try:
+					os.chdir(self.working_directory)
+					os.execve(self.cmd[0], list(self.cmd), {**os.environ, **self.environment_vars})
+				except BaseException as err:
+					os.write(2, f'{self.cmd[0]}: {err}\n'.encode())
+			finally:
+				os._exit(127)
 
-		self.started = time.time()
-		self.poll_object.register(self.child_fd, EPOLLIN | EPOLLHUP)
+		self.stdin_fd = self.child_fd
+		self._output_fds = {self.child_fd}
 
-		return True
+	def _spawn_piped(self) -> None:
+		"""
+		Starts the command with stdin, stdout and stderr on plain pipes.
+		The output is exactly what the command wrote, without tty line discipline.
+		"""
+		stdin_r, stdin_w = os.pipe()
+		stdout_r, stdout_w = os.pipe()
+		stderr_r, stderr_w = os.pipe()
+
+		_cmd_history(self.cmd)
+
+		argv = list(self.cmd)
+
+		if Path(self.working_directory).resolve() != Path.cwd():
+			# posix_spawn has no chdir file action, env changes the directory in the child
+			argv = [which('env') or '/usr/bin/env', f'--chdir={self.working_directory}', *argv]
+
+		try:
+			self.pid = os.posix_spawn(
+				argv[0],
+				argv,
+				{**os.environ, **self.environment_vars},
+				file_actions=[
+					(os.POSIX_SPAWN_DUP2, stdin_r, 0),
+					(os.POSIX_SPAWN_DUP2, stdout_w, 1),
+					(os.POSIX_SPAWN_DUP2, stderr_w, 2),
+				],
+			)
+		except OSError:
+			for fd in (stdin_w, stdout_r, stderr_r):
+				os.close(fd)
+			raise
+		finally:
+			for fd in (stdin_r, stdout_w, stderr_w):
+				os.close(fd)
+
+		self.stdin_fd = stdin_w
+		self.child_fd = stdout_r
+		self.stderr_fd = stderr_r
+		self._output_fds = {stdout_r, stderr_r}
 
 	def decode(self, encoding: str = 'UTF-8') -> str:
 		return self._trace_log.decode(encoding)
 
+	@property
+	def stderr(self) -> bytes:
+		return bytes(self._stderr_log)
+
 
 class SysCommand:
 	def __init__(
@@ -315,12 +781,16 @@ class SysCommand:
 		environment_vars: dict[str, str] | None = None,
 		working_directory: str = './',
 		remove_vt100_escape_codes_from_lines: bool = True,
+		spill_threshold: int = TRACE_LOG_SPILL_THRESHOLD,
+		use_pty: bool | None = None,
 	):
 		self.cmd = cmd
 		self.peek_output = peek_output
 		self.environment_vars = environment_vars
 		self.working_directory = working_directory
 		self.remove_vt100_escape_codes_from_lines = remove_vt100_escape_codes_from_lines
+		self.spill_threshold = spill_threshold
+		self.use_pty = _resolve_use_pty(use_pty)
 
 		self.session: SysCommandWorker | None = None
 		self.create_session()
@@ -363,17 +833,40 @@ class SysCommand:
 		if self.session:
 			return True
 
-		with SysCommandWorker(
+		argv = shlex.split(self.cmd) if isinstance(self.cmd, str) else list(self.cmd)
+		environment_vars = {'LC_ALL': 'C', **(self.environment_vars or {})}
+		cache_key = (tuple(argv), tuple(sorted(environment_vars.items())), self.working_directory, self.use_pty)
+
+		if cached := probe_cache.get(cache_key, argv):
+			self.session = cached
+			return True
+
+		generation = probe_cache.generation
+
+		self.session = SysCommandWorker(
 			self.cmd,
 			peek_output=self.peek_output,
 			environment_vars=self.environment_vars,
 			remove_vt100_escape_codes_from_lines=self.remove_vt100_escape_codes_from_lines,
 			working_directory=self.working_directory,
-		) as session:
-			self.session = session
+			spill_threshold=self.spill_threshold,
+			use_pty=self.use_pty,
+		)
 
+		# not used as a context manager, that would release the output
+		# which is read through this SysCommand after the command ended
+		exc: BaseException | None = None
+
+		try:
 			while not self.session.ended:
-				self.session.poll()
+				self.session.poll(timeout=None)
+		except BaseException as err:
+			exc = err
+			raise
+		finally:
+			self.session._finish(exc)
+
+		probe_cache.put(cache_key, argv, self.session, generation)
 
 		if self.peek_output:
 			sys.stdout.write('\n')
@@ -396,9 +889,9 @@ class SysCommand:
 			raise ValueError('No session available')
 
 		if remove_cr:
-			return self.session._trace_log.replace(b'\r\n', b'\n')
+			return bytes(self.session._trace_log).replace(b'\r\n', b'\n')
 
-		return self.session._trace_log
+		return bytes(self.session._trace_log)
 
 	@property
 	def exit_code(self) -> int | None:
@@ -410,24 +903,155 @@ class SysCommand:
 	@property
 	def trace_log(self) -> bytes | None:
 		if self.session:
-			return self.session._trace_log
+			return bytes(self.session._trace_log)
 		return None
 
+	@property
+	def stderr(self) -> bytes | None:
+		if self.session:
+			return self.session.stderr
+		return None
 
-def _append_log(file: str, content: str) -> None:
-	path = logger.directory / file
 
-	change_perm = not path.exists()
+class AsyncSysCommand:
+	"""
+	asyncio counterpart of :ref:`SysCommand` for commands that don't need a terminal.
+	The command runs with stdout and stderr on a pipe when awaited,
+	``await AsyncSysCommand('lsblk --json')`` returns the finished command and
+	raises :ref:`SysCallError` on a non-zero exit code just like ``SysCommand`` does.
+	"""
 
-	try:
-		with path.open('a') as f:
-			f.write(content)
+	def __init__(
+		self,
+		cmd: str | list[str],
+		environment_vars: dict[str, str] | None = None,
+		working_directory: str = './',
+		spill_threshold: int = TRACE_LOG_SPILL_THRESHOLD,
+	):
+		if isinstance(cmd, str):
+			cmd = shlex.split(cmd)
+
+		if cmd and not cmd[0].startswith(('/', './')):
+			cmd[0] = locate_binary(cmd[0])
+
+		self.cmd = cmd
+		# same locale default as SysCommandWorker
+		self.environment_vars = {'LC_ALL': 'C'}
+		if environment_vars:
+			self.environment_vars.update(environment_vars)
+
+		self.working_directory = working_directory
+
+		self.exit_code: int | None = None
+		self.started: float | None = None
+		self.ended: float | None = None
+		self._trace_log = TraceLog(spill_threshold)
+		self._task: asyncio.Task[AsyncSysCommand] | None = None
+
+	def __await__(self) -> Generator[Any, None, 'AsyncSysCommand']:
+		return self.run().__await__()
+
+	def __iter__(self) -> Iterator[bytes]:
+		for line in self.output().splitlines():
+			if line:
+				yield line + b'\n'
+
+	@override
+	def __repr__(self) -> str:
+		return self.decode('UTF-8', errors='backslashreplace')
+
+	async def run(self) -> 'AsyncSysCommand':
+		"""
+		Starts the command on the first call, every call returns once it has finished
+		"""
+		if self._task is None:
+			self._task = asyncio.ensure_future(self._run())
 
-		if change_perm:
-			path.chmod(stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP)
-	except (PermissionError, FileNotFoundError):
-		# If the file does not exist, ignore the error
-		pass
+		return await self._task
+
+	async def _run(self) -> 'AsyncSysCommand':
+		_cmd_history(self.cmd)
+		probe_cache.notify(self.cmd)
+		self.started = time.time()
+
+		proc = await asyncio.create_subprocess_exec(
+			*self.cmd,
+			stdin=subprocess.DEVNULL,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT,
+			cwd=self.working_directory,
+			env={**os.environ, **self.environment_vars},
+		)
+
+		assert proc.stdout is not None
+
+		while output := await proc.stdout.read(8192):
+			self._trace_log.append(output)
+
+		self.exit_code = await proc.wait()
+		self.ended = time.time()
+		probe_cache.notify(self.cmd)
+		# asyncio reaps the child itself, so there's no rusage to report
+		_cmd_trace(self.cmd, self.started, self.ended, self.exit_code, len(self._trace_log), tid=proc.pid)
+
+		if self.exit_code != 0:
+			raise SysCallError(
+				f'{self.cmd} exited with abnormal exit code [{self.exit_code}]: {self.decode(strip=False)[-500:]}',
+				self.exit_code,
+				worker_log=bytes(self._trace_log),
+			)
+
+		return self
+
+	def decode(self, encoding: str = 'utf-8', errors: str = 'backslashreplace', strip: bool = True) -> str:
+		val = self._trace_log.decode(encoding, errors=errors)
+
+		if strip:
+			return val.strip()
+		return val
+
+	def output(self) -> bytes:
+		return bytes(self._trace_log)
+
+	@property
+	def trace_log(self) -> bytes:
+		return bytes(self._trace_log)
+
+
+async def gather_commands(
+	commands: Iterable[AsyncSysCommand],
+	max_concurrency: int = 4,
+) -> list[AsyncSysCommand | SysCallError]:
+	"""
+	Runs the given commands with at most ``max_concurrency`` of them at the same time.
+	The results are returned in the order of ``commands``, a command that failed
+	is represented by its :ref:`SysCallError` instead of raising it.
+	"""
+	semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+	async def _run(command: AsyncSysCommand) -> AsyncSysCommand | SysCallError:
+		async with semaphore:
+			try:
+				return await command.run()
+			except SysCallError as err:
+				return err
+
+	return list(await asyncio.gather(*(_run(command) for command in commands)))
+
+
+def run_commands(
+	commands: Iterable[AsyncSysCommand | str | list[str]],
+	max_concurrency: int = 4,
+) -> list[AsyncSysCommand | SysCallError]:
+	"""
+	Blocking wrapper around :ref:`gather_commands` for callers outside of an event loop.
+	"""
+	async_commands = [c if isinstance(c, AsyncSysCommand) else AsyncSysCommand(c) for c in commands]
+	return asyncio.run(gather_commands(async_commands, max_concurrency))
+
+
+def _append_log(file: str, content: str, line_buffered: bool = True) -> None:
+	logger.write(file, content, line_buffered=line_buffered, mode=stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP)
 
 
 def _cmd_history(cmd: list[str]) -> None:
@@ -436,7 +1060,94 @@ def _cmd_history(cmd: list[str]) -> None:
 
 
 def _cmd_output(output: str) -> None:
-	_append_log('cmd_output.txt', output)
+	# peeked output arrives in small chunks, leave it to the buffer until the next flush
+	_append_log('cmd_output.txt', output, line_buffered=False)
+
+
+class _CommandTracer:
+	"""
+	Writes every finished command as a Chrome trace event (JSON array format)
+	to cmd_trace.json next to the install log, so that an installation can be
+	opened in Perfetto or chrome://tracing. The closing bracket is optional in
+	that format, which keeps the file valid if the installer crashes.
+	"""
+
+	def __init__(self, file: str = 'cmd_trace.json') -> None:
+		self.file = file
+		self._lock = threading.Lock()
+		self._started = False
+
+	def record(
+		self,
+		cmd: list[str],
+		started: float,
+		ended: float,
+		exit_code: int | None,
+		output_size: int,
+		rusage: struct_rusage | None = None,
+		tid: int | None = None,
+	) -> None:
+		args: dict[str, Any] = {
+			'cmd': shlex.join(cmd),
+			'exit_code': exit_code,
+			'output_bytes': output_size,
+		}
+
+		if rusage is not None:
+			args['user_cpu_s'] = round(rusage.ru_utime, 6)
+			args['sys_cpu_s'] = round(rusage.ru_stime, 6)
+			args['max_rss_kib'] = rusage.ru_maxrss
+
+		event = {
+			'name': Path(cmd[0]).name if cmd else '',
+			'cat': 'command',
+			'ph': 'X',
+			'ts': int(started * 1_000_000),
+			'dur': int((ended - started) * 1_000_000),
+			'pid': os.getpid(),
+			'tid': tid if tid is not None else threading.get_native_id(),
+			'args': args,
+		}
+
+		with self._lock:
+			# a new installer run starts a new trace
+			logger.write(
+				self.file,
+				(',\n' if self._started else '[\n') + json.dumps(event),
+				line_buffered=False,
+				truncate=not self._started,
+			)
+			self._started = True
+
+
+_command_tracer = _CommandTracer()
+
+
+def _cmd_trace(
+	cmd: list[str],
+	started: float,
+	ended: float,
+	exit_code: int | None,
+	output_size: int,
+	rusage: struct_rusage | None = None,
+	tid: int | None = None,
+) -> None:
+	_command_tracer.record(cmd, started, ended, exit_code, output_size, rusage, tid)
+
+
+def _children_rusage_delta(before: struct_rusage, after: struct_rusage) -> struct_rusage:
+	"""
+	CPU time spent by the children reaped between ``before`` and ``after``.
+	Children of other threads reaped in the meantime are included, ``ru_maxrss``
+	is the largest of all children so far since it can't be subtracted.
+	"""
+	return struct_rusage(
+		(
+			after.ru_utime - before.ru_utime,
+			after.ru_stime - before.ru_stime,
+			*after[2:],
+		)
+	)
 
 
 def run(
@@ -444,18 +1155,23 @@ def run(
 	input_data: bytes | None = None,
 ) -> subprocess.CompletedProcess[bytes]:
 	_cmd_history(cmd)
+	probe_cache.notify(cmd)
 
-	return subprocess.run(
-		cmd,
-		input=input_data,
-		stdout=subprocess.PIPE,
-		stderr=subprocess.STDOUT,
-		check=True,
-	)
-
+	started = time.time()
+	before = getrusage(RUSAGE_CHILDREN)
 
-def _pid_exists(pid: int) -> bool:
 	try:
-		return any(subprocess.check_output(['ps', '--no-headers', '-o', 'pid', '-p', str(pid)]).strip())
-	except subprocess.CalledProcessError:
-		return False
+		result = subprocess.run(
+			cmd,
+			input=input_data,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT,
+		)
+	finally:
+		probe_cache.notify(cmd)
+
+	rusage = _children_rusage_delta(before, getrusage(RUSAGE_CHILDREN))
+	_cmd_trace(cmd, started, time.time(), result.returncode, len(result.stdout), rusage)
+
+	result.check_returncode()
+	return result
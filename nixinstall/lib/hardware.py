@@ -209,7 +209,7 @@ class SysInfo:
 	@staticmethod
 	def _graphics_devices() -> dict[str, str]:
 		cards: dict[str, str] = {}
-		for line in SysCommand('lspci'):
+		for line in SysCommand('lspci', use_pty=False):
 			if b' VGA ' in line or b' 3D ' in line:
 				_, identifier = line.split(b': ', 1)
 				cards[identifier.strip().decode('UTF-8')] = str(line)
@@ -237,6 +237,10 @@ class SysInfo:
 	def cpu_model() -> str | None:
 		return _sys_info.cpu_info.get('model name', None)
 
+	@staticmethod
+	def cpu_flags() -> list[str]:
+		return _sys_info.cpu_info.get('flags', '').split()
+
 	@staticmethod
 	def sys_vendor() -> str:
 		with open('/sys/devices/virtual/dmi/id/sys_vendor') as vendor:
@@ -262,7 +266,7 @@ class SysInfo:
 	@staticmethod
 	def virtualization() -> str | None:
 		try:
-			return str(SysCommand('systemd-detect-virt')).strip('\r\n')
+			return SysCommand('systemd-detect-virt', use_pty=False).decode()
 		except SysCallError as err:
 			debug(f'Could not detect virtual system: {err}')
 
@@ -271,7 +275,7 @@ class SysInfo:
 	@staticmethod
 	def is_vm() -> bool:
 		try:
-			result = SysCommand('systemd-detect-virt')
+			result = SysCommand('systemd-detect-virt', use_pty=False)
 			return b'none' not in b''.join(result).lower()
 		except SysCallError as err:
 			debug(f'System is not running in a VM: {err}')
@@ -31,12 +31,12 @@ from nixinstall.tui.curses_menu import Tui
 from .exceptions import DiskError, SysCallError
 from .general import SysCommand
 from .hardware import SysInfo
-from .luks import Luks2
+from .luks import Luks2, LuksPerformanceFlags
 from .models.bootloader import Bootloader
 from .models.locale import LocaleConfiguration
 from .models.network_configuration import Nic
 from .models.users import User
-from .output import debug, error, info, log, logger, warn
+from .output import debug, error, event_log, info, log, logger, phase, warn
 from .storage import storage
 
 # Additional packages that are installed if the user is running the Live ISO with accessibility tools enabled
@@ -87,6 +87,9 @@ class Installer:
 		return self
 
 	def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> bool | None:
+		if summary := event_log.summary():
+			info(f'Duration of the install phases:\n{summary}')
+
 		if exc_type is not None:
 			error(str(exc_value))
 
@@ -146,26 +149,27 @@ class Installer:
 		pass
 
 	def mount_ordered_layout(self) -> None:
-		debug('Mounting ordered layout')
-
-		luks_handlers: dict[Any, Luks2] = {}
-
-		match self._disk_encryption.encryption_type:
-			case EncryptionType.NoEncryption:
-				self._mount_lvm_layout()
-			case EncryptionType.Luks:
-				luks_handlers = self._prepare_luks_partitions(self._disk_encryption.partitions)
-			case EncryptionType.LvmOnLuks:
-				luks_handlers = self._prepare_luks_partitions(self._disk_encryption.partitions)
-				self._import_lvm()
-				self._mount_lvm_layout(luks_handlers)
-			case EncryptionType.LuksOnLvm:
-				self._import_lvm()
-				luks_handlers = self._prepare_luks_lvm(self._disk_encryption.lvm_volumes)
-				self._mount_lvm_layout(luks_handlers)
-
-		# mount all regular partitions
-		self._mount_partition_layout(luks_handlers)
+		with phase('mount_ordered_layout', target=self.target, encryption=self._disk_encryption.encryption_type.value):
+			debug('Mounting ordered layout')
+
+			luks_handlers: dict[Any, Luks2] = {}
+
+			match self._disk_encryption.encryption_type:
+				case EncryptionType.NoEncryption:
+					self._mount_lvm_layout()
+				case EncryptionType.Luks:
+					luks_handlers = self._prepare_luks_partitions(self._disk_encryption.partitions)
+				case EncryptionType.LvmOnLuks:
+					luks_handlers = self._prepare_luks_partitions(self._disk_encryption.partitions)
+					self._import_lvm()
+					self._mount_lvm_layout(luks_handlers)
+				case EncryptionType.LuksOnLvm:
+					self._import_lvm()
+					luks_handlers = self._prepare_luks_lvm(self._disk_encryption.lvm_volumes)
+					self._mount_lvm_layout(luks_handlers)
+
+			# mount all regular partitions
+			self._mount_partition_layout(luks_handlers)
 
 	def _mount_partition_layout(self, luks_handlers: dict[Any, Luks2]) -> None:
 		debug('Mounting partition layout')
@@ -220,16 +224,20 @@ class Installer:
 		self,
 		partitions: list[PartitionModification],
 	) -> dict[PartitionModification, Luks2]:
-		return {
-			part_mod: device_handler.unlock_luks2_dev(
+		luks_handlers = {
+			part_mod: Luks2(
 				part_mod.dev_path,
-				part_mod.mapper_name,
-				self._disk_encryption.encryption_password,
+				mapper_name=part_mod.mapper_name,
+				password=self._disk_encryption.encryption_password,
+				performance=self._disk_encryption.luks_performance,
 			)
 			for part_mod in partitions
 			if part_mod.mapper_name and part_mod.dev_path
 		}
 
+		device_handler.unlock_luks2_devs(list(luks_handlers.values()))
+		return luks_handlers
+
 	def _import_lvm(self) -> None:
 		lvm_config = self._disk_config.lvm_config
 
@@ -247,32 +255,37 @@ class Installer:
 		self,
 		lvm_volumes: list[LvmVolume],
 	) -> dict[LvmVolume, Luks2]:
-		return {
-			vol: device_handler.unlock_luks2_dev(
+		luks_handlers = {
+			vol: Luks2(
 				vol.dev_path,
-				vol.mapper_name,
-				self._disk_encryption.encryption_password,
+				mapper_name=vol.mapper_name,
+				password=self._disk_encryption.encryption_password,
+				performance=self._disk_encryption.luks_performance,
 			)
 			for vol in lvm_volumes
 			if vol.mapper_name and vol.dev_path
 		}
 
+		device_handler.unlock_luks2_devs(list(luks_handlers.values()))
+		return luks_handlers
+
 	def _mount_partition(self, part_mod: PartitionModification) -> None:
 		if not part_mod.dev_path:
 			return
 
-		# it would be none if it's btrfs as the subvolumes will have the mountpoints defined
-		if part_mod.mountpoint:
-			target = self.target / part_mod.relative_mountpoint
-			device_handler.mount(part_mod.dev_path, target, options=part_mod.mount_options)
-		elif part_mod.fs_type == FilesystemType.Btrfs:
-			self._mount_btrfs_subvol(
-				part_mod.dev_path,
-				part_mod.btrfs_subvols,
-				part_mod.mount_options,
-			)
-		elif part_mod.is_swap():
-			device_handler.swapon(part_mod.dev_path)
+		with phase('mount_partition', device=part_mod.dev_path, mountpoint=part_mod.mountpoint, size=part_mod.length.format_highest()):
+			# it would be none if it's btrfs as the subvolumes will have the mountpoints defined
+			if part_mod.mountpoint:
+				target = self.target / part_mod.relative_mountpoint
+				device_handler.mount(part_mod.dev_path, target, options=part_mod.mount_options)
+			elif part_mod.fs_type == FilesystemType.Btrfs:
+				self._mount_btrfs_subvol(
+					part_mod.dev_path,
+					part_mod.btrfs_subvols,
+					part_mod.mount_options,
+				)
+			elif part_mod.is_swap():
+				device_handler.swapon(part_mod.dev_path)
 
 	def _mount_lvm_vol(self, volume: LvmVolume) -> None:
 		if volume.fs_type != FilesystemType.Btrfs:
@@ -314,16 +327,17 @@ class Installer:
 			device_handler.mount(dev_path, mountpoint, options=options)
 
 	def generate_key_files(self) -> None:
-		match self._disk_encryption.encryption_type:
-			case EncryptionType.Luks:
-				self._generate_key_files_partitions()
-			case EncryptionType.LuksOnLvm:
-				self._generate_key_file_lvm_volumes()
-			case EncryptionType.LvmOnLuks:
-				# currently LvmOnLuks only supports a single
-				# partitioning layout (boot + partition)
-				# so we won't need any keyfile generation atm
-				pass
+		with phase('generate_key_files', encryption=self._disk_encryption.encryption_type.value):
+			match self._disk_encryption.encryption_type:
+				case EncryptionType.Luks:
+					self._generate_key_files_partitions()
+				case EncryptionType.LuksOnLvm:
+					self._generate_key_file_lvm_volumes()
+				case EncryptionType.LvmOnLuks:
+					# currently LvmOnLuks only supports a single
+					# partitioning layout (boot + partition)
+					# so we won't need any keyfile generation atm
+					pass
 
 	def _generate_key_files_partitions(self) -> None:
 		for part_mod in self._disk_encryption.partitions:
@@ -333,6 +347,7 @@ class Installer:
 				part_mod.safe_dev_path,
 				mapper_name=part_mod.mapper_name,
 				password=self._disk_encryption.encryption_password,
+				performance=self._disk_encryption.luks_performance,
 			)
 
 			if gen_enc_file and not part_mod.is_root():
@@ -356,6 +371,7 @@ class Installer:
 				vol.safe_dev_path,
 				mapper_name=vol.mapper_name,
 				password=self._disk_encryption.encryption_password,
+				performance=self._disk_encryption.luks_performance,
 			)
 
 			if gen_enc_file and not vol.is_root():
@@ -371,7 +387,36 @@ class Installer:
 							self._disk_encryption.encryption_password,
 						)
 
+	def configure_luks_performance(self) -> None:
+		"""
+		Opens the encrypted devices the initrd unlocks with the same discard
+		and work queue flags that were used during the installation
+		"""
+		devices: list[PartitionModification | LvmVolume] = [*self._disk_encryption.partitions, *self._disk_encryption.lvm_volumes]
+
+		for dev in devices:
+			if not dev.mapper_name:
+				continue
+
+			# devices with a key file are unlocked through crypttab, their entry carries the flags already,
+			# LvmOnLuks has a single container that the initrd unlocks
+			if self._disk_encryption.encryption_type != EncryptionType.LvmOnLuks and self._disk_encryption.should_generate_encryption_file(dev):
+				continue
+
+			flags = LuksPerformanceFlags.resolve(self._disk_encryption.luks_performance, dev.safe_dev_path)
+
+			if options := flags.nix_options():
+				debug(f'luks2 performance flags for {dev.mapper_name}: {options}')
+				uuid = self._get_luks_uuid_from_mapper_dev(Path(f'/dev/mapper/{dev.mapper_name}'))
+
+				NixosConfig().set(
+					f'boot.initrd.luks.devices."{dev.mapper_name}"',
+					{'device': f'/dev/disk/by-uuid/{uuid}', **options},
+				)
+
 	def sync_log_to_install_medium(self) -> bool:
+		logger.flush()
+
 		# Copy over the install log (if there is one) to the install medium if
 		# at least the base has been strapped in, otherwise we won't have a filesystem/structure to copy to.
 		if self._helper_flags.get('base-strapped', False) is True:
@@ -528,57 +573,58 @@ class Installer:
 		hostname: str | None = None,
 		locale_config: LocaleConfiguration | None = LocaleConfiguration.default(),
 	) -> None:
-		if self._disk_config.lvm_config:
-			lvm = 'lvm2'
-			self._packages.append(lvm)
-
-			for vg in self._disk_config.lvm_config.vol_groups:
-				for vol in vg.volumes:
-					if vol.fs_type is not None:
-						self._prepare_fs_type(vol.fs_type, vol.mountpoint)
-
-			types = (EncryptionType.LvmOnLuks, EncryptionType.LuksOnLvm)
-			if self._disk_encryption.encryption_type in types:
-				self._prepare_encrypt(lvm)
-		else:
-			for mod in self._disk_config.device_modifications:
-				for part in mod.partitions:
-					if part.fs_type is None:
-						continue
-
-					self._prepare_fs_type(part.fs_type, part.mountpoint)
-
-					if part in self._disk_encryption.partitions:
-						self._prepare_encrypt()
-
-		if ucode := self._get_microcode():
-			(self.target / 'boot' / ucode).unlink(missing_ok=True)
-			self._packages.append(ucode.stem)
-		else:
-			debug('nixinstall will not install any ucode.')
-
-		self._helper_flags['base-strapped'] = True
-
-		# Periodic TRIM may improve the performance and longevity of SSDs whilst
-		# having no adverse effect on other devices. Most distributions enable
-		# periodic TRIM by default.
-		self.set_periodic_trim(self._enable_fstrim)
-
-		# TODO: Support locale and timezone
-		# os.remove(f'{self.target}/etc/localtime')
-		# sys_command(f'arch-chroot {self.target} ln -s /usr/share/zoneinfo/{localtime} /etc/localtime')
-		# sys_command('arch-chroot /mnt hwclock --hctosys --localtime')
-		if hostname:
-			self.set_hostname(hostname)
-
-		if locale_config:
-			self.set_locale(locale_config)
-			self.set_keyboard_language(locale_config.kb_layout)
-
-		# TODO: Use python functions for this
-		SysCommand(f'arch-chroot {self.target} chmod 700 /root')
-
-		self._helper_flags['base'] = True
+		with phase('minimal_installation', hostname=hostname):
+			if self._disk_config.lvm_config:
+				lvm = 'lvm2'
+				self._packages.append(lvm)
+
+				for vg in self._disk_config.lvm_config.vol_groups:
+					for vol in vg.volumes:
+						if vol.fs_type is not None:
+							self._prepare_fs_type(vol.fs_type, vol.mountpoint)
+
+				types = (EncryptionType.LvmOnLuks, EncryptionType.LuksOnLvm)
+				if self._disk_encryption.encryption_type in types:
+					self._prepare_encrypt(lvm)
+			else:
+				for mod in self._disk_config.device_modifications:
+					for part in mod.partitions:
+						if part.fs_type is None:
+							continue
+
+						self._prepare_fs_type(part.fs_type, part.mountpoint)
+
+						if part in self._disk_encryption.partitions:
+							self._prepare_encrypt()
+
+			if ucode := self._get_microcode():
+				(self.target / 'boot' / ucode).unlink(missing_ok=True)
+				self._packages.append(ucode.stem)
+			else:
+				debug('nixinstall will not install any ucode.')
+
+			self._helper_flags['base-strapped'] = True
+
+			# Periodic TRIM may improve the performance and longevity of SSDs whilst
+			# having no adverse effect on other devices. Most distributions enable
+			# periodic TRIM by default.
+			self.set_periodic_trim(self._enable_fstrim)
+
+			# TODO: Support locale and timezone
+			# os.remove(f'{self.target}/etc/localtime')
+			# sys_command(f'arch-chroot {self.target} ln -s /usr/share/zoneinfo/{localtime} /etc/localtime')
+			# sys_command('arch-chroot /mnt hwclock --hctosys --localtime')
+			if hostname:
+				self.set_hostname(hostname)
+
+			if locale_config:
+				self.set_locale(locale_config)
+				self.set_keyboard_language(locale_config.kb_layout)
+
+			# TODO: Use python functions for this
+			SysCommand(f'arch-chroot {self.target} chmod 700 /root')
+
+			self._helper_flags['base'] = True
 
 	def setup_btrfs_snapshot(
 		self,
@@ -593,11 +639,12 @@ class Installer:
 			# TODO: add timeshift timer
 
 	def setup_swap(self, kind: str = 'zram') -> None:
-		if kind == 'zram':
-			# TODO: zramSwap.enable
-			self._zram_enabled = True
-		else:
-			raise ValueError('nixinstall currently only supports setting up swap on zram')
+		with phase('setup_swap', kind=kind):
+			if kind == 'zram':
+				# TODO: zramSwap.enable
+				self._zram_enabled = True
+			else:
+				raise ValueError('nixinstall currently only supports setting up swap on zram')
 
 	def _get_efi_partition(self) -> PartitionModification | None:
 		for layout in self._disk_config.device_modifications:
@@ -790,30 +837,31 @@ class Installer:
 		:param bootloader: Type of bootloader to be added
 		"""
 
-		efi_partition = self._get_efi_partition()
-		boot_partition = self._get_boot_partition()
-		root = self._get_root()
+		with phase('add_bootloader', bootloader=bootloader.value, uki=uki_enabled):
+			efi_partition = self._get_efi_partition()
+			boot_partition = self._get_boot_partition()
+			root = self._get_root()
 
-		if boot_partition is None:
-			raise ValueError(f'Could not detect boot at mountpoint {self.target}')
+			if boot_partition is None:
+				raise ValueError(f'Could not detect boot at mountpoint {self.target}')
 
-		if root is None:
-			raise ValueError(f'Could not detect root at mountpoint {self.target}')
+			if root is None:
+				raise ValueError(f'Could not detect root at mountpoint {self.target}')
 
-		info(f'Adding bootloader {bootloader.value} to {boot_partition.dev_path}')
+			info(f'Adding bootloader {bootloader.value} to {boot_partition.dev_path}')
 
-		if uki_enabled:
-			self._config_uki(root, efi_partition)
+			if uki_enabled:
+				self._config_uki(root, efi_partition)
 
-		match bootloader:
-			case Bootloader.Systemd:
-				self._add_systemd_bootloader(boot_partition, root, efi_partition, uki_enabled)
-			case Bootloader.Grub:
-				self._add_grub_bootloader(boot_partition, root, efi_partition)
-			case Bootloader.Efistub:
-				self._add_efistub_bootloader(boot_partition, root, uki_enabled)
-			case Bootloader.Limine:
-				self._add_limine_bootloader(boot_partition, efi_partition, root, uki_enabled)
+			match bootloader:
+				case Bootloader.Systemd:
+					self._add_systemd_bootloader(boot_partition, root, efi_partition, uki_enabled)
+				case Bootloader.Grub:
+					self._add_grub_bootloader(boot_partition, root, efi_partition)
+				case Bootloader.Efistub:
+					self._add_efistub_bootloader(boot_partition, root, uki_enabled)
+				case Bootloader.Limine:
+					self._add_limine_bootloader(boot_partition, efi_partition, root, uki_enabled)
 
 	def add_additional_package(self, package: str) -> None:
 		return self.add_additional_packages([package])
@@ -829,8 +877,9 @@ class Installer:
 		if not isinstance(users, list):
 			users = [users]
 
-		for user in users:
-			self._create_user(user)
+		with phase('create_users', count=len(users)):
+			for user in users:
+				self._create_user(user)
 
 	def _create_user(self, user: User) -> None:
 		info(f'Creating user {user.username}')
@@ -15,6 +15,7 @@ def list_keyboard_languages() -> list[str]:
 		SysCommand(
 			'localectl --no-pager list-keymaps',
 			environment_vars={'SYSTEMD_COLORS': '0', 'SYSTEMD_KEYMAP_DIRECTORIES': keymap_directory},
+			use_pty=False,
 		)
 		.decode()
 		.splitlines()
@@ -31,6 +32,7 @@ def list_locales() -> list[str]:
 		SysCommand(
 			'localectl --no-pager list-locales',
 			environment_vars={'SYSTEMD_COLORS': '0', 'LOCALE_ARCHIVE': locale_archive},
+			use_pty=False,
 		)
 		.decode()
 		.splitlines()
@@ -44,6 +46,7 @@ def list_x11_keyboard_languages() -> list[str]:
 		SysCommand(
 			'localectl --no-pager list-x11-keymap-layouts',
 			environment_vars={'SYSTEMD_COLORS': '0'},
+			use_pty=False,
 		)
 		.decode()
 		.splitlines()
@@ -117,6 +120,7 @@ def list_timezones() -> list[str]:
 		SysCommand(
 			'timedatectl --no-pager list-timezones',
 			environment_vars={'SYSTEMD_COLORS': '0'},
+			use_pty=False,
 		)
 		.decode()
 		.splitlines()
@@ -1,19 +1,138 @@
 from __future__ import annotations
 
+import json
+import os
+import re
 import shlex
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, replace
+from functools import cache
 from pathlib import Path
 from subprocess import CalledProcessError
 from types import TracebackType
 
-from nixinstall.lib.disk.utils import get_lsblk_info, umount
-from nixinstall.lib.models.device_model import DEFAULT_ITER_TIME
+from nixinstall.lib.disk.sysfs import DeviceClass, storage_info
+from nixinstall.lib.disk.utils import get_lsblk_info, umount_all
+from nixinstall.lib.models.device_model import DEFAULT_ITER_TIME, LuksParameters, LuksPerformance
 
 from .exceptions import DiskError, SysCallError
 from .general import SysCommand, SysCommandWorker, generate_password, run
+from .hardware import SysInfo
 from .models.users import Password
 from .output import debug, info
 
+# what cryptsetup caps the argon2 memory cost at by default, in KiB
+DEFAULT_PBKDF_MEMORY = 1024 * 1024
+# share of the available memory parallel unlocks may use, the rest is left to the live system
+UNLOCK_MEMORY_SHARE = 0.5
+# share of the total memory a single key derivation may use once calibrated
+CALIBRATED_MEMORY_SHARE = 0.25
+# how much faster a shorter key has to be to be preferred over a 512 bit one
+SHORT_KEY_SPEEDUP = 1.25
+# /run is a tmpfs, so the benchmark is measured once per boot
+BENCHMARK_CACHE = Path('/run/nixinstall/cryptsetup-benchmark.json')
+
+# key files are 512 random characters, stretching them buys nothing
+KEY_FILE_PBKDF_ITERATIONS = 1000
+
+_KEY_SLOT_CREATED = re.compile(r'^Key slot (?P<slot>\d+) created\.', re.MULTILINE)
+
+#         aes-xts        512b      3405.4 MiB/s      3412.3 MiB/s
+_CIPHER_BENCHMARK = re.compile(r'^\s*(?P<cipher>[\w-]+)\s+(?P<key_size>\d+)b\s+(?P<encryption>[\d.]+) MiB/s\s+(?P<decryption>[\d.]+) MiB/s')
+# argon2id      6 iterations, 1048576 memory, 4 parallel threads (CPUs) for 256-bit key (requested 2000 ms time)
+_ARGON2ID_BENCHMARK = re.compile(r'^argon2id\s+\d+ iterations, (?P<memory>\d+) memory, (?P<parallel>\d+) parallel threads')
+
+
+@dataclass
+class CipherBenchmark:
+	cipher: str
+	key_size: int
+	# MiB/s
+	encryption: float
+	decryption: float
+
+	@property
+	def throughput(self) -> float:
+		return min(self.encryption, self.decryption)
+
+
+@dataclass
+class CryptsetupBenchmark:
+	ciphers: list[CipherBenchmark]
+	# the argon2id cost cryptsetup settled on for this machine, memory in KiB
+	pbkdf_memory: int | None = None
+	pbkdf_parallel: int | None = None
+
+	@classmethod
+	def parse(cls, output: str) -> CryptsetupBenchmark:
+		benchmark = CryptsetupBenchmark([])
+
+		for line in output.splitlines():
+			if match := _CIPHER_BENCHMARK.match(line):
+				benchmark.ciphers.append(
+					CipherBenchmark(
+						match.group('cipher'),
+						int(match.group('key_size')),
+						float(match.group('encryption')),
+						float(match.group('decryption')),
+					)
+				)
+			elif match := _ARGON2ID_BENCHMARK.match(line):
+				benchmark.pbkdf_memory = int(match.group('memory'))
+				benchmark.pbkdf_parallel = int(match.group('parallel'))
+
+		return benchmark
+
+
+@dataclass(frozen=True)
+class LuksPerformanceFlags:
+	allow_discards: bool = False
+	# skipping the dm-crypt work queues only pays off on fast, low latency storage
+	bypass_workqueues: bool = False
+
+	@classmethod
+	def resolve(cls, performance: LuksPerformance, dev_path: Path) -> LuksPerformanceFlags:
+		match performance:
+			case LuksPerformance.On:
+				return LuksPerformanceFlags(True, True)
+			case LuksPerformance.Off:
+				return LuksPerformanceFlags()
+
+		storage = storage_info(dev_path)
+
+		if storage is None or storage.device_class == DeviceClass.Hdd:
+			return LuksPerformanceFlags()
+
+		return LuksPerformanceFlags(storage.discard, storage.device_class == DeviceClass.Nvme)
+
+	def open_args(self) -> list[str]:
+		args = []
+
+		if self.allow_discards:
+			args += ['--allow-discards']
+
+		if self.bypass_workqueues:
+			args += ['--perf-no_read_workqueue', '--perf-no_write_workqueue']
+
+		return args
+
+	def crypttab_options(self) -> list[str]:
+		options = []
+
+		if self.allow_discards:
+			options += ['discard']
+
+		if self.bypass_workqueues:
+			options += ['no-read-workqueue', 'no-write-workqueue']
+
+		return options
+
+	def nix_options(self) -> dict[str, bool]:
+		"""
+		The ``boot.initrd.luks.devices.<name>`` options that are turned on
+		"""
+		options = {'allowDiscards': self.allow_discards, 'bypassWorkqueues': self.bypass_workqueues}
+		return {key: value for key, value in options.items() if value}
+
 
 @dataclass
 class Luks2:
@@ -22,6 +141,7 @@ class Luks2:
 	password: Password | None = None
 	key_file: Path | None = None
 	auto_unmount: bool = False
+	performance: LuksPerformance = LuksPerformance.Off
 
 	@property
 	def mapper_dev(self) -> Path | None:
@@ -29,6 +149,9 @@ class Luks2:
 			return Path(f'/dev/mapper/{self.mapper_name}')
 		return None
 
+	def performance_flags(self) -> LuksPerformanceFlags:
+		return LuksPerformanceFlags.resolve(self.performance, self.luks_dev_path)
+
 	def isLuks(self) -> bool:
 		try:
 			SysCommand(f'cryptsetup isLuks {self.luks_dev_path}')
@@ -75,14 +198,23 @@ class Luks2:
 
 	def encrypt(
 		self,
-		key_size: int = 512,
 		hash_type: str = 'sha512',
 		iter_time: int = DEFAULT_ITER_TIME,
 		key_file: Path | None = None,
+		parameters: LuksParameters | None = None,
 	) -> Path | None:
 		debug(f'Luks2 encrypting: {self.luks_dev_path}')
 
 		key_file_arg, passphrase = self._get_passphrase_args(key_file)
+		parameters = parameters or LuksParameters()
+
+		pbkdf_args = []
+
+		if parameters.pbkdf_memory:
+			pbkdf_args += ['--pbkdf-memory', str(parameters.pbkdf_memory)]
+
+		if parameters.pbkdf_parallel:
+			pbkdf_args += ['--pbkdf-parallel', str(parameters.pbkdf_parallel)]
 
 		cmd = [
 			'cryptsetup',
@@ -90,12 +222,15 @@ class Luks2:
 			'--verbose',
 			'--type',
 			'luks2',
+			'--cipher',
+			parameters.cipher,
 			'--pbkdf',
 			'argon2id',
+			*pbkdf_args,
 			'--hash',
 			hash_type,
 			'--key-size',
-			str(key_size),
+			str(parameters.key_size),
 			'--iter-time',
 			str(iter_time),
 			*key_file_arg,
@@ -130,6 +265,21 @@ class Luks2:
 	def is_unlocked(self) -> bool:
 		return (mapper_dev := self.mapper_dev) is not None and mapper_dev.is_symlink()
 
+	def pbkdf_memory(self) -> int | None:
+		"""
+		Memory in KiB the key derivation of the most expensive keyslot needs,
+		as stored in the LUKS2 header, or None if the header couldn't be read
+		"""
+		try:
+			output = SysCommand(['cryptsetup', 'luksDump', '--dump-json-metadata', str(self.luks_dev_path)], use_pty=False).decode()
+			metadata = json.loads(output)
+		except (SysCallError, ValueError) as err:
+			debug(f'Unable to read the luks2 header of {self.luks_dev_path}: {err}')
+			return None
+
+		# pbkdf2 keyslots don't have a memory cost
+		return max((slot.get('kdf', {}).get('memory', 0) for slot in metadata.get('keyslots', {}).values()), default=0)
+
 	def unlock(self, key_file: Path | None = None) -> None:
 		"""
 		Unlocks the luks device, an optional key file location for unlocking can be specified,
@@ -151,6 +301,7 @@ class Luks2:
 			str(self.luks_dev_path),
 			str(self.mapper_name),
 			*key_file_arg,
+			*self.performance_flags().open_args(),
 			'--type',
 			'luks2',
 		]
@@ -163,19 +314,14 @@ class Luks2:
 			raise DiskError(f'Failed to open luks2 device: {self.luks_dev_path}')
 
 	def lock(self) -> None:
-		umount(self.luks_dev_path)
-
 		# Get crypt-information about the device by doing a reverse lookup starting with the partition path
 		# For instance: /dev/sda
 		lsblk_info = get_lsblk_info(self.luks_dev_path)
 
-		# For each child (sub-partition/sub-device)
-		for child in lsblk_info.children:
-			# Unmount the child location
-			for mountpoint in child.mountpoints:
-				debug(f'Unmounting {mountpoint}')
-				umount(mountpoint, recursive=True)
+		# Unmount the device and everything mounted from its children (sub-partitions/sub-devices) in one pass
+		umount_all([self.luks_dev_path, *(child.path for child in lsblk_info.children)], recursive=True)
 
+		for child in lsblk_info.children:
 			# And close it if possible.
 			debug(f'Closing crypt device {child.name}')
 			SysCommand(f'cryptsetup close {child.name}')
@@ -207,23 +353,40 @@ class Luks2:
 
 		key_file.chmod(0o400)
 
-		self._add_key(key_file)
-		self._crypttab(crypttab_path, kf_path, options=['luks', 'key-slot=1'])
+		slot = self.add_key_file(key_file)
+		self._crypttab(crypttab_path, kf_path, options=['luks', f'key-slot={slot}', *self.performance_flags().crypttab_options()])
 
-	def _add_key(self, key_file: Path) -> None:
+	def add_key_file(self, key_file: Path) -> int:
+		"""
+		Enrolls a key file into a new keyslot and returns the slot it got.
+		The passphrase goes over stdin. Key files are random, so their
+		slots use pbkdf2 and skip the expensive argon2id.
+		"""
 		debug(f'Adding additional key-file {key_file}')
 
-		command = f'cryptsetup -q -v luksAddKey {self.luks_dev_path} {key_file}'
-		worker = SysCommandWorker(command)
-		pw_injected = False
+		cmd = [
+			'cryptsetup',
+			'luksAddKey',
+			'--batch-mode',
+			'--verbose',
+			'--key-file=-',
+			'--pbkdf',
+			'pbkdf2',
+			'--pbkdf-force-iterations',
+			str(KEY_FILE_PBKDF_ITERATIONS),
+			str(self.luks_dev_path),
+			str(key_file),
+		]
+
+		try:
+			output = run(cmd, input_data=self._password_bytes()).stdout.decode()
+		except CalledProcessError as err:
+			raise DiskError(f'Could not add encryption key {key_file} to {self.luks_dev_path}: {err.stdout.decode().rstrip()}')
 
-		while worker.is_alive():
-			if b'Enter any existing passphrase' in worker and pw_injected is False:
-				worker.write(self._password_bytes())
-				pw_injected = True
+		if (match := _KEY_SLOT_CREATED.search(output)) is None:
+			raise DiskError(f'cryptsetup did not report the keyslot of {key_file}: {output.rstrip()}')
 
-		if worker.exit_code != 0:
-			raise DiskError(f'Could not add encryption key {key_file} to {self.luks_dev_path}: {worker.decode()}')
+		return int(match.group('slot'))
 
 	def _crypttab(
 		self,
@@ -238,3 +401,88 @@ class Luks2:
 			uuid = self._get_luks_uuid()
 			row = f'{self.mapper_name} UUID={uuid} {key_file} {opt}\n'
 			crypttab.write(row)
+
+
+def max_parallel_unlocks(luks_handlers: list[Luks2]) -> int:
+	"""
+	How many of the devices can be unlocked at the same time. Every argon2
+	key derivation holds its full memory cost until it's done, so the limit
+	follows from the available memory and the most expensive header.
+	"""
+	if len(luks_handlers) <= 1:
+		return 1
+
+	memory = [handler.pbkdf_memory() for handler in luks_handlers]
+	pbkdf_memory = max(DEFAULT_PBKDF_MEMORY if mem is None else mem for mem in memory)
+
+	if pbkdf_memory <= 0:
+		limit = len(luks_handlers)
+	else:
+		limit = int(SysInfo.mem_available() * UNLOCK_MEMORY_SHARE // pbkdf_memory)
+
+	return max(1, min(len(luks_handlers), limit, os.cpu_count() or 1))
+
+
+@cache
+def cryptsetup_benchmark() -> CryptsetupBenchmark:
+	"""
+	Runs ``cryptsetup benchmark``, or reads the result of an earlier run during this boot
+	"""
+	try:
+		cached = json.loads(BENCHMARK_CACHE.read_text())
+		return CryptsetupBenchmark(
+			[CipherBenchmark(**cipher) for cipher in cached['ciphers']],
+			cached['pbkdf_memory'],
+			cached['pbkdf_parallel'],
+		)
+	except (OSError, ValueError, KeyError, TypeError):
+		pass
+
+	debug('Running cryptsetup benchmark')
+	benchmark = CryptsetupBenchmark.parse(SysCommand(['cryptsetup', 'benchmark'], use_pty=False).decode())
+
+	try:
+		BENCHMARK_CACHE.parent.mkdir(parents=True, exist_ok=True)
+		BENCHMARK_CACHE.write_text(json.dumps(asdict(benchmark)))
+	except OSError as err:
+		debug(f'Unable to cache the cryptsetup benchmark: {err}')
+
+	return benchmark
+
+
+def calibrate_luks_parameters() -> LuksParameters:
+	"""
+	Picks the fastest XTS cipher this machine offers, and an argon2id cost that
+	fits its memory. The iteration time still decides how long an unlock takes.
+	"""
+	try:
+		benchmark = cryptsetup_benchmark()
+	except SysCallError as err:
+		debug(f'cryptsetup benchmark failed, using the default parameters: {err}')
+		return LuksParameters()
+
+	flags = SysInfo.cpu_flags()
+	debug(f'Calibrating luks2, cpu acceleration: {[flag for flag in ["aes", "vaes", "avx512f"] if flag in flags]}')
+
+	candidates = [c for c in benchmark.ciphers if c.cipher.endswith('-xts')]
+
+	# with AES-NI nothing beats AES, other results would only be noise
+	if 'aes' in flags:
+		candidates = [c for c in candidates if c.cipher.startswith('aes-')] or candidates
+
+	parameters = LuksParameters()
+
+	if candidates:
+		best = max(candidates, key=lambda c: c.throughput if c.key_size >= 512 else c.throughput / SHORT_KEY_SPEEDUP)
+		parameters = LuksParameters(f'{best.cipher}-plain64', best.key_size)
+
+	pbkdf_memory = int(SysInfo.mem_total() * CALIBRATED_MEMORY_SHARE)
+
+	if benchmark.pbkdf_memory:
+		pbkdf_memory = min(pbkdf_memory, benchmark.pbkdf_memory)
+
+	return replace(
+		parameters,
+		pbkdf_memory=pbkdf_memory,
+		pbkdf_parallel=benchmark.pbkdf_parallel or min(4, os.cpu_count() or 1),
+	)
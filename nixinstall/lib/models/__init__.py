@@ -16,6 +16,8 @@ from .device_model import (
 	Fido2Device,
 	FilesystemType,
 	LsblkInfo,
+	LuksParameters,
+	LuksPerformance,
 	LvmConfiguration,
 	LvmLayoutType,
 	LvmVolume,
@@ -56,6 +58,8 @@ __all__ = [
 	'LocalPackage',
 	'LocaleConfiguration',
 	'LsblkInfo',
+	'LuksParameters',
+	'LuksPerformance',
 	'LvmConfiguration',
 	'LvmLayoutType',
 	'LvmVolume',
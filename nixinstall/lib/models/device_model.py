@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import math
 import uuid
+from collections.abc import Callable
 from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
@@ -500,7 +501,18 @@ class _PartitionInfo:
 	uuid: str | None
 	disk: Disk
 	mountpoints: list[Path]
-	btrfs_subvol_infos: list[_BtrfsSubvolumeInfo] = field(default_factory=list)
+	btrfs_subvol_loader: Callable[[], list[_BtrfsSubvolumeInfo]] | None = field(default=None, repr=False, compare=False)
+	_btrfs_subvol_infos: list[_BtrfsSubvolumeInfo] | None = field(default=None, init=False, repr=False, compare=False)
+
+	@property
+	def btrfs_subvol_infos(self) -> list[_BtrfsSubvolumeInfo]:
+		"""
+		Subvolumes of a btrfs partition, only discovered on first access
+		"""
+		if self._btrfs_subvol_infos is None:
+			self._btrfs_subvol_infos = self.btrfs_subvol_loader() if self.btrfs_subvol_loader else []
+
+		return self._btrfs_subvol_infos
 
 	@property
 	def sector_size(self) -> SectorSize:
@@ -532,7 +544,7 @@ class _PartitionInfo:
 		partition: Partition,
 		lsblk_info: LsblkInfo,
 		fs_type: FilesystemType | None,
-		btrfs_subvol_infos: list[_BtrfsSubvolumeInfo] = [],
+		btrfs_subvol_loader: Callable[[], list[_BtrfsSubvolumeInfo]] | None = None,
 	) -> _PartitionInfo:
 		partition_type = PartitionType.get_type_from_code(partition.type)
 		flags = [f for f in PartitionFlag if partition.getFlag(f.flag_id)]
@@ -563,7 +575,7 @@ class _PartitionInfo:
 			uuid=lsblk_info.uuid,
 			disk=partition.disk,
 			mountpoints=lsblk_info.mountpoints,
-			btrfs_subvol_infos=btrfs_subvol_infos,
+			btrfs_subvol_loader=btrfs_subvol_loader,
 		)
 
 
@@ -1441,12 +1453,78 @@ class EncryptionType(Enum):
 		return type_to_text[type_]
 
 
+class LuksPerformance(Enum):
+	"""
+	Whether dm-crypt passes discards through and skips its work queues,
+	on Auto that's decided per device from the underlying storage
+	"""
+
+	Auto = 'auto'
+	On = 'on'
+	Off = 'off'
+
+
+class _LuksParametersSerialization(TypedDict):
+	cipher: str
+	key_size: int
+	pbkdf_memory: NotRequired[int]
+	pbkdf_parallel: NotRequired[int]
+
+
+@dataclass(frozen=True)
+class LuksParameters:
+	"""
+	Cipher and argon2id settings used when formatting a LUKS2 device,
+	unset pbkdf values are left for cryptsetup to decide
+	"""
+
+	cipher: str = 'aes-xts-plain64'
+	key_size: int = 512
+	# KiB
+	pbkdf_memory: int | None = None
+	pbkdf_parallel: int | None = None
+
+	def preview(self) -> str:
+		output = f'{self.cipher} ({self.key_size} bit key)'
+
+		if self.pbkdf_memory and self.pbkdf_parallel:
+			memory = Size(self.pbkdf_memory, Unit.KiB, SectorSize.default())
+			output += f', argon2id with {memory.format_highest()} and {self.pbkdf_parallel} threads'
+
+		return output
+
+	def json(self) -> _LuksParametersSerialization:
+		obj: _LuksParametersSerialization = {
+			'cipher': self.cipher,
+			'key_size': self.key_size,
+		}
+
+		if self.pbkdf_memory:
+			obj['pbkdf_memory'] = self.pbkdf_memory
+
+		if self.pbkdf_parallel:
+			obj['pbkdf_parallel'] = self.pbkdf_parallel
+
+		return obj
+
+	@classmethod
+	def parse_arg(cls, arg: _LuksParametersSerialization) -> LuksParameters:
+		return LuksParameters(
+			arg['cipher'],
+			arg['key_size'],
+			arg.get('pbkdf_memory'),
+			arg.get('pbkdf_parallel'),
+		)
+
+
 class _DiskEncryptionSerialization(TypedDict):
 	encryption_type: str
 	partitions: list[str]
 	lvm_volumes: list[str]
 	hsm_device: NotRequired[_Fido2DeviceSerialization]
 	iter_time: NotRequired[int]
+	luks_parameters: NotRequired[_LuksParametersSerialization]
+	luks_performance: NotRequired[str]
 
 
 @dataclass
@@ -1457,6 +1535,10 @@ class DiskEncryption:
 	lvm_volumes: list[LvmVolume] = field(default_factory=list)
 	hsm_device: Fido2Device | None = None
 	iter_time: int = DEFAULT_ITER_TIME
+	# None formats with cryptsetup's built-in defaults
+	luks_parameters: LuksParameters | None = None
+	# discards reveal which blocks of the device are unused, so they are opt-in
+	luks_performance: LuksPerformance = LuksPerformance.Off
 
 	def __post_init__(self) -> None:
 		if self.encryption_type in [EncryptionType.Luks, EncryptionType.LvmOnLuks] and not self.partitions:
@@ -1484,6 +1566,12 @@ class DiskEncryption:
 		if self.iter_time != DEFAULT_ITER_TIME:  # Only include if not default
 			obj['iter_time'] = self.iter_time
 
+		if self.luks_parameters:
+			obj['luks_parameters'] = self.luks_parameters.json()
+
+		if self.luks_performance != LuksPerformance.Off:
+			obj['luks_performance'] = self.luks_performance.value
+
 		return obj
 
 	@classmethod
@@ -1542,6 +1630,12 @@ class DiskEncryption:
 		if iter_time := disk_encryption.get('iter_time', None):
 			enc.iter_time = iter_time
 
+		if luks_parameters := disk_encryption.get('luks_parameters', None):
+			enc.luks_parameters = LuksParameters.parse_arg(luks_parameters)
+
+		if luks_performance := disk_encryption.get('luks_performance', None):
+			enc.luks_performance = LuksPerformance(luks_performance)
+
 		return enc
 
 
@@ -1582,6 +1676,7 @@ class Fido2Device:
 
 class LsblkInfo(BaseModel):
 	name: str
+	kname: str
 	path: Path
 	pkname: str | None
 	log_sec: int = Field(alias='log-sec')
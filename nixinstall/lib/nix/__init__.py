@@ -3,4 +3,4 @@ from ..general import SysCommand
 
 # returns outpath
 def nix_build(package_name: str) -> str:
-	return SysCommand(['nix-build', '<nixpkgs>', '--no-out-link', '-A', package_name]).decode().splitlines()[0]
+	return SysCommand(['nix-build', '<nixpkgs>', '--no-out-link', '-A', package_name], use_pty=False).decode().splitlines()[0]
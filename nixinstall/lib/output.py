@@ -1,12 +1,19 @@
+import atexit
+import itertools
+import json
 import logging
 import os
 import sys
-from collections.abc import Callable
-from dataclasses import asdict, is_dataclass
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import asdict, dataclass, is_dataclass
 from datetime import UTC, datetime
 from enum import Enum
 from pathlib import Path
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, TextIO, override
 
 from .utils.unicode import unicode_ljust, unicode_rjust
 
@@ -128,27 +135,78 @@ class FormattedOutput:
 		return output
 
 
-class Journald:
-	@staticmethod
-	def log(message: str, level: int = logging.DEBUG) -> None:
-		try:
-			import systemd.journal  # type: ignore[import-not-found]
-		except ModuleNotFoundError:
-			return None
+class LogSink(metaclass=ABCMeta):
+	"""
+	A destination for log records, ``log()`` fans every message out to the active sinks
+	"""
+
+	@abstractmethod
+	def emit(self, level: int, content: str) -> None:
+		pass
 
-		log_adapter = logging.getLogger('nixinstall')
-		log_fmt = logging.Formatter('[%(levelname)s]: %(message)s')
-		log_ch = systemd.journal.JournalHandler()
-		log_ch.setFormatter(log_fmt)
-		log_adapter.addHandler(log_ch)
-		log_adapter.setLevel(logging.DEBUG)
+	def flush(self) -> None:
+		pass
 
-		log_adapter.log(level, message)
 
+class Journald(LogSink):
+	"""
+	Forwards log records to the systemd journal when python-systemd is available.
+	The import is attempted once and the handler is set up once, on the first record.
+	"""
+
+	def __init__(self) -> None:
+		self._lock = threading.Lock()
+		self._logger: logging.Logger | None = None
+		self._initialized = False
+
+	@property
+	def available(self) -> bool:
+		return self._get_logger() is not None
+
+	def _get_logger(self) -> logging.Logger | None:
+		if self._initialized:
+			return self._logger
+
+		with self._lock:
+			if not self._initialized:
+				try:
+					import systemd.journal  # type: ignore[import-not-found]
+				except ModuleNotFoundError:
+					pass
+				else:
+					handler = systemd.journal.JournalHandler(SYSLOG_IDENTIFIER='nixinstall')
+					handler.setFormatter(logging.Formatter('[%(levelname)s]: %(message)s'))
+
+					self._logger = logging.getLogger('nixinstall.journald')
+					self._logger.handlers = [handler]
+					self._logger.setLevel(logging.DEBUG)
+					self._logger.propagate = False
+
+				self._initialized = True
+
+		return self._logger
+
+	@override
+	def emit(self, level: int, content: str) -> None:
+		if journal_logger := self._get_logger():
+			journal_logger.log(level, content)
+
+
+class Logger(LogSink):
+	"""
+	Owns the log files in the log directory. Every file is opened once and
+	kept open, install.log is line buffered while the bulkier command logs are
+	only flushed on ``flush()``, which happens at phase boundaries, on exit and on a crash.
+	"""
 
-class Logger:
 	def __init__(self, path: Path = Path('/var/log/nixinstall')) -> None:
 		self._path = path
+		self._files: dict[str, TextIO] = {}
+		self._lock = threading.RLock()
+		# the directory is checked before the first file gets opened, whichever file that is
+		self._checked = False
+
+		atexit.register(self.close)
 
 	@property
 	def path(self) -> Path:
@@ -169,20 +227,226 @@ class Logger:
 				f.write('')
 		except PermissionError:
 			# Fallback to creating the log file in the current folder
-			logger._path = Path('./').absolute()
+			self._path = Path('./').absolute()
+
+			warn(f'Not enough permission to place log file at {log_file}, creating it in {self.path} instead')
 
-			warn(f'Not enough permission to place log file at {log_file}, creating it in {logger.path} instead')
+	def _open(self, name: str, line_buffered: bool, truncate: bool, mode: int | None) -> TextIO | None:
+		if (handle := self._files.get(name)) is not None and not truncate:
+			return handle
+
+		if not self._checked:
+			self._check_permissions()
+			self._checked = True
+
+		path = self._path / name
+		created = truncate or not path.exists()
+
+		try:
+			if handle is not None:
+				handle.close()
+
+			handle = path.open('w' if truncate else 'a', buffering=1 if line_buffered else -1)
+
+			if created and mode is not None:
+				path.chmod(mode)
+		except (PermissionError, FileNotFoundError):
+			return None
+
+		self._files[name] = handle
+		return handle
+
+	def write(
+		self,
+		name: str,
+		content: str,
+		line_buffered: bool = True,
+		truncate: bool = False,
+		mode: int | None = None,
+	) -> None:
+		"""
+		Appends to the log file ``name`` in the log directory.
+		``truncate`` starts the file over, ``mode`` is applied when the file gets created.
+		"""
+		with self._lock:
+			if handle := self._open(name, line_buffered, truncate, mode):
+				handle.write(content)
+
+	@override
+	def flush(self) -> None:
+		with self._lock:
+			for handle in self._files.values():
+				try:
+					handle.flush()
+				except (OSError, ValueError):
+					pass
+
+	def close(self) -> None:
+		with self._lock:
+			self.flush()
+
+			for handle in self._files.values():
+				handle.close()
+
+			self._files.clear()
 
 	def log(self, level: int, content: str) -> None:
-		self._check_permissions()
+		ts = _timestamp()
+		level_name = logging.getLevelName(level)
+		self.write(self.path.name, f'[{ts}] - {level_name} - {content}\n')
 
-		with self.path.open('a') as f:
-			ts = _timestamp()
-			level_name = logging.getLevelName(level)
-			f.write(f'[{ts}] - {level_name} - {content}\n')
+	@override
+	def emit(self, level: int, content: str) -> None:
+		self.log(level, content)
 
 
 logger = Logger()
+journald = Journald()
+
+log_sinks: list[LogSink] = [logger, journald]
+
+
+def set_log_sinks(*sinks: LogSink) -> None:
+	"""
+	Selects the backends every log message is written to, by default
+	both the install.log file and the systemd journal.
+	"""
+	log_sinks[:] = sinks
+
+
+@dataclass
+class PhaseTiming:
+	phase: str
+	duration: str
+	status: str
+
+
+class EventLog:
+	"""
+	Structured event stream of the install, written as one JSON object per line to events.jsonl.
+	Spans carry a monotonic begin and end timestamp, the id of the span they are nested in
+	and free-form attributes such as device paths and sizes.
+	"""
+
+	def __init__(self, name: str = 'events.jsonl') -> None:
+		self._name = name
+		self._ids = itertools.count(1)
+		self._local = threading.local()
+		self._timings: list[tuple[int, int, str, float, bool]] = []
+
+	def _stack(self) -> list[int]:
+		if not hasattr(self._local, 'stack'):
+			self._local.stack = []
+		return self._local.stack
+
+	def current(self) -> tuple[int, ...]:
+		"""
+		The spans the calling thread is nested in, to be passed to ``inherit()`` in another thread
+		"""
+		return tuple(self._stack())
+
+	@contextmanager
+	def inherit(self, spans: tuple[int, ...]) -> Iterator[None]:
+		"""
+		Nests the spans the calling thread opens inside ``spans`` of another thread,
+		since every thread keeps its own stack and would start at the top level otherwise
+		"""
+		stack = self._stack()
+		self._local.stack = list(spans)
+
+		try:
+			yield
+		finally:
+			self._local.stack = stack
+
+	def _write(self, event: dict[str, Any]) -> None:
+		logger.write(self._name, json.dumps(event, default=str) + '\n')
+
+	def event(self, name: str, **attrs: Any) -> None:
+		"""
+		Records a single point in time inside the current span
+		"""
+		stack = self._stack()
+		self._write({'ts': time.monotonic(), 'type': 'event', 'name': name, 'parent': stack[-1] if stack else None, 'attrs': attrs})
+
+	@contextmanager
+	def span(self, name: str, **attrs: Any) -> Iterator[dict[str, Any]]:
+		"""
+		Wraps a phase of the install, the yielded dict can be
+		updated with attributes that are only known at the end
+		"""
+		stack = self._stack()
+		span_id = next(self._ids)
+		parent = stack[-1] if stack else None
+		depth = len(stack)
+
+		start = time.monotonic()
+		self._write({'ts': start, 'type': 'begin', 'id': span_id, 'name': name, 'parent': parent, 'depth': depth, 'attrs': attrs})
+		stack.append(span_id)
+
+		end_attrs: dict[str, Any] = {}
+		ok = False
+
+		try:
+			yield end_attrs
+			ok = True
+		finally:
+			stack.pop()
+			end = time.monotonic()
+			self._timings.append((span_id, depth, name, end - start, ok))
+			self._write(
+				{
+					'ts': end,
+					'type': 'end',
+					'id': span_id,
+					'name': name,
+					'parent': parent,
+					'depth': depth,
+					'duration': end - start,
+					'status': 'ok' if ok else 'error',
+					'attrs': end_attrs,
+				}
+			)
+
+	def timings(self) -> list[PhaseTiming]:
+		return [
+			PhaseTiming(
+				phase='  ' * depth + name,
+				duration=f'{duration:.2f}s',
+				status='ok' if ok else 'error',
+			)
+			for _, depth, name, duration, ok in sorted(self._timings)
+		]
+
+	def durations(self) -> dict[str, float]:
+		"""
+		Total seconds spent in each phase, summed over all spans of the same name
+		"""
+		totals: dict[str, float] = {}
+
+		for _, _, name, duration, _ in self._timings:
+			totals[name] = totals.get(name, 0.0) + duration
+
+		return totals
+
+	def summary(self) -> str:
+		"""
+		Table of the recorded phase durations, nested phases are indented below their parent
+		"""
+		if not self._timings:
+			return ''
+
+		return FormattedOutput.as_table(self.timings(), capitalize=True)
+
+
+event_log = EventLog()
+
+
+def phase(name: str, **attrs: Any) -> AbstractContextManager[dict[str, Any]]:
+	"""
+	Shorthand for ``event_log.span()``, e.g. ``with phase('create_users', count=2): ...``
+	"""
+	return event_log.span(name, **attrs)
 
 
 def _supports_color() -> bool:
@@ -323,15 +587,14 @@ def log(
 ) -> None:
 	text = ' '.join([str(x) for x in msgs])
 
-	logger.log(level, text)
+	for sink in log_sinks:
+		sink.emit(level, text)
 
 	# Attempt to colorize the output if supported
 	# Insert default colors and override with **kwargs
 	if _supports_color():
 		text = _stylize_output(text, fg, bg, reset, font)
 
-	Journald.log(text, level=level)
-
 	if level != logging.DEBUG:
 		from nixinstall.tui.curses_menu import Tui
 
@@ -18,7 +18,7 @@ from nixinstall.lib.models.device_model import (
 	EncryptionType,
 )
 from nixinstall.lib.nix.config import NixosConfig
-from nixinstall.lib.output import debug, error, info
+from nixinstall.lib.output import debug, error, info, phase
 from nixinstall.lib.profile.profiles_handler import profile_handler
 from nixinstall.tui import Tui
 
@@ -77,6 +77,7 @@ def perform_installation(mountpoint: Path) -> None:
 			if disk_config.disk_encryption and disk_config.disk_encryption.encryption_type != EncryptionType.NoEncryption:
 				# generate encryption key files for the mounted luks devices
 				installation.generate_key_files()
+				installation.configure_luks_performance()
 
 		installation.minimal_installation(
 			hostname=nixos_config_handler.config.hostname,
@@ -105,16 +106,19 @@ def perform_installation(mountpoint: Path) -> None:
 			installation.create_users(users)
 
 		if config.auth_config and config.users:
-			auth_handler.setup_auth(installation, config.auth_config, config.users, config.hostname)
+			with phase('setup_auth'):
+				auth_handler.setup_auth(installation, config.auth_config, config.users, config.hostname)
 
 		if config.packages and config.packages[0] != '':
 			installation.add_additional_packages(config.packages)
 
 		if profile_config := config.profile_config:
-			profile_handler.install_profile_config(installation, profile_config)
+			with phase('install_profile_config', profile=profile_config.profile.name if profile_config.profile else None):
+				profile_handler.install_profile_config(installation, profile_config)
 
 		if app_config := config.app_config:
-			application_handler.install_applications(installation, app_config)
+			with phase('install_applications'):
+				application_handler.install_applications(installation, app_config)
 
 		if timezone := config.timezone:
 			installation.set_timezone(timezone)
@@ -0,0 +1,88 @@
+"""
+Harness that runs the real disk pipeline against loop devices backed by sparse files.
+
+The tests need root, a loop-control device and the partitioning, filesystem, LUKS and LVM tools,
+they are skipped otherwise. Every test records how long each phase took and can compare
+that against a baseline measured earlier on the same machine:
+
+	pytest tests/lib/disk --disk-baseline=disk-baseline.json --update-disk-baseline
+	pytest tests/lib/disk --disk-baseline=disk-baseline.json
+"""
+
+import os
+import shutil
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from nixinstall.lib import output
+from nixinstall.lib.output import EventLog
+from tests.lib.disk.harness import Benchmark, LoopDevices
+
+LOOP_CONTROL = Path('/dev/loop-control')
+REQUIRED_TOOLS = ['losetup', 'wipefs', 'mkfs.fat', 'mkfs.ext4', 'mkfs.btrfs', 'btrfs', 'cryptsetup', 'pvcreate', 'vgcreate', 'lvcreate', 'vgchange']
+
+
+def _missing_requirements() -> str | None:
+	if os.getuid() != 0:
+		return 'needs root'
+	if not LOOP_CONTROL.exists():
+		return f'{LOOP_CONTROL} does not exist'
+	if missing := [tool for tool in REQUIRED_TOOLS if shutil.which(tool) is None]:
+		return f'missing tools: {", ".join(missing)}'
+
+	return None
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+	group = parser.getgroup('disk', 'disk pipeline benchmarks')
+	group.addoption('--disk-baseline', type=Path, default=None, help='JSON file with the per-phase timings to compare against')
+	group.addoption('--update-disk-baseline', action='store_true', default=False, help='write the measured timings to --disk-baseline')
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+	if (reason := _missing_requirements()) is None:
+		return
+
+	for item in items:
+		if 'loop_devices' in getattr(item, 'fixturenames', []):
+			item.add_marker(pytest.mark.skip(reason=reason))
+
+
+@pytest.fixture(scope='session')
+def benchmark(request: pytest.FixtureRequest) -> Iterator[Benchmark]:
+	# the options only exist when pytest is pointed at this directory
+	baseline = request.config.getoption('--disk-baseline', default=None)
+	update = request.config.getoption('--update-disk-baseline', default=False)
+
+	bench = Benchmark(baseline, update)
+	yield bench
+	bench.save()
+
+
+@pytest.fixture
+def event_log(monkeypatch: pytest.MonkeyPatch) -> EventLog:
+	"""
+	A fresh event log per test, so the recorded phases only cover that test
+	"""
+	events = EventLog('events-disk-tests.jsonl')
+	monkeypatch.setattr(output, 'event_log', events)
+	return events
+
+
+@pytest.fixture
+def target(tmp_path: Path) -> Path:
+	mountpoint = tmp_path / 'mnt'
+	mountpoint.mkdir()
+	return mountpoint
+
+
+@pytest.fixture
+def loop_devices(tmp_path: Path, target: Path) -> Iterator[LoopDevices]:
+	devices = LoopDevices(tmp_path)
+
+	try:
+		yield devices
+	finally:
+		devices.cleanup(target)
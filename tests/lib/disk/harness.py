@@ -0,0 +1,94 @@
+import json
+import subprocess
+from pathlib import Path
+
+from nixinstall.lib.models.device_model import DiskLayoutConfiguration
+
+# a phase may take this much longer than its baseline before it counts as a regression,
+# the slack keeps short phases from failing on scheduling noise
+REGRESSION_FACTOR = 1.5
+REGRESSION_SLACK = 0.5
+
+
+class Benchmark:
+	def __init__(self, baseline_path: Path | None, update: bool) -> None:
+		self._path = baseline_path
+		self._update = update
+		self._baseline: dict[str, dict[str, float]] = {}
+		self.results: dict[str, dict[str, float]] = {}
+
+		if baseline_path and baseline_path.exists():
+			self._baseline = json.loads(baseline_path.read_text())
+
+	def record(self, layout: str, durations: dict[str, float]) -> None:
+		self.results[layout] = durations
+
+		if self._update:
+			return
+
+		regressions = [
+			f'{phase}: {duration:.2f}s, baseline {expected:.2f}s'
+			for phase, duration in durations.items()
+			if (expected := self._baseline.get(layout, {}).get(phase)) is not None and duration > expected * REGRESSION_FACTOR + REGRESSION_SLACK
+		]
+
+		assert not regressions, f'{layout} got slower than its baseline:\n' + '\n'.join(regressions)
+
+	def save(self) -> None:
+		if self._update and self._path and self.results:
+			self._path.write_text(json.dumps(self._baseline | self.results, indent=4, sort_keys=True))
+
+
+def _run(*cmd: str) -> None:
+	# teardown is best effort, whatever is left over must not hide the test result
+	subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+
+class LoopDevices:
+	def __init__(self, directory: Path) -> None:
+		self._directory = directory
+		self._devices: list[Path] = []
+		# set by the test, tells the cleanup which volume groups and mappings to close
+		self.disk_config: DiskLayoutConfiguration | None = None
+
+	def create(self, size_mib: int) -> Path:
+		backing_file = self._directory / f'disk{len(self._devices)}.img'
+
+		# sparse, only the blocks that get written take up space
+		with backing_file.open('wb') as f:
+			f.truncate(size_mib * 1024 * 1024)
+
+		result = subprocess.run(
+			['losetup', '--find', '--show', '--partscan', str(backing_file)],
+			capture_output=True,
+			text=True,
+			check=True,
+		)
+
+		dev_path = Path(result.stdout.strip())
+		self._devices.append(dev_path)
+		return dev_path
+
+	def _mapper_names(self) -> list[str]:
+		if not self.disk_config or not (enc := self.disk_config.disk_encryption):
+			return []
+
+		names = [part.mapper_name for part in enc.partitions] + [vol.mapper_name for vol in enc.lvm_volumes]
+		return [name for name in names if name and Path('/dev/mapper', name).exists()]
+
+	def cleanup(self, target: Path) -> None:
+		_run('umount', '--recursive', str(target))
+
+		# LUKS on LVM has to be closed before the volume group, LVM on LUKS after it
+		for name in self._mapper_names():
+			_run('cryptsetup', 'close', name)
+
+		if self.disk_config and self.disk_config.lvm_config:
+			for vg in self.disk_config.lvm_config.vol_groups:
+				_run('vgchange', '--activate', 'n', vg.name)
+
+		for name in self._mapper_names():
+			_run('cryptsetup', 'close', name)
+
+		for dev_path in self._devices:
+			_run('losetup', '--detach', str(dev_path))
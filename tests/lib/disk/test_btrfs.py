@@ -0,0 +1,67 @@
+import struct
+from pathlib import Path
+
+import pytest
+
+from nixinstall.lib.disk import btrfs
+from nixinstall.lib.disk.btrfs import BTRFS_FS_TREE_OBJECTID, BTRFS_ROOT_BACKREF_KEY, list_subvolumes
+
+BTRFS_ROOT_REF_KEY = 156
+
+# (subvolume id, item type, parent subvolume id, directory id in the parent, name)
+ITEMS = [
+	(256, BTRFS_ROOT_BACKREF_KEY, BTRFS_FS_TREE_OBJECTID, 256, '@'),
+	(256, BTRFS_ROOT_REF_KEY, 258, 300, 'not a backref'),
+	(257, BTRFS_ROOT_BACKREF_KEY, BTRFS_FS_TREE_OBJECTID, 256, '@home'),
+	(258, BTRFS_ROOT_BACKREF_KEY, 256, 300, 'snap'),
+	# its parent is being deleted
+	(259, BTRFS_ROOT_BACKREF_KEY, 999, 256, 'orphan'),
+]
+
+DIRECTORIES = {(256, 300): 'snapshots/'}
+
+
+class FakeIoctl:
+	"""
+	Answers the btrfs ioctls from ITEMS, two items per search to exercise the continuation
+	"""
+
+	def __init__(self) -> None:
+		self.searches: list[tuple[int, int]] = []
+
+	def __call__(self, fd: int, request: int, args: bytearray) -> int:
+		if request == btrfs.BTRFS_IOC_INO_LOOKUP:
+			tree_id, objectid, _ = btrfs._INO_LOOKUP_ARGS.unpack(args)
+			btrfs._INO_LOOKUP_ARGS.pack_into(args, 0, tree_id, objectid, DIRECTORIES[(tree_id, objectid)].encode())
+			return 0
+
+		assert request == btrfs.BTRFS_IOC_TREE_SEARCH_V2
+
+		key = list(btrfs._SEARCH_ARGS_V2.unpack_from(args))
+		tree_id, min_objectid, _, min_offset = key[:4]
+		assert tree_id == btrfs.BTRFS_ROOT_TREE_OBJECTID
+		assert key[-1] == len(args) - btrfs._SEARCH_ARGS_V2.size
+		self.searches.append((min_objectid, min_offset))
+
+		found = [item for item in ITEMS if (item[0], item[2]) >= (min_objectid, min_offset)][:2]
+		pos = btrfs._SEARCH_ARGS_V2.size
+
+		for objectid, item_type, parent_id, dirid, name in found:
+			payload = struct.pack('<2QH', dirid, 0, len(name)) + name.encode()
+			btrfs._SEARCH_HEADER.pack_into(args, pos, btrfs.BTRFS_ROOT_TREE_OBJECTID, objectid, parent_id, item_type, len(payload))
+			pos += btrfs._SEARCH_HEADER.size
+			args[pos : pos + len(payload)] = payload
+			pos += len(payload)
+
+		key[9] = len(found)
+		btrfs._SEARCH_ARGS_V2.pack_into(args, 0, *key)
+		return 0
+
+
+def test_list_subvolumes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+	ioctl = FakeIoctl()
+	monkeypatch.setattr('fcntl.ioctl', ioctl)
+
+	assert list_subvolumes(tmp_path) == [Path('@'), Path('@home'), Path('@/snapshots/snap'), Path('orphan')]
+	# every search continues right after the last key of the previous one
+	assert ioctl.searches == [(256, 0), (256, 259), (258, 257), (259, 1000)]
@@ -0,0 +1,21 @@
+import pytest
+
+from nixinstall.lib.disk.device_handler import DeviceHandler
+from nixinstall.lib.exceptions import DiskError
+
+
+def test_lvm_info_retry_is_bounded(monkeypatch: pytest.MonkeyPatch) -> None:
+	calls = 0
+
+	def missing_entry(self: DeviceHandler, cmd: str, info_type: str) -> None:
+		nonlocal calls
+		calls += 1
+		raise ValueError('Report does not contain any entry')
+
+	monkeypatch.setattr(DeviceHandler, '_LVM_TIMEOUT', 0.5)
+	monkeypatch.setattr(DeviceHandler, '_lvm_info', missing_entry)
+
+	with pytest.raises(DiskError, match='within 0.5s'):
+		DeviceHandler().lvm_vol_info('root')
+
+	assert calls > 1
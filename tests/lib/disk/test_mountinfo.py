@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import pytest
+
+from nixinstall.lib.disk import mountinfo
+from nixinstall.lib.disk.mountinfo import MNT_DETACH, UMOUNT_NOFOLLOW, MountTable
+from nixinstall.lib.exceptions import DiskError
+
+MOUNTINFO = r"""22 1 8:2 / / rw,relatime shared:1 - ext4 /dev/sda2 rw
+30 22 0:25 / /mnt rw,relatime shared:5 master:1 - tmpfs tmpfs rw
+31 30 8:1 / /mnt/boot rw,relatime - vfat /dev/sda1 rw
+32 30 0:40 /@home /mnt/my\040home rw,relatime - btrfs /dev/mapper/luks\040root rw,subvol=/@home
+33 32 0:41 / /mnt/my\040home/back\134slash rw - tmpfs none rw
+34 30 0:42 / /mnt rw - tmpfs tmpfs rw
+"""
+
+
+@pytest.fixture
+def table(tmp_path: Path) -> MountTable:
+	path = tmp_path / 'mountinfo'
+	path.write_text(MOUNTINFO)
+	return MountTable.read(path)
+
+
+def test_read_fields(table: MountTable) -> None:
+	home = table.entries[3]
+
+	# optional fields of variable count sit between the mount options and the separator
+	assert [e.fstype for e in table.entries] == ['ext4', 'tmpfs', 'vfat', 'btrfs', 'tmpfs', 'tmpfs']
+	assert (home.mount_id, home.parent_id, home.devnum) == (32, 30, '0:40')
+	assert home.root == Path('/@home')
+	assert home.mountpoint == Path('/mnt/my home')
+	assert home.source == '/dev/mapper/luks root'
+	assert table.entries[4].mountpoint == Path('/mnt/my home/back\\slash')
+
+
+def test_unescape() -> None:
+	assert mountinfo.unescape(r'a\040b\011c\012d\134e') == 'a b\tc\nd\\e'
+	# a backslash that doesn't start an octal escape is kept
+	assert mountinfo.unescape(r'a\x') == r'a\x'
+
+
+def test_submounts_and_order(table: MountTable) -> None:
+	mounts = table.with_submounts(table.at(Path('/mnt')))
+
+	assert sorted(e.mount_id for e in mounts) == [30, 31, 32, 33, 34]
+	# deepest first, of the two mounts stacked on /mnt the newer one first
+	assert [e.mount_id for e in MountTable.unmount_order(mounts + mounts)] == [33, 32, 31, 34, 30]
+
+
+def test_unmount_retries_failures_last(table: MountTable, monkeypatch: pytest.MonkeyPatch) -> None:
+	calls: list[tuple[str, int]] = []
+	busy = {'/mnt/boot'}
+
+	def umount2(target: Path, flags: int = 0) -> None:
+		calls.append((str(target), flags))
+
+		if str(target) in busy and not flags & MNT_DETACH:
+			raise OSError(16, 'Device or resource busy')
+
+	monkeypatch.setattr(mountinfo, 'umount2', umount2)
+
+	table.unmount([table.entries[1], table.entries[2]], lazy=True)
+
+	assert calls == [
+		('/mnt/boot', UMOUNT_NOFOLLOW),
+		('/mnt', UMOUNT_NOFOLLOW),
+		('/mnt/boot', UMOUNT_NOFOLLOW | MNT_DETACH),
+	]
+
+	calls.clear()
+
+	with pytest.raises(DiskError, match='/mnt/boot'):
+		table.unmount([table.entries[2]])
+
+	assert calls == [('/mnt/boot', UMOUNT_NOFOLLOW), ('/mnt/boot', UMOUNT_NOFOLLOW)]
@@ -0,0 +1,166 @@
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from nixinstall.lib.disk.device_handler import device_handler
+from nixinstall.lib.disk.filesystem import FilesystemHandler
+from nixinstall.lib.disk.utils import get_lsblk_by_mountpoint
+from nixinstall.lib.installer import Installer
+from nixinstall.lib.models.device_model import (
+	BDevice,
+	DeviceModification,
+	DiskEncryption,
+	DiskLayoutConfiguration,
+	DiskLayoutType,
+	EncryptionType,
+	FilesystemType,
+	LvmConfiguration,
+	LvmLayoutType,
+	LvmVolume,
+	LvmVolumeGroup,
+	LvmVolumeStatus,
+	ModificationStatus,
+	PartitionFlag,
+	PartitionModification,
+	PartitionType,
+	Size,
+	SubvolumeModification,
+	Unit,
+)
+from nixinstall.lib.models.users import Password
+from nixinstall.lib.output import EventLog
+from tests.lib.disk.harness import Benchmark, LoopDevices
+
+DISK_SIZE_MIB = 1024
+VG_NAME = 'NixinstallTestVg'
+# keeps the key derivation from dominating the timings
+ITER_TIME = 100
+
+
+def _size(mib: int, device: BDevice) -> Size:
+	return Size(mib, Unit.MiB, device.device_info.sector_size)
+
+
+def _boot(device: BDevice) -> PartitionModification:
+	return PartitionModification(
+		status=ModificationStatus.Create,
+		type=PartitionType.Primary,
+		start=_size(1, device),
+		length=_size(128, device),
+		mountpoint=Path('/boot'),
+		fs_type=FilesystemType.Fat32,
+		flags=[PartitionFlag.BOOT, PartitionFlag.ESP],
+	)
+
+
+def _root(device: BDevice, fs_type: FilesystemType, mountpoint: Path | None = Path('/')) -> PartitionModification:
+	start = _size(129, device)
+
+	return PartitionModification(
+		status=ModificationStatus.Create,
+		type=PartitionType.Primary,
+		start=start,
+		length=(device.device_info.total_size - start).gpt_end().align(),
+		mountpoint=mountpoint,
+		fs_type=fs_type,
+	)
+
+
+def _password() -> Password:
+	return Password(plaintext='nixinstall-test')
+
+
+def _lvm(pv: PartitionModification, fs_type: FilesystemType) -> tuple[LvmConfiguration, LvmVolume]:
+	root_vol = LvmVolume(
+		status=LvmVolumeStatus.Create,
+		name='root',
+		fs_type=fs_type,
+		length=Size(512, Unit.MiB, pv.length.sector_size),
+		mountpoint=Path('/'),
+	)
+
+	return LvmConfiguration(LvmLayoutType.Default, [LvmVolumeGroup(VG_NAME, pvs=[pv], volumes=[root_vol])]), root_vol
+
+
+def gpt_ext4(device: BDevice) -> DiskLayoutConfiguration:
+	mod = DeviceModification(device, wipe=True, partitions=[_boot(device), _root(device, FilesystemType.Ext4)])
+	return DiskLayoutConfiguration(DiskLayoutType.Default, [mod])
+
+
+def btrfs_subvolumes(device: BDevice) -> DiskLayoutConfiguration:
+	root = _root(device, FilesystemType.Btrfs, mountpoint=None)
+	root.btrfs_subvols = [
+		SubvolumeModification(Path('@'), Path('/')),
+		SubvolumeModification(Path('@home'), Path('/home')),
+		SubvolumeModification(Path('@log'), Path('/var/log')),
+	]
+
+	mod = DeviceModification(device, wipe=True, partitions=[_boot(device), root])
+	return DiskLayoutConfiguration(DiskLayoutType.Default, [mod])
+
+
+def luks(device: BDevice) -> DiskLayoutConfiguration:
+	root = _root(device, FilesystemType.Ext4)
+	mod = DeviceModification(device, wipe=True, partitions=[_boot(device), root])
+	encryption = DiskEncryption(EncryptionType.Luks, _password(), partitions=[root], iter_time=ITER_TIME)
+
+	return DiskLayoutConfiguration(DiskLayoutType.Default, [mod], disk_encryption=encryption)
+
+
+def lvm_on_luks(device: BDevice) -> DiskLayoutConfiguration:
+	pv = _root(device, FilesystemType.Ext4, mountpoint=None)
+	mod = DeviceModification(device, wipe=True, partitions=[_boot(device), pv])
+	lvm_config, _ = _lvm(pv, FilesystemType.Ext4)
+	encryption = DiskEncryption(EncryptionType.LvmOnLuks, _password(), partitions=[pv], iter_time=ITER_TIME)
+
+	return DiskLayoutConfiguration(DiskLayoutType.Default, [mod], lvm_config=lvm_config, disk_encryption=encryption)
+
+
+def luks_on_lvm(device: BDevice) -> DiskLayoutConfiguration:
+	pv = _root(device, FilesystemType.Ext4, mountpoint=None)
+	mod = DeviceModification(device, wipe=True, partitions=[_boot(device), pv])
+	lvm_config, root_vol = _lvm(pv, FilesystemType.Ext4)
+	encryption = DiskEncryption(EncryptionType.LuksOnLvm, _password(), lvm_volumes=[root_vol], iter_time=ITER_TIME)
+
+	return DiskLayoutConfiguration(DiskLayoutType.Default, [mod], lvm_config=lvm_config, disk_encryption=encryption)
+
+
+LAYOUTS: list[Callable[[BDevice], DiskLayoutConfiguration]] = [gpt_ext4, btrfs_subvolumes, luks, lvm_on_luks, luks_on_lvm]
+
+
+@pytest.mark.parametrize('layout', LAYOUTS, ids=[layout.__name__ for layout in LAYOUTS])
+def test_disk_pipeline(
+	layout: Callable[[BDevice], DiskLayoutConfiguration],
+	loop_devices: LoopDevices,
+	target: Path,
+	event_log: EventLog,
+	benchmark: Benchmark,
+) -> None:
+	dev_path = loop_devices.create(DISK_SIZE_MIB)
+
+	# the loop device was attached after the devices got probed
+	device_handler.load_devices()
+	device = device_handler.get_device(dev_path)
+	assert device is not None, f'{dev_path} was not picked up by the device handler'
+
+	disk_config = layout(device)
+	loop_devices.disk_config = disk_config
+
+	FilesystemHandler(disk_config).perform_filesystem_operations(show_countdown=False)
+
+	Installer(target, disk_config).mount_ordered_layout()
+
+	assert get_lsblk_by_mountpoint(target), f'nothing got mounted at {target}'
+	assert get_lsblk_by_mountpoint(target / 'boot'), f'nothing got mounted at {target / "boot"}'
+
+	if layout is btrfs_subvolumes:
+		assert get_lsblk_by_mountpoint(target / 'home')
+		assert get_lsblk_by_mountpoint(target / 'var/log')
+
+	durations = event_log.durations()
+
+	for phase in ['filesystem_operations', 'partition', 'format_partition', 'mount_ordered_layout']:
+		assert phase in durations, f'{phase} was not recorded'
+
+	benchmark.record(layout.__name__, durations)
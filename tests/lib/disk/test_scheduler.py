@@ -0,0 +1,97 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from nixinstall.lib import output
+from nixinstall.lib.disk.scheduler import DiskTaskScheduler
+from nixinstall.lib.exceptions import DiskError
+from nixinstall.lib.general import SysCommand
+from nixinstall.lib.output import EventLog, Logger
+
+
+def test_runs_chains_in_parallel_and_in_order() -> None:
+	scheduler = DiskTaskScheduler()
+	order: list[str] = []
+	barrier = threading.Barrier(2, timeout=5)
+
+	def step(name: str, meet: bool = False) -> None:
+		# both partition steps have to be running at the same time to get past the barrier
+		if meet:
+			barrier.wait()
+		order.append(name)
+
+	scheduler.add('partition a', lambda: step('partition a', meet=True))
+	scheduler.add('partition b', lambda: step('partition b', meet=True))
+	scheduler.add('format a', lambda: step('format a'), ['partition a'])
+	scheduler.add('format b', lambda: step('format b'), ['partition b'])
+	scheduler.add('lvm', lambda: step('lvm'), ['format a', 'format b'])
+
+	scheduler.run()
+
+	assert order.index('format a') > order.index('partition a')
+	assert order.index('format b') > order.index('partition b')
+	assert order[-1] == 'lvm'
+
+
+def test_stops_on_error() -> None:
+	scheduler = DiskTaskScheduler()
+	ran: list[str] = []
+
+	def fail() -> None:
+		raise DiskError('mkfs failed')
+
+	scheduler.add('partition', lambda: ran.append('partition'))
+	scheduler.add('format', fail, ['partition'])
+	scheduler.add('subvolumes', lambda: ran.append('subvolumes'), ['format'])
+
+	with pytest.raises(DiskError, match='mkfs failed'):
+		scheduler.run()
+
+	assert ran == ['partition']
+
+
+def test_rejects_unknown_dependencies() -> None:
+	scheduler = DiskTaskScheduler()
+
+	with pytest.raises(ValueError):
+		scheduler.add('format', lambda: None, ['partition'])
+
+
+def test_tasks_nest_in_the_calling_span(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+	monkeypatch.setattr(output, 'logger', Logger(tmp_path))
+	events = EventLog('events.jsonl')
+	monkeypatch.setattr(output, 'event_log', events)
+
+	scheduler = DiskTaskScheduler()
+
+	def step(name: str) -> None:
+		with output.phase(name):
+			pass
+
+	scheduler.add('partition', lambda: step('partition'))
+	scheduler.add('format', lambda: step('format'), ['partition'])
+
+	with events.span('filesystem_operations'):
+		scheduler.run()
+
+	records = [json.loads(line) for line in (tmp_path / 'events.jsonl').read_text().splitlines()]
+	begins = {r['name']: r for r in records if r['type'] == 'begin'}
+
+	for name in ('partition', 'format'):
+		assert (begins[name]['parent'], begins[name]['depth']) == (begins['filesystem_operations']['id'], 1)
+
+	# the worker threads are back at the top level afterwards
+	assert events.current() == ()
+
+
+def test_task_commands_do_not_fork_a_pty() -> None:
+	scheduler = DiskTaskScheduler()
+	use_pty: list[bool] = []
+
+	scheduler.add('format', lambda: use_pty.append(SysCommand(['/bin/true']).use_pty))
+	scheduler.run()
+
+	assert use_pty == [False]
+	assert SysCommand(['/bin/true']).use_pty
@@ -0,0 +1,192 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from nixinstall.lib.disk import sysfs
+from nixinstall.lib.disk.mountinfo import MountTable
+from nixinstall.lib.disk.sysfs import DeviceClass, StorageInfo, SysfsProber
+from nixinstall.lib.models.device_model import LsblkInfo
+
+SATA_HOST = 'devices/pci0000:00/0000:00:17.0/ata1/host0/target0:0:0/0:0:0:0'
+USB_HOST = 'devices/pci0000:00/0000:00:14.0/usb1/1-1/1-1:1.0/host1/target1:0:0/1:0:0:0'
+NVME = 'devices/pci0000:00/0000:01:00.0/nvme/nvme0'
+VIRTUAL = 'devices/virtual/block'
+
+
+class FakeSysfs:
+	"""
+	A /sys tree with a SATA disk holding LUKS and LVM, a USB stick, an NVMe disk and loop devices
+	"""
+
+	def __init__(self, root: Path) -> None:
+		self.root = root
+		self.block = root / 'class' / 'block'
+		self.block.mkdir(parents=True)
+
+		for host, proc_name in (('host0', 'ahci'), ('host1', 'usb-storage')):
+			self.write(f'class/scsi_host/{host}/proc_name', proc_name)
+
+		sda = self.disk('sda', f'{SATA_HOST}/block/sda', '8:0', rotational=True, device=SATA_HOST)
+		self.partition('sda1', sda, '8:1', 1)
+		sda2 = self.partition('sda2', sda, '8:2', 2)
+		self.disk('sdb', f'{USB_HOST}/block/sdb', '8:16', device=USB_HOST)
+		nvme = self.disk('nvme0n1', f'{NVME}/nvme0n1', '259:0', device=NVME)
+		self.partition('nvme0n1p1', nvme, '259:1', 1)
+
+		crypt = self.disk('dm-0', f'{VIRTUAL}/dm-0', '254:0')
+		self.write(f'{VIRTUAL}/dm-0/dm/name', 'cryptroot')
+		self.write(f'{VIRTUAL}/dm-0/dm/uuid', 'CRYPT-LUKS2-abc-cryptroot')
+		self.link(sda2, crypt)
+
+		# dm-10 comes after dm-2 by MAJ:MIN, but before it by name
+		for kname, devnum, name in (('dm-10', '254:10', 'vg-root'), ('dm-2', '254:2', 'vg-swap')):
+			lv = self.disk(kname, f'{VIRTUAL}/{kname}', devnum)
+			self.write(f'{VIRTUAL}/{kname}/dm/name', name)
+			self.write(f'{VIRTUAL}/{kname}/dm/uuid', f'LVM-{name}')
+			self.link(crypt, lv)
+
+		self.disk('loop0', f'{VIRTUAL}/loop0', '7:0', size=0)
+		self.disk('loop1', f'{VIRTUAL}/loop1', '7:1')
+		self.disk('ram0', f'{VIRTUAL}/ram0', '1:0')
+
+	def write(self, path: str, content: str) -> None:
+		(self.root / path).parent.mkdir(parents=True, exist_ok=True)
+		(self.root / path).write_text(f'{content}\n')
+
+	def disk(self, kname: str, path: str, devnum: str, size: int = 2048, rotational: bool = False, device: str | None = None) -> Path:
+		sysdir = self.root / path
+		self.write(f'{path}/dev', devnum)
+		self.write(f'{path}/size', str(size))
+		self.write(f'{path}/queue/logical_block_size', '512')
+		self.write(f'{path}/queue/rotational', '1' if rotational else '0')
+		self.write(f'{path}/queue/discard_max_bytes', '0' if rotational else '2147450880')
+
+		if device:
+			(sysdir / 'device').symlink_to(self.root / device)
+
+		(self.block / kname).symlink_to(sysdir)
+		return sysdir
+
+	def partition(self, kname: str, disk: Path, devnum: str, partn: int) -> Path:
+		sysdir = disk / kname
+		sysdir.mkdir()
+		(sysdir / 'dev').write_text(f'{devnum}\n')
+		(sysdir / 'size').write_text('1024\n')
+		(sysdir / 'partition').write_text(f'{partn}\n')
+		(self.block / kname).symlink_to(sysdir)
+		return sysdir
+
+	def link(self, lower: Path, upper: Path) -> None:
+		(lower / 'holders').mkdir(exist_ok=True)
+		(lower / 'holders' / upper.name).symlink_to(upper)
+		(upper / 'slaves').mkdir(exist_ok=True)
+		(upper / 'slaves' / lower.name).symlink_to(lower)
+
+
+@pytest.fixture
+def fake_sysfs(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> FakeSysfs:
+	fake = FakeSysfs(tmp_path / 'sys')
+
+	udev_data = tmp_path / 'udev'
+	udev_data.mkdir()
+	(udev_data / 'b8:1').write_text('E:ID_FS_TYPE=vfat\nE:ID_FS_UUID=BOOT\nE:ID_PART_ENTRY_UUID=boot-partuuid\n')
+	(udev_data / 'b8:0').write_text('E:ID_PART_TABLE_TYPE=gpt\n')
+
+	mountinfo = tmp_path / 'mountinfo'
+	mountinfo.write_text(f'30 1 8:1 / {tmp_path} rw - vfat /dev/sda1 rw\n31 1 0:40 /@ /mnt rw - btrfs /dev/dm-10 rw\n')
+	read_mounts = MountTable.read
+
+	swaps = tmp_path / 'swaps'
+	swaps.write_text('Filename\tType\tSize\tUsed\tPriority\n/dev/dm-2\tpartition\t1024\t0\t-2\n')
+
+	monkeypatch.setattr(sysfs, 'SYS_CLASS_BLOCK', fake.block)
+	monkeypatch.setattr(sysfs, 'UDEV_DATA', udev_data)
+	monkeypatch.setattr(sysfs, 'PROC_SWAPS', swaps)
+	monkeypatch.setattr(MountTable, 'read', lambda path=mountinfo: read_mounts(path))
+	return fake
+
+
+def _tree(infos: list[LsblkInfo]) -> list[tuple[Any, ...]]:
+	return [(info.name, info.type, info.tran, _tree(info.children)) for info in infos]
+
+
+def test_probe_matches_lsblk(fake_sysfs: FakeSysfs, tmp_path: Path) -> None:
+	infos = SysfsProber().probe()
+	assert infos is not None
+
+	# what lsblk reports for the same devices, ordered by MAJ:MIN
+	assert _tree(infos) == [
+		('loop1', 'loop', None, []),
+		(
+			'sda',
+			'disk',
+			'sata',
+			[
+				('sda1', 'part', None, []),
+				('sda2', 'part', None, [('cryptroot', 'crypt', None, [('vg-swap', 'lvm', None, []), ('vg-root', 'lvm', None, [])])]),
+			],
+		),
+		('sdb', 'disk', 'usb', []),
+		('nvme0n1', 'disk', 'nvme', [('nvme0n1p1', 'part', None, [])]),
+	]
+
+	sda = infos[1]
+	boot = sda.children[0]
+	cryptroot = sda.children[1].children[0]
+
+	assert (sda.rota, sda.pttype, sda.size.value) == (True, 'gpt', 2048 * 512)
+	assert (boot.pkname, boot.partn, boot.fstype, boot.uuid, boot.partuuid) == ('sda', 1, 'vfat', 'BOOT', 'boot-partuuid')
+	assert (boot.mountpoints, boot.fsavail is not None) == ([tmp_path], True)
+	assert cryptroot.path == Path('/dev/mapper/cryptroot')
+	assert cryptroot.children[0].mountpoints == [Path('[SWAP]')]
+	assert (cryptroot.children[1].mountpoints, cryptroot.children[1].fsroots) == ([Path('/mnt')], [Path('/@')])
+
+
+def test_probe_inverse(fake_sysfs: FakeSysfs) -> None:
+	infos = SysfsProber().probe(reverse=True, full_dev_path=True)
+	assert infos is not None
+
+	assert [info.name for info in infos] == [
+		'/dev/loop1',
+		'/dev/sda1',
+		'/dev/sdb',
+		'/dev/mapper/vg-swap',
+		'/dev/mapper/vg-root',
+		'/dev/nvme0n1p1',
+	]
+	assert _tree(infos[4].children) == [('/dev/mapper/cryptroot', 'crypt', None, [('/dev/sda2', 'part', None, [('/dev/sda', 'disk', 'sata', [])])])]
+	assert infos[4].pkname == '/dev/dm-0'
+
+
+def test_probe_ignores_devices_added_later(fake_sysfs: FakeSysfs) -> None:
+	prober = SysfsProber()
+
+	sda = fake_sysfs.block.joinpath('sda').resolve()
+	fake_sysfs.partition('sda3', sda, '8:3', 3)
+	fake_sysfs.link(sda / 'sda3', fake_sysfs.disk('dm-3', f'{VIRTUAL}/dm-3', '254:3'))
+
+	assert (infos := prober.probe('/dev/sda')) is not None
+	assert [child.name for child in infos[0].children] == ['sda1', 'sda2']
+	assert prober.probe('/dev/sda3') is None
+
+
+def test_storage_info(fake_sysfs: FakeSysfs) -> None:
+	nvme_part = fake_sysfs.block.joinpath('nvme0n1p1').resolve()
+
+	# an NVMe partition together with the USB stick, and with the spinning disk
+	for kname, devnum, lower in (
+		('dm-20', '254:20', fake_sysfs.block.joinpath('sdb').resolve()),
+		('dm-21', '254:21', fake_sysfs.block.joinpath('sda1').resolve()),
+	):
+		spanning = fake_sysfs.disk(kname, f'{VIRTUAL}/{kname}', devnum)
+		fake_sysfs.link(nvme_part, spanning)
+		fake_sysfs.link(lower, spanning)
+
+	assert sysfs.storage_info(Path('/dev/nvme0n1p1')) == StorageInfo(DeviceClass.Nvme, discard=True)
+	assert sysfs.storage_info(Path('/dev/sdb')) == StorageInfo(DeviceClass.Ssd, discard=True)
+	# LVM on LUKS on a partition of the spinning disk
+	assert sysfs.storage_info(Path('/dev/dm-10')) == StorageInfo(DeviceClass.Hdd, discard=False)
+	assert sysfs.storage_info(Path('/dev/dm-20')) == StorageInfo(DeviceClass.Ssd, discard=True)
+	assert sysfs.storage_info(Path('/dev/dm-21')) == StorageInfo(DeviceClass.Hdd, discard=False)
+	assert sysfs.storage_info(Path('/dev/sdz')) is None
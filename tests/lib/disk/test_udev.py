@@ -0,0 +1,75 @@
+import os
+import stat
+import threading
+from pathlib import Path
+
+import pytest
+
+from nixinstall.lib.disk import udev
+from nixinstall.lib.disk.udev import udev_timestamp, wait_for_devices
+
+
+@pytest.fixture
+def device(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+	"""
+	A fake block device 8:16 whose udev record lives in a temporary data directory
+	"""
+	data = tmp_path / 'data'
+	data.mkdir()
+	monkeypatch.setattr(udev, 'UDEV_DATA', data)
+
+	dev = tmp_path / 'sdb'
+	dev.touch()
+	real_stat = os.stat
+
+	def fake_stat(path: os.PathLike[str] | str, *args: object, **kwargs: object) -> os.stat_result:
+		if Path(path) == dev:
+			return os.stat_result((stat.S_IFBLK | 0o600, 0, 0, 1, 0, 0, 0, 0, 0, 0), {'st_rdev': os.makedev(8, 16)})
+		return real_stat(path, *args, **kwargs)  # type: ignore[arg-type]
+
+	monkeypatch.setattr('os.stat', fake_stat)
+	return dev
+
+
+def _write_record(device: Path, *properties: str) -> Path:
+	db = udev.UDEV_DATA / 'b8:16'
+	db.write_text(''.join(f'E:{prop}=1\n' for prop in properties) + 'S:disk/by-id/fake\n')
+	return db
+
+
+def test_device_ready(device: Path) -> None:
+	assert not udev._device_ready(device, [], None)
+
+	db = _write_record(device, 'ID_FS_UUID', 'ID_FS_TYPE')
+
+	assert udev._device_ready(device, ['ID_FS_UUID', 'ID_FS_TYPE'], None)
+	assert not udev._device_ready(device, ['ID_PART_ENTRY_UUID'], None)
+	# only symlink lines carry the name, it's not a property
+	assert not udev._device_ready(device, ['disk/by-id/fake'], None)
+
+	since = udev_timestamp()
+	os.utime(db, ns=(since - 1, since - 1))
+	assert not udev._device_ready(device, [], since)
+
+	os.utime(db, ns=(since, since))
+	assert udev._device_ready(device, [], since)
+
+	assert not udev._device_ready(device.with_name('missing'), [], None)
+
+
+def test_wait_for_devices(device: Path) -> None:
+	since = udev_timestamp()
+	writer = threading.Timer(0.1, _write_record, (device, 'ID_FS_UUID'))
+	writer.start()
+
+	try:
+		assert wait_for_devices([device], ['ID_FS_UUID'], since=since, timeout=5)
+	finally:
+		writer.join()
+
+	assert not wait_for_devices([device], ['ID_FS_LABEL'], timeout=0.1)
+
+
+def test_wait_for_devices_without_udev(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+	monkeypatch.setattr(udev, 'UDEV_DATA', tmp_path / 'missing')
+	assert not wait_for_devices([tmp_path], timeout=0.1)
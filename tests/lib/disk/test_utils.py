@@ -0,0 +1,113 @@
+import json
+from pathlib import Path
+from typing import Any
+
+from nixinstall.lib.disk.utils import BlockTopology, LsblkOutput
+from nixinstall.lib.models.device_model import LsblkInfo
+
+
+def _dev(name: str, kname: str, type_: str, children: list[dict[str, Any]] | None = None, **fields: Any) -> dict[str, Any]:
+	mountpoints = fields.pop('mountpoints', [None])
+
+	return {
+		'name': name,
+		'kname': kname,
+		'path': f'/dev/{name}' if type_ in ('disk', 'part') else f'/dev/mapper/{name}',
+		'pkname': None,
+		'log-sec': 512,
+		'size': 1024 * 1024 * 1024,
+		'pttype': None,
+		'ptuuid': None,
+		'rota': False,
+		'tran': None,
+		'partn': None,
+		'partuuid': None,
+		'parttype': None,
+		'uuid': None,
+		'fstype': None,
+		'fsver': None,
+		'fsavail': None,
+		'fsuse%': None,
+		'type': type_,
+		'mountpoint': mountpoints[0],
+		'mountpoints': mountpoints,
+		'fsroots': [None],
+		'children': children or [],
+		**fields,
+	}
+
+
+def _topology() -> BlockTopology:
+	# the root LV spans a PV inside a LUKS container on sda and a plain PV on sdb,
+	# so like in lsblk it is listed below both of them
+	root_lv = _dev('vg-root', 'dm-1', 'lvm', uuid='root-uuid', fstype='btrfs', mountpoints=['/', '/home'])
+
+	blockdevices = [
+		_dev(
+			'sda',
+			'sda',
+			'disk',
+			[
+				_dev('sda1', 'sda1', 'part', partuuid='boot-partuuid', uuid='BOOT', fstype='vfat', mountpoints=['/boot']),
+				_dev('sda2', 'sda2', 'part', [_dev('ainst', 'dm-0', 'crypt', [root_lv], fstype='LVM2_member')], fstype='crypto_LUKS'),
+			],
+		),
+		_dev('sdb', 'sdb', 'disk', [_dev('sdb1', 'sdb1', 'part', [root_lv], fstype='LVM2_member')]),
+	]
+
+	output = LsblkOutput.model_validate_json(json.dumps({'blockdevices': blockdevices}))
+	return BlockTopology(output, generation=3)
+
+
+def test_block_topology_indexes() -> None:
+	topology = _topology()
+
+	boot = topology.by_path('/dev/sda1')
+	assert boot is not None
+	assert topology.by_kname('sda1') is boot
+	assert topology.by_uuid('BOOT') is boot
+	assert topology.by_partuuid('boot-partuuid') is boot
+	assert topology.by_mountpoint(Path('/boot')) == [boot]
+
+	root = topology.by_path('/dev/mapper/vg-root')
+	assert root is not None
+	assert topology.by_kname('dm-1') is root
+	assert topology.by_mountpoint(Path('/')) == [root]
+	assert topology.by_mountpoint(Path('/home')) == [root]
+	assert topology.by_path('/dev/sdc') is None
+
+
+def test_block_topology_mountpoint_prefix() -> None:
+	topology = _topology()
+
+	# a device mounted twice below the prefix is only returned once
+	assert [info.name for info in topology.by_mountpoint(Path('/'), as_prefix=True)] == ['sda1', 'vg-root']
+	assert [info.name for info in topology.by_mountpoint(Path('/boot'), as_prefix=True)] == ['sda1']
+
+
+def test_block_topology_find() -> None:
+	topology = _topology()
+
+	assert (info := topology.find('/dev/sda2')) is not None and info.name == 'sda2'
+	assert (info := topology.find(Path('/home'))) is not None and info.name == 'vg-root'
+	# paths that are not indexed fall back to the kernel name the path resolves to
+	assert (info := topology.find('/dev/dm-0')) is not None and info.name == 'ainst'
+	assert topology.find('/dev/nonexistent') is None
+
+
+def test_block_topology_inverse() -> None:
+	topology = _topology()
+	root = topology.by_path('/dev/mapper/vg-root')
+	assert root is not None
+
+	inverse = topology.inverse(root)
+
+	def tree(info: LsblkInfo) -> list[Any]:
+		return [[child.name, tree(child)] for child in info.children]
+
+	assert tree(inverse) == [
+		['ainst', [['sda2', [['sda', []]]]]],
+		['sdb1', [['sdb', []]]],
+	]
+	# the snapshot itself is left untouched
+	assert root.children == []
@@ -0,0 +1,184 @@
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+from nixinstall.lib import general
+from nixinstall.lib.exceptions import SysCallError
+from nixinstall.lib.general import AsyncSysCommand, ProbeCache, SysCommand, SysCommandWorker, TraceLog, run, run_commands
+
+
+def test_trace_log_in_memory() -> None:
+	log = TraceLog(spill_threshold=1024)
+	log.append(b'hello\n')
+	log.append(b'world\n')
+
+	assert not log.spilled
+	assert len(log) == 12
+	assert bytes(log) == b'hello\nworld\n'
+	assert log[6:11] == b'world'
+	assert log.find(b'world') == 6
+	assert log.rfind(b'\n') == 11
+	assert b'llo' in log
+
+
+def test_trace_log_spills_to_disk() -> None:
+	log = TraceLog(spill_threshold=16)
+	log.append(b'a' * 10)
+	assert (log.spilled, len(log)) == (False, 10)
+
+	log.append(b'b' * 10)
+	assert log.spilled
+	assert bytes(log) == b'a' * 10 + b'b' * 10
+
+	# reads must see data appended after the file was first mapped
+	log.append(b'needle')
+	assert len(log) == 26
+	assert log.find(b'needle', 5) == 20
+	assert log[-6:] == b'needle'
+	assert log.decode() == 'a' * 10 + 'b' * 10 + 'needle'
+
+
+def test_trace_log_search_and_close() -> None:
+	log = TraceLog(spill_threshold=16)
+	log.append(b'x' * 20)
+	log.append(b'Enter PIN for key')
+
+	assert log.find(b'enter pin for', ignore_case=True) == 20
+	assert log.find(b'enter pin for') == -1
+
+	log.close()
+	assert not log.spilled
+	assert len(log) == 0
+
+
+def test_syscommand_output_spilled() -> None:
+	cmd = SysCommand(['/bin/sh', '-c', 'printf "%s\\n" 1 2 3'], spill_threshold=2)
+
+	assert cmd.session is not None
+	assert cmd.session._trace_log.spilled
+	assert cmd.output() == b'1\n2\n3\n'
+	assert cmd[0:1] == b'1'
+
+
+def test_run_large_input_and_early_exit() -> None:
+	data = b'x' * (4 * 1024 * 1024)
+	assert run(['cat'], input_data=data).stdout == data
+	assert run(['true'], input_data=data).returncode == 0
+
+
+def test_run_commands_keeps_order_and_errors() -> None:
+	results = run_commands(
+		[
+			['/bin/sh', '-c', 'sleep 0.2; echo first'],
+			['/bin/sh', '-c', 'echo second'],
+			['/bin/sh', '-c', 'echo broken; exit 3'],
+		],
+		max_concurrency=2,
+	)
+
+	assert isinstance(results[0], AsyncSysCommand)
+	assert results[0].decode() == 'first'
+	assert isinstance(results[1], AsyncSysCommand)
+	assert results[1].decode() == 'second'
+	assert isinstance(results[2], SysCallError)
+	assert results[2].exit_code == 3
+	assert results[2].worker_log == b'broken\n'
+
+
+def test_async_command_awaited_twice() -> None:
+	async def await_twice() -> tuple[AsyncSysCommand, AsyncSysCommand]:
+		cmd = AsyncSysCommand(['/bin/sh', '-c', 'sleep 0.2; echo done'])
+		return await asyncio.gather(cmd.run(), cmd.run())
+
+	first, second = asyncio.run(await_twice())
+
+	assert first is second
+	assert first.exit_code == 0
+	assert first.decode() == 'done'
+
+
+def test_syscommand_pipe_mode_separates_stderr() -> None:
+	cmd = SysCommand(['/bin/sh', '-c', 'printf "{}\\n"; echo oops >&2'], use_pty=False)
+
+	# no tty line discipline, so no \r\n translation
+	assert cmd.output(remove_cr=False) == b'{}\n'
+	assert cmd.stderr == b'oops\n'
+
+
+def test_syscommand_pipe_mode_error() -> None:
+	try:
+		SysCommand(['/bin/sh', '-c', 'echo failed >&2; exit 4'], use_pty=False)
+	except SysCallError as err:
+		assert err.exit_code == 4
+		assert err.worker_log == b'failed\n'
+	else:
+		raise AssertionError('SysCallError was not raised')
+
+
+def test_worker_lines_carry_partial_lines() -> None:
+	worker = SysCommandWorker(['/bin/sh', '-c', 'printf "a\\033["; sleep 0.2; printf "1mb\\nc"'])
+
+	assert list(worker.lines()) == [b'ab\n', b'c\n']
+	assert worker.exit_code == 0
+
+
+def test_syscommand_iter_keeps_trailing_line() -> None:
+	assert list(SysCommand(['/bin/sh', '-c', 'printf "1\\n\\n2"'], use_pty=False)) == [b'1\n', b'2\n']
+
+
+def test_probe_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+	# a private cache, registering the probe on the global one would leak into other tests
+	probe_cache = ProbeCache()
+	monkeypatch.setattr(general, 'probe_cache', probe_cache)
+	probe_cache.register('echo', 'probe')
+	probe_cache.register('echo', 'static', device_state=False)
+
+	first = SysCommand(['/bin/echo', 'probe', 'a'], use_pty=False)
+	second = SysCommand(['/bin/echo', 'probe', 'a'], use_pty=False)
+
+	assert probe_cache.hits == 1
+	assert second.session is not first.session
+	assert list(first) == list(second) == [b'probe a\n']
+
+	static = SysCommand(['/bin/echo', 'static'], use_pty=False)
+
+	# anything that isn't a probe could have changed the devices
+	SysCommand(['/bin/true'])
+
+	# stale results are dropped, not just skipped
+	assert [session for _, session in probe_cache._entries.values()] == [static.session]
+
+	SysCommand(['/bin/echo', 'probe', 'a'], use_pty=False)
+
+	assert probe_cache.hits == 1
+	assert probe_cache.misses == 3
+
+
+@pytest.mark.parametrize('use_pty', [True, False])
+def test_syscommand_working_directory(tmp_path: Path, use_pty: bool) -> None:
+	cwd = os.getcwd()
+	output = SysCommand(['/bin/pwd'], working_directory=str(tmp_path), use_pty=use_pty).decode().strip()
+
+	assert output == str(tmp_path)
+	# only the child changed its directory
+	assert os.getcwd() == cwd
+
+
+@pytest.mark.parametrize('use_pty', [True, False])
+def test_syscommand_missing_working_directory(tmp_path: Path, use_pty: bool) -> None:
+	with pytest.raises(SysCallError, match='working directory'):
+		SysCommand(['/bin/true'], working_directory=str(tmp_path / 'missing'), use_pty=use_pty)
+
+
+def test_syscommand_pty_exec_failure() -> None:
+	pid = os.getpid()
+
+	with pytest.raises(SysCallError) as err:
+		SysCommand(['/nonexistent/binary'])
+
+	# the forked child exits instead of returning into the caller
+	assert os.getpid() == pid
+	assert err.value.exit_code == 127
+	assert b'/nonexistent/binary' in err.value.worker_log
@@ -0,0 +1,99 @@
+from pathlib import Path
+from subprocess import CompletedProcess
+
+import pytest
+
+from nixinstall.lib import luks
+from nixinstall.lib.disk.sysfs import DeviceClass, StorageInfo
+from nixinstall.lib.hardware import SysInfo
+from nixinstall.lib.luks import CryptsetupBenchmark, Luks2, LuksPerformanceFlags, calibrate_luks_parameters, max_parallel_unlocks
+from nixinstall.lib.models.device_model import LuksPerformance
+from nixinstall.lib.models.users import Password
+
+GIB = 1024 * 1024
+
+BENCHMARK = """
+# Tests are approximate using memory only (no storage IO).
+PBKDF2-sha256    2231011 iterations per second for 256-bit key
+argon2id      6 iterations, 1048576 memory, 4 parallel threads (CPUs) for 256-bit key (requested 2000 ms time)
+#     Algorithm |       Key |      Encryption |      Decryption
+        aes-cbc        256b      1277.2 MiB/s      3825.6 MiB/s
+    serpent-cbc        128b               N/A               N/A
+        aes-xts        256b      3730.1 MiB/s      3741.9 MiB/s
+    serpent-xts        512b       901.3 MiB/s       896.4 MiB/s
+        aes-xts        512b      3405.4 MiB/s      3412.3 MiB/s
+"""
+
+
+def _handlers(monkeypatch: pytest.MonkeyPatch, count: int, pbkdf_memory: int | None) -> list[Luks2]:
+	monkeypatch.setattr(Luks2, 'pbkdf_memory', lambda self: pbkdf_memory)
+	return [Luks2(Path(f'/dev/vd{chr(ord("a") + i)}2'), mapper_name=f'root{i}') for i in range(count)]
+
+
+def test_parallel_unlocks_bounded_by_memory(monkeypatch: pytest.MonkeyPatch) -> None:
+	monkeypatch.setattr('os.cpu_count', lambda: 16)
+	monkeypatch.setattr(SysInfo, 'mem_available', staticmethod(lambda: 4 * GIB))
+
+	# half of the available memory is spent on key derivation
+	assert max_parallel_unlocks(_handlers(monkeypatch, 4, GIB)) == 2
+	assert max_parallel_unlocks(_handlers(monkeypatch, 4, 256 * 1024)) == 4
+	# an unreadable header counts with cryptsetup's default memory cost
+	assert max_parallel_unlocks(_handlers(monkeypatch, 4, None)) == 2
+	# pbkdf2 keyslots don't need any memory
+	assert max_parallel_unlocks(_handlers(monkeypatch, 4, 0)) == 4
+
+
+def test_parallel_unlocks_at_least_one(monkeypatch: pytest.MonkeyPatch) -> None:
+	monkeypatch.setattr('os.cpu_count', lambda: 16)
+	monkeypatch.setattr(SysInfo, 'mem_available', staticmethod(lambda: GIB))
+
+	assert max_parallel_unlocks(_handlers(monkeypatch, 3, 2 * GIB)) == 1
+
+
+def test_calibrate_luks_parameters(monkeypatch: pytest.MonkeyPatch) -> None:
+	monkeypatch.setattr(luks, 'cryptsetup_benchmark', lambda: CryptsetupBenchmark.parse(BENCHMARK))
+	monkeypatch.setattr(SysInfo, 'cpu_flags', staticmethod(lambda: ['sse2', 'aes', 'vaes']))
+	monkeypatch.setattr(SysInfo, 'mem_total', staticmethod(lambda: 2 * GIB))
+
+	parameters = calibrate_luks_parameters()
+
+	# the shorter key isn't fast enough to give up on AES-256
+	assert (parameters.cipher, parameters.key_size) == ('aes-xts-plain64', 512)
+	assert (parameters.pbkdf_memory, parameters.pbkdf_parallel) == (GIB // 2, 4)
+
+
+@pytest.mark.parametrize(
+	('device_class', 'discard', 'expected'),
+	[
+		(DeviceClass.Nvme, True, LuksPerformanceFlags(True, True)),
+		(DeviceClass.Ssd, True, LuksPerformanceFlags(True, False)),
+		(DeviceClass.Ssd, False, LuksPerformanceFlags(False, False)),
+		(DeviceClass.Hdd, True, LuksPerformanceFlags(False, False)),
+	],
+)
+def test_auto_performance_flags(monkeypatch: pytest.MonkeyPatch, device_class: DeviceClass, discard: bool, expected: LuksPerformanceFlags) -> None:
+	monkeypatch.setattr(luks, 'storage_info', lambda _: StorageInfo(device_class, discard))
+
+	flags = LuksPerformanceFlags.resolve(LuksPerformance.Auto, Path('/dev/vda2'))
+
+	assert flags == expected
+	assert LuksPerformanceFlags.resolve(LuksPerformance.Off, Path('/dev/vda2')) == LuksPerformanceFlags()
+
+
+def test_add_key_file_reads_passphrase_from_stdin(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+	commands: list[tuple[list[str], bytes | None]] = []
+
+	def run(cmd: list[str], input_data: bytes | None = None) -> CompletedProcess[bytes]:
+		commands.append((cmd, input_data))
+		return CompletedProcess(cmd, 0, stdout=b'Key slot 1 created.\nCommand successful.\n')
+
+	monkeypatch.setattr(luks, 'run', run)
+
+	handler = Luks2(Path('/dev/vda2'), mapper_name='root', password=Password(plaintext='secret'))
+	key_file = tmp_path / 'home.key'
+
+	assert handler.add_key_file(key_file) == 1
+
+	[(cmd, input_data)] = commands
+	assert input_data == b'secret'
+	assert '--key-file=-' in cmd and cmd[-2:] == ['/dev/vda2', str(key_file)]
@@ -0,0 +1,120 @@
+import json
+import logging
+import sys
+import types
+from pathlib import Path
+from typing import override
+
+import pytest
+
+from nixinstall.lib import output
+from nixinstall.lib.output import EventLog, Journald, Logger, LogSink, log, log_sinks, set_log_sinks
+
+
+class _Recorder(LogSink):
+	def __init__(self) -> None:
+		self.records: list[tuple[int, str]] = []
+
+	@override
+	def emit(self, level: int, content: str) -> None:
+		self.records.append((level, content))
+
+
+def _fake_journal(monkeypatch: pytest.MonkeyPatch) -> list[logging.LogRecord]:
+	records: list[logging.LogRecord] = []
+
+	class JournalHandler(logging.Handler):
+		def __init__(self, **kwargs: str) -> None:
+			super().__init__()
+
+		@override
+		def emit(self, record: logging.LogRecord) -> None:
+			records.append(record)
+
+	journal = types.ModuleType('systemd.journal')
+	journal.JournalHandler = JournalHandler  # type: ignore[attr-defined]
+	systemd = types.ModuleType('systemd')
+	systemd.journal = journal  # type: ignore[attr-defined]
+
+	monkeypatch.setitem(sys.modules, 'systemd', systemd)
+	monkeypatch.setitem(sys.modules, 'systemd.journal', journal)
+	return records
+
+
+def test_journald_sets_up_handler_once(monkeypatch: pytest.MonkeyPatch) -> None:
+	records = _fake_journal(monkeypatch)
+	sink = Journald()
+
+	for i in range(3):
+		sink.emit(logging.INFO, f'message {i}')
+
+	assert [r.getMessage() for r in records] == ['message 0', 'message 1', 'message 2']
+	assert len(logging.getLogger('nixinstall.journald').handlers) == 1
+
+
+def test_journald_caches_missing_module(monkeypatch: pytest.MonkeyPatch) -> None:
+	monkeypatch.setitem(sys.modules, 'systemd', None)
+	sink = Journald()
+	sink.emit(logging.INFO, 'dropped')
+	assert not sink.available
+
+	# becoming importable later does not trigger a second import attempt
+	_fake_journal(monkeypatch)
+	assert not sink.available
+
+
+def test_log_fans_out_to_selected_sinks() -> None:
+	previous = list(log_sinks)
+	recorder = _Recorder()
+
+	try:
+		set_log_sinks(recorder)
+		log('hello', 'world', level=logging.DEBUG)
+	finally:
+		set_log_sinks(*previous)
+
+	assert recorder.records == [(logging.DEBUG, 'hello world')]
+
+
+def test_logger_creates_directory_for_any_file(tmp_path: Path) -> None:
+	files = Logger(tmp_path / 'logs')
+
+	# the first write isn't to install.log
+	files.write('cmd_history.txt', 'ls\n')
+	files.flush()
+
+	assert (tmp_path / 'logs' / 'cmd_history.txt').read_text() == 'ls\n'
+	files.close()
+
+
+def test_event_log_spans(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+	monkeypatch.setattr(output, 'logger', Logger(tmp_path))
+	name = 'test_events.jsonl'
+	events = EventLog(name)
+
+	with events.span('install', target='/mnt'):
+		with events.span('format', device='/dev/vda1') as attrs:
+			attrs['uuid'] = 'abcd'
+
+		with pytest.raises(ValueError):
+			with events.span('broken'):
+				raise ValueError
+
+	records = [json.loads(line) for line in (tmp_path / name).read_text().splitlines()]
+
+	assert [(r['type'], r['name']) for r in records] == [
+		('begin', 'install'),
+		('begin', 'format'),
+		('end', 'format'),
+		('begin', 'broken'),
+		('end', 'broken'),
+		('end', 'install'),
+	]
+	install, format_begin, format_end = records[0], records[1], records[2]
+	assert install['parent'] is None and install['attrs'] == {'target': '/mnt'}
+	assert format_begin['parent'] == install['id'] and format_begin['depth'] == 1
+	assert format_end['attrs'] == {'uuid': 'abcd'} and format_end['ts'] >= format_begin['ts']
+	assert records[4]['status'] == 'error'
+
+	assert [(t.phase, t.status) for t in events.timings()] == [('install', 'ok'), ('  format', 'ok'), ('  broken', 'error')]
+	assert 'Phase' in events.summary()
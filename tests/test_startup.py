@@ -0,0 +1,52 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# importing nixinstall must stay cheap, --help and --version run straight after it
+IMPORT_BUDGET_US = 100_000
+
+DEFERRED_MODULES = [
+	'cryptography',
+	'nixinstall.lib.disk.device_handler',
+	'nixinstall.lib.models',
+	'nixinstall.tui.curses_menu',
+	'parted',
+	'pydantic',
+	'urllib.request',
+]
+
+
+def _import_times() -> dict[str, int]:
+	"""
+	Cumulative import time in microseconds of each module imported by ``import nixinstall``
+	"""
+	result = subprocess.run(
+		[sys.executable, '-X', 'importtime', '-c', 'import nixinstall'],
+		cwd=Path(__file__).parents[1],
+		capture_output=True,
+		text=True,
+		check=True,
+	)
+
+	times = {}
+
+	# import time: self [us] | cumulative | imported package
+	for line in result.stderr.splitlines():
+		_, cumulative, name = line.removeprefix('import time:').split('|')
+		if cumulative.strip().isdigit():
+			times[name.strip()] = int(cumulative)
+
+	return times
+
+
+def test_import_defers_heavy_modules() -> None:
+	imported = _import_times()
+
+	for module in DEFERRED_MODULES:
+		assert not [name for name in imported if name == module or name.startswith(f'{module}.')], f'{module} is imported eagerly'
+
+
+def test_import_time_budget() -> None:
+	# the best of a few runs, to not fail on a busy machine
+	best = min(_import_times()['nixinstall'] for _ in range(3))
+	assert best < IMPORT_BUDGET_US, f'import nixinstall took {best / 1000:.1f}ms'